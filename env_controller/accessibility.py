@@ -0,0 +1,81 @@
+"""
+A local copy of the server's accessibility tree, kept current with `/accessibility/changes`.
+
+Instead of downloading the whole tree after every step, the cache asks for the changes since its
+version and applies them, so an update costs about as much as what changed on screen:
+
+    cache = AccessibilityTreeCache(controller, app="gedit")
+    tree = cache.update()  # first call: full snapshot; afterwards only the changes
+
+The tree has the shape of PythonController.get_accessibility_tree()["tree"], plus an "id" per node
+that stays the same for as long as the node exists on the server.
+"""
+from typing import Any, Dict, Optional
+
+from .controller import PythonController
+
+
+class AccessibilityTreeCache:
+    def __init__(self, controller: PythonController, **options):
+        """`options` are the get_accessibility_tree walk options (max_depth, showing_only, skip_roles, app, ...)."""
+        self.controller = controller
+        self.options = options
+        self.epoch: Optional[str] = None
+        self.version: Optional[int] = None
+        self.root: Optional[int] = None
+        self.records: Dict[int, Dict[str, Any]] = {}  # id -> {"id", "parent", "children": [ids], ...}
+        self.last_update: Dict[str, Any] = {}
+        self._tree: Optional[Dict[str, Any]] = None
+
+    def reset(self) -> None:
+        """Forgets the local copy; the next update downloads a full snapshot."""
+        self.epoch = self.version = self.root = None
+        self.records = {}
+        self._tree = None
+
+    def apply(self, reply: Dict[str, Any]) -> None:
+        """Applies one `/accessibility/changes` reply."""
+        if reply["full"]:
+            self.records = {record["id"]: record for record in reply["nodes"]}
+            self.root = reply["root"]
+            self._tree = None
+        elif reply["changes"]:
+            for change in reply["changes"]:
+                if change["op"] == "set":
+                    self.records[change["node"]["id"]] = change["node"]
+                else:
+                    self.records.pop(change["id"], None)
+            self._tree = None
+        self.epoch = reply["epoch"]
+        self.version = reply["version"]
+        self.last_update = {
+            "full": reply["full"],
+            "complete": reply.get("complete", True),
+            "changes": len(reply["nodes"] if reply["full"] else reply["changes"]),
+            "elapsed": reply.get("elapsed"),
+        }
+
+    def update(self) -> Optional[Dict[str, Any]]:
+        """
+        Brings the copy up to date and returns the tree, or None when the server could not be asked.
+        While the server is still building its mirror within the time budget, last_update["complete"] is False.
+        """
+        reply = self.controller.get_accessibility_changes(self.version, self.epoch, **self.options)
+        if reply is None:
+            return None
+        self.apply(reply)
+        return self.tree()
+
+    def tree(self) -> Optional[Dict[str, Any]]:
+        """The cached tree as nested dicts; rebuilt only after changes."""
+        if self._tree is None and self.root in self.records:
+            self._tree = self._nest(self.root)
+        return self._tree
+
+    def _nest(self, node_id: int) -> Dict[str, Any]:
+        record = self.records[node_id]
+        node = {key: value for key, value in record.items() if key not in ("parent", "children")}
+        children = [self._nest(child) for child in record["children"] if child in self.records]
+        if children:
+            node["children"] = children
+        return node
@@ -0,0 +1,310 @@
+"""
+asyncio counterpart of PythonController, for orchestrators that drive many servers from one event loop.
+
+Requires the `aiohttp` package. Controllers can share one `aiohttp.ClientSession` (and so one
+connection pool) by passing `session=`; see `create_session()`.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import aiohttp
+except ImportError as e:
+    raise ImportError("AsyncPythonController requires aiohttp: pip install aiohttp") from e
+
+from .controller import PythonController
+from .protocol import (
+    action_response,
+    action_to_commands,
+    batch_delays,
+    batch_entry,
+    batch_result,
+    batch_timeout,
+    command_failure,
+    is_noop_action,
+    missing_result,
+)
+
+logger = logging.getLogger("desktopenv.asyncpycontroller")
+
+
+def create_session(limit: int = 100, limit_per_host: int = 10) -> aiohttp.ClientSession:
+    """
+    A ClientSession to share between controllers: at most `limit` connections in total and
+    `limit_per_host` to any one server. Must be created inside a running event loop.
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    return aiohttp.ClientSession(connector=connector)
+
+
+class AsyncPythonController:
+    def __init__(
+        self,
+        vm_ip: str,
+        server_port: int,
+        pkgs_prefix: str = "import pyautogui; import time; pyautogui.FAILSAFE = False; {command}",
+        use_native_actions: bool = True,
+        session: Optional[aiohttp.ClientSession] = None,
+        pool_size: int = 10,
+        screenshot_timeout: float = 10,
+        command_timeout: float = 90,
+        action_timeout: float = 90,
+        retry_times: int = 3,
+        retry_interval: float = 0.5,
+        max_retry_interval: float = 5,
+    ):
+        self.vm_ip = vm_ip
+        self.http_server = f"http://{vm_ip}:{server_port}"
+        self.pkgs_prefix = pkgs_prefix
+        self.use_native_actions = use_native_actions
+        self.screenshot_timeout = screenshot_timeout
+        self.command_timeout = command_timeout
+        self.action_timeout = action_timeout
+        # Retry n waits about retry_interval * 2**n (with jitter), capped at max_retry_interval.
+        self.retry_times = retry_times
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+        # A session passed in is shared and left open by close(); otherwise we own one.
+        self.pool_size = pool_size
+        self._session = session
+        self._owns_session = session is None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled HTTP session, created on first use (and again after `close()`)."""
+        if self._session is None or self._session.closed:
+            self._session = create_session(limit=self.pool_size, limit_per_host=self.pool_size)
+            self._owns_session = True
+        return self._session
+
+    async def close(self) -> None:
+        """Closes the session if this controller created it. A shared session is left to its owner."""
+        session, self._session = self._session, None
+        if session is not None and self._owns_session:
+            await session.close()
+
+    async def __aenter__(self) -> "AsyncPythonController":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb) -> None:
+        await self.close()
+
+    async def _backoff(self, attempt_idx: int) -> None:
+        """Sleeps before retry `attempt_idx` without blocking the event loop."""
+        delay = min(self.max_retry_interval, self.retry_interval * 2 ** attempt_idx)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def _request_screenshot(
+        self,
+        params: Dict[str, Any],
+        timeout: float,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """GETs `/screenshot` with retries. Returns (payload, headers), or None when every attempt failed."""
+        for attempt_idx in range(self.retry_times):
+            try:
+                async with self.session.get(
+                    self.http_server + "/screenshot",
+                    params=params,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    data = await response.read()
+                    if response.status == 200:
+                        content_type = response.headers.get("Content-Type", "")
+                        if PythonController._is_valid_image_response(content_type, data):
+                            logger.info("Got screenshot successfully")
+                            return data, response.headers
+                        logger.error(
+                            "Invalid screenshot payload (attempt %d/%d).",
+                            attempt_idx + 1,
+                            self.retry_times,
+                        )
+                    else:
+                        logger.error("Failed to get screenshot. Status code: %d", response.status)
+                    logger.info("Retrying to get screenshot.")
+            except Exception as e:
+                logger.error("An error occurred while trying to get the screenshot: %s", e)
+                logger.info("Retrying to get screenshot.")
+            if attempt_idx + 1 < self.retry_times:
+                await self._backoff(attempt_idx)
+
+        logger.error("Failed to get screenshot.")
+        return None
+
+    async def get_screenshot(
+        self,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[bytes]:
+        """Same as PythonController.get_screenshot. None -> no screenshot or unexpected error."""
+        if timeout is None:
+            timeout = self.screenshot_timeout
+        params = PythonController._screenshot_params(
+            width, height, scale, format, quality, grayscale, bbox, window
+        )
+        result = await self._request_screenshot(params, timeout)
+        return result[0] if result is not None else None
+
+    async def get_screenshot_array(
+        self,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        """Same as PythonController.get_screenshot_array without delta mode. Requires numpy and Pillow."""
+        from . import codecs
+
+        if timeout is None:
+            timeout = self.screenshot_timeout
+        params = PythonController._screenshot_params(
+            width, height, scale, format, quality, grayscale, bbox, window
+        )
+        headers = None if format else {"Accept": codecs.accept_header()}
+        result = await self._request_screenshot(params, timeout, headers=headers)
+        if result is None:
+            return None
+        return codecs.decode_response(*result)
+
+    async def _post_json(self, endpoint: str, payload, timeout: float) -> Optional[Tuple[int, str]]:
+        """
+        POSTs a JSON payload with the same retry rules as PythonController._post_json.
+        Returns (status code, body text), or None when the server could not be reached.
+        """
+        data = json.dumps(payload)
+        for attempt_idx in range(self.retry_times):
+            try:
+                async with self.session.post(
+                    self.http_server + endpoint,
+                    headers={"Content-Type": "application/json"},
+                    data=data,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    text = await response.text()
+                    if response.status <= 500:
+                        return response.status, text
+                    logger.error("Failed to POST %s. Status code: %d", endpoint, response.status)
+                    logger.info("Retrying to POST %s.", endpoint)
+            except asyncio.TimeoutError:
+                logger.error("Timed out waiting for %s.", endpoint)
+                break
+            except Exception as e:
+                logger.error("An error occurred while trying to POST %s: %s", endpoint, e)
+                logger.info("Retrying to POST %s.", endpoint)
+            if attempt_idx + 1 < self.retry_times:
+                await self._backoff(attempt_idx)
+        return None
+
+    async def execute_python_command(
+        self, command: str, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Executes a python command on the server, like PythonController.execute_python_command."""
+        if timeout is None:
+            timeout = self.command_timeout
+        command_list = ["python", "-c", self.pkgs_prefix.format(command=command)]
+        response = await self._post_json(
+            "/execute", {"command": command_list, "shell": False}, timeout
+        )
+        if response is not None and response[0] == 200:
+            logger.info("Command executed successfully: %s", response[1])
+            return json.loads(response[1])
+        logger.error("Failed to execute command.")
+        return None
+
+    async def execute_action(self, action, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Executes an action on the server computer, like PythonController.execute_action.
+        Returns the structured result from the server, or None for no-op actions / unreachable servers.
+        """
+        if is_noop_action(action):
+            return None
+
+        if not self.use_native_actions:
+            for command in action_to_commands(action):
+                result = await self.execute_python_command(command, timeout=timeout)
+                if result is None:
+                    return None
+                failure = command_failure(action, result)
+                if failure is not None:
+                    return failure
+            return {"status": "success"}
+
+        if timeout is None:
+            timeout = self.action_timeout
+        response = await self._post_json("/action", action, timeout=timeout)
+        if response is None:
+            logger.error("Failed to execute action.")
+            return None
+        result = action_response(*response, f"Invalid action: {action}")
+        if result is None:
+            logger.warning(
+                "Server has no /action endpoint, falling back to executing python commands."
+            )
+            self.use_native_actions = False
+            return await self.execute_action(action, timeout=timeout)
+        return result
+
+    async def execute_actions(
+        self,
+        actions: List[Any],
+        delay=0.0,
+        stop_on_error: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Executes an ordered list of actions in one round-trip, like PythonController.execute_actions."""
+        if timeout is None:
+            timeout = batch_timeout(self.action_timeout, actions, delay)
+
+        if self.use_native_actions:
+            payload = {"actions": actions, "delay": delay, "stop_on_error": stop_on_error}
+            response = await self._post_json("/actions/batch", payload, timeout=timeout)
+            if response is None:
+                logger.error("Failed to execute actions.")
+                return None
+            result = action_response(*response, "Invalid batch of actions")
+            if result is not None:
+                return result
+            logger.warning(
+                "Server has no /actions/batch endpoint, executing the actions one by one."
+            )
+
+        return await self._execute_actions_one_by_one(actions, delay, stop_on_error)
+
+    async def _execute_actions_one_by_one(self, actions, delay, stop_on_error) -> Dict[str, Any]:
+        """Client-side equivalent of `/actions/batch` for servers that do not have it."""
+        delays = batch_delays(actions, delay)
+        results = []
+        failed = False
+        start = time.perf_counter()
+        for index, action in enumerate(actions):
+            if failed and stop_on_error:
+                results.append({"index": index, "status": "skipped"})
+                continue
+            if delays[index]:
+                await asyncio.sleep(delays[index])
+            action_start = time.perf_counter()
+            try:
+                result = await self.execute_action(action) or missing_result(action)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            failed = failed or result.get("status") != "success"
+            results.append(batch_entry(result, index, action_start, start))
+        return batch_result(results, start)
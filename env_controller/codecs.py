@@ -0,0 +1,166 @@
+"""
+Decoding of the screenshot formats served by `/screenshot` into NumPy arrays.
+
+Needs numpy and Pillow, so PythonController only imports it when frames are decoded.
+lz4, zstandard and qoi are optional and only advertised to the server when they are installed.
+"""
+import io
+import json
+import struct
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import qoi
+except ImportError:
+    qoi = None
+
+# mimetype -> format name, as in server/encoding.py
+MIMETYPE_FORMATS = {
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/webp": "webp",
+    "image/qoi": "qoi",
+    "application/x-raw-rgb": "raw",
+    "application/x-raw-rgb-lz4": "raw-lz4",
+    "application/x-raw-rgb-zstd": "raw-zstd",
+}
+
+LOSSLESS_FORMATS = ["raw-lz4", "raw-zstd", "qoi", "png"]
+
+
+def decodable_formats():
+    """The lossless formats this client can decode, fastest first."""
+    formats = []
+    for fmt in LOSSLESS_FORMATS:
+        if fmt == "raw-lz4" and lz4 is None:
+            continue
+        if fmt == "raw-zstd" and zstandard is None:
+            continue
+        if fmt == "qoi" and qoi is None:
+            Image.init()
+            if "QOI" not in Image.OPEN:
+                continue
+        formats.append(fmt)
+    return formats
+
+
+def accept_header(formats=None) -> str:
+    """An Accept header preferring `formats` (default: decodable_formats()) in order."""
+    mimetypes = {fmt: mimetype for mimetype, fmt in MIMETYPE_FORMATS.items()}
+    formats = formats or decodable_formats()
+    parts = []
+    for index, fmt in enumerate(formats):
+        quality = round(1.0 - index * 0.1, 1)
+        parts.append(mimetypes[fmt] if index == 0 else f"{mimetypes[fmt]};q={quality}")
+    return ", ".join(parts)
+
+
+def format_from_content_type(content_type: str) -> Optional[str]:
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    return MIMETYPE_FORMATS.get(mimetype)
+
+
+def decode_raw(data: bytes, fmt: str, width: int, height: int, mode: str = "RGB"):
+    """Decodes a (possibly compressed) raw frame into an HxWx3 (RGB) or HxW (L) uint8 array."""
+    if fmt == "raw-lz4":
+        if lz4 is None:
+            raise RuntimeError("lz4 is required to decode raw-lz4 frames")
+        data = lz4.frame.decompress(data)
+    elif fmt == "raw-zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to decode raw-zstd frames")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    shape = (height, width) if mode == "L" else (height, width, 3)
+    return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+
+def decode_image(
+    data: bytes,
+    fmt: str,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    mode: str = "RGB",
+):
+    """
+    Decodes a frame of any supported format into an HxWx3 (RGB), HxWx4 (RGBA) or HxW (L) uint8 array.
+    width / height / mode are required for the raw formats only.
+    """
+    if fmt.startswith("raw"):
+        if width is None or height is None:
+            raise ValueError("Raw frames need their width and height to be decoded")
+        return decode_raw(data, fmt, width, height, mode)
+    if fmt == "qoi" and qoi is not None:
+        return qoi.decode(data)
+
+    with Image.open(io.BytesIO(data)) as image:
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGB")
+        return np.asarray(image)
+
+
+def decode_response(data: bytes, headers: Mapping[str, str]):
+    """Decodes a `/screenshot` response body using its Content-Type and X-Frame-* headers."""
+    fmt = format_from_content_type(headers.get("Content-Type", ""))
+    if fmt is None:
+        raise ValueError(f"Unsupported screenshot content type: {headers.get('Content-Type')!r}")
+    width = headers.get("X-Frame-Width")
+    height = headers.get("X-Frame-Height")
+    return decode_image(
+        data,
+        fmt,
+        int(width) if width else None,
+        int(height) if height else None,
+        headers.get("X-Frame-Mode", "RGB"),
+    )
+
+
+ENVELOPE_MIMETYPE = "application/x-screenshot-envelope"
+
+
+def unpack_envelope(data: bytes) -> Tuple[Dict[str, Any], memoryview]:
+    """Splits a server envelope (4-byte length, JSON metadata, payload) into (meta, payload)."""
+    (length,) = struct.unpack(">I", data[:4])
+    meta = json.loads(bytes(data[4:4 + length]).decode("utf-8"))
+    return meta, memoryview(data)[4 + length:]
+
+
+def apply_delta(previous, meta: Dict[str, Any], payload):
+    """
+    Rebuilds a full frame from a delta screenshot: the keyframe itself, or `previous` with the changed
+    tiles pasted over it. `previous` is left untouched.
+    """
+    shape = (meta["height"], meta["width"]) if meta["mode"] == "L" else (meta["height"], meta["width"], 3)
+    if meta["keyframe"]:
+        frame = np.empty(shape, dtype=np.uint8)
+    else:
+        if previous is None or previous.shape != shape:
+            raise ValueError("Delta frame does not match the previous frame")
+        frame = previous.copy()
+
+    fmt = meta["format"]
+    for tile in meta["tiles"]:
+        x, y, width, height = tile["x"], tile["y"], tile["width"], tile["height"]
+        blob = bytes(payload[tile["offset"]:tile["offset"] + tile["length"]])
+        pixels = decode_image(blob, fmt, width, height, meta["mode"])
+        if pixels.ndim == 3 and pixels.shape[2] == 4:
+            pixels = pixels[:, :, :3]
+        if meta["mode"] == "L" and pixels.ndim == 3:
+            # QOI and WebP have no grayscale mode, so grayscale tiles come back as RGB (R = G = B).
+            pixels = np.asarray(Image.fromarray(pixels).convert("L"))
+        elif meta["mode"] != "L" and pixels.ndim == 2:
+            pixels = np.repeat(pixels[:, :, None], 3, axis=2)
+        frame[y:y + height, x:x + width] = pixels
+    return frame
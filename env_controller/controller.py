@@ -4,13 +4,25 @@ from osworld
 
 import json
 import logging
-import random
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import threading
 import time
 import traceback
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 
-from .actions import KEYBOARD_KEYS
+from .protocol import (
+    action_response,
+    action_to_commands,
+    batch_delays,
+    batch_entry,
+    batch_result,
+    batch_timeout,
+    command_failure,
+    is_noop_action,
+    missing_result,
+)
 
 logger = logging.getLogger("desktopenv.pycontroller")
 
@@ -21,17 +33,76 @@ class PythonController:
         vm_ip: str,
         server_port: int,
         pkgs_prefix: str = "import pyautogui; import time; pyautogui.FAILSAFE = False; {command}",
+        use_native_actions: bool = True,
+        pool_size: int = 10,
+        screenshot_timeout: float = 10,
+        command_timeout: float = 90,
+        action_timeout: float = 90,
+        retry_times: int = 3,
+        retry_interval: float = 5,
     ):
         self.vm_ip = vm_ip
         self.http_server = f"http://{vm_ip}:{server_port}"
         self.pkgs_prefix = pkgs_prefix  # fixme: this is a hacky way to execute python commands. fix it and combine it with installation of packages
-        self.retry_times = 3
-        self.retry_interval = 5
+        self.retry_times = retry_times
+        self.retry_interval = retry_interval
+        self.use_native_actions = use_native_actions  # False -> legacy `python -c` per action
+        # Default per-call timeouts (seconds); every request method also takes a `timeout` override.
+        self.screenshot_timeout = screenshot_timeout
+        self.command_timeout = command_timeout
+        self.action_timeout = action_timeout
+
+        # One keep-alive session shared by every thread using this controller. The urllib3 pool
+        # behind it is thread-safe; the lock only guards creating and closing the session.
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+
+        # Delta screenshots: the server keeps our last frame under this id, we keep the same frame here.
+        self._delta_client_id = uuid.uuid4().hex
+        self._delta_frame = None
+        self._delta_frame_id = 0
+        self._delta_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """The pooled HTTP session, created on first use (and again after `close()`)."""
+        session = self._session
+        if session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+                session = self._session
+        return session
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        # pool_block: wait for a free connection instead of opening throwaway ones past the pool size
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, pool_block=True
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self) -> None:
+        """Closes the pooled connections. The controller can still be used afterwards; it reconnects lazily."""
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def __enter__(self) -> "PythonController":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
 
     @staticmethod
     def _is_valid_image_response(content_type: str, data: Optional[bytes]) -> bool:
-        """Quick validation for PNG/JPEG payload using magic bytes; Content-Type is advisory.
-        Returns True only when bytes look like a real PNG or JPEG.
+        """Quick validation for PNG/JPEG/WebP/QOI payload using magic bytes; Content-Type is advisory.
+        Returns True only when bytes look like a real PNG, JPEG, WebP or QOI, or when the server
+        marks them as a raw frame (which has no magic bytes).
         """
         if not isinstance(data, (bytes, bytearray)) or not data:
             return False
@@ -41,29 +112,73 @@ class PythonController:
         # JPEG magic
         if len(data) >= 3 and data[:3] == b"\xff\xd8\xff":
             return True
+        # WebP magic
+        if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return True
+        # QOI magic
+        if len(data) >= 4 and data[:4] == b"qoif":
+            return True
+        # Raw frames and envelopes (delta screenshots) have no magic bytes
+        if content_type and (
+            content_type.startswith("application/x-raw-rgb")
+            or content_type.startswith("application/x-screenshot-envelope")
+        ):
+            return True
         # If server explicitly marks as image, accept as a weak fallback (some environments strip magic)
         if content_type and (
             "image/png" in content_type
             or "image/jpeg" in content_type
             or "image/jpg" in content_type
+            or "image/webp" in content_type
         ):
             return True
         return False
 
-    def get_screenshot(self) -> Optional[bytes]:
+    @staticmethod
+    def _screenshot_params(
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Query parameters understood by the server's `/screenshot`."""
+        params = {
+            "width": width,
+            "height": height,
+            "scale": scale,
+            "format": format,
+            "quality": quality,
+            "grayscale": "1" if grayscale else None,
+            "bbox": ",".join(str(int(v)) for v in bbox) if bbox else None,
+            "window": window,
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    def _request_screenshot(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        timeout: float,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Optional[requests.Response]:
         """
-        Gets a screenshot from the server. With the cursor. None -> no screenshot or unexpected error.
+        GETs a screenshot-like endpoint with retries. Returns the response once its payload looks like
+        an image, or None when every attempt failed.
         """
-
         for attempt_idx in range(self.retry_times):
             try:
-                response = requests.get(self.http_server + "/screenshot", timeout=10)
+                response = self.session.get(
+                    self.http_server + endpoint, params=params, headers=headers, timeout=timeout
+                )
                 if response.status_code == 200:
                     content_type = response.headers.get("Content-Type", "")
-                    content = response.content
-                    if self._is_valid_image_response(content_type, content):
+                    if self._is_valid_image_response(content_type, response.content):
                         logger.info("Got screenshot successfully")
-                        return content
+                        return response
                     else:
                         logger.error(
                             "Invalid screenshot payload (attempt %d/%d).",
@@ -87,22 +202,370 @@ class PythonController:
         logger.error("Failed to get screenshot.")
         return None
 
-    def execute_python_command(self, command: str) -> None:
+    def get_screenshot(
+        self,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[bytes]:
+        """
+        Gets a screenshot from the server. With the cursor. None -> no screenshot or unexpected error.
+        width/height/scale downscale on the server (keeping the aspect ratio), format is one of
+        png/jpeg/webp/qoi/raw/raw-lz4/raw-zstd, quality applies to the lossy formats.
+        bbox = (left, top, right, bottom) or a native window id restrict the capture to that area.
+        Returns the encoded bytes as sent by the server; see get_screenshot_array for decoded pixels.
+        """
+        if timeout is None:
+            timeout = self.screenshot_timeout
+        params = self._screenshot_params(
+            width, height, scale, format, quality, grayscale, bbox, window
+        )
+        response = self._request_screenshot("/screenshot", params, timeout)
+        return response.content if response is not None else None
+
+    def wait_for_stable(
+        self,
+        timeout: float = 10,
+        threshold: float = 0.001,
+        quiet_ms: int = 500,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Waits until the screen (or the bbox/window area) has stopped changing, instead of sleeping a fixed time.
+        The screen counts as stable once at most `threshold` of its pixels changed between frames for
+        `quiet_ms`. Returns {"stable": False when `timeout` seconds ran out first, "elapsed": seconds waited,
+        "screenshot": the settled screenshot bytes (same options as get_screenshot)}, or None on failure.
+        """
+        params = self._screenshot_params(
+            width, height, scale, format, quality, grayscale, bbox, window
+        )
+        params.update({"timeout": timeout, "threshold": threshold, "quiet_ms": quiet_ms})
+        response = self._request_screenshot(
+            "/screenshot/stable", params, timeout + self.screenshot_timeout
+        )
+        if response is None:
+            return None
+        return {
+            "stable": response.headers.get("X-Stable") == "1",
+            "elapsed": float(response.headers.get("X-Stable-Elapsed", 0)),
+            "screenshot": response.content,
+        }
+
+    def get_screenshot_array(
+        self,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        delta: bool = False,
+        timeout: Optional[float] = None,
+    ):
+        """
+        Gets a screenshot decoded into a NumPy array (HxWx3 RGB, or HxW when grayscale).
+        Without an explicit format, the fastest lossless codec both sides support is negotiated
+        through the Accept header. Requires numpy and Pillow on the client.
+        With delta=True only the tiles changed since this controller's previous delta frame are
+        transferred, and the full frame is rebuilt locally; that frame is read-only because the next
+        delta is applied on top of it.
+        """
+        from . import codecs
+
+        if timeout is None:
+            timeout = self.screenshot_timeout
+        params = self._screenshot_params(
+            width, height, scale, format, quality, grayscale, bbox, window
+        )
+        headers = None if format else {"Accept": codecs.accept_header()}
+        if not delta:
+            response = self._request_screenshot("/screenshot", params, timeout, headers=headers)
+            if response is None:
+                return None
+            return codecs.decode_response(response.content, response.headers)
+
+        # Requests are serialized so that the frame ids we send always match the frame we hold.
+        with self._delta_lock:
+            params["since"] = self._delta_frame_id
+            params["client"] = self._delta_client_id
+            response = self._request_screenshot("/screenshot", params, timeout, headers=headers)
+            if response is None:
+                return None
+            meta, payload = codecs.unpack_envelope(response.content)
+            try:
+                frame = codecs.apply_delta(self._delta_frame, meta, payload)
+            except ValueError:
+                # Out of sync with the server: forget our frame so that the next request gets a keyframe.
+                self._delta_frame, self._delta_frame_id = None, 0
+                raise
+            frame.flags.writeable = False
+            self._delta_frame, self._delta_frame_id = frame, meta["frame_id"]
+            return frame
+
+    def stream_screenshots(
+        self,
+        fps: float = 5,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+        quality: Optional[int] = None,
+        grayscale: bool = False,
+        bbox: Optional[Tuple[int, int, int, int]] = None,
+        window: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Tuple[bytes, Dict[str, str]]]:
+        """
+        Consumes the server's live MJPEG stream (`/stream`), yielding (jpeg bytes, part headers)
+        as frames arrive. The part headers include X-Screen-Width / X-Screen-Height / X-Frame-Timestamp,
+        and X-Capture-Bbox when only a bbox or window is streamed.
+        Raises requests exceptions when the stream cannot be opened; ends when the server closes it.
+        Closing the generator closes the connection.
+        """
+        if timeout is None:
+            timeout = self.screenshot_timeout
+        params = self._screenshot_params(
+            width, height, scale, None, quality, grayscale, bbox, window
+        )
+        params["fps"] = fps
+        # connect timeout, then the longest acceptable gap between two frames
+        with self.session.get(
+            self.http_server + "/stream",
+            params=params,
+            stream=True,
+            timeout=(timeout, max(timeout, 5.0 / fps)),
+        ) as response:
+            response.raise_for_status()
+            stream = response.raw
+            while True:
+                line = stream.readline()
+                if not line:
+                    return
+                if not line.strip().startswith(b"--"):
+                    continue  # the CRLF that ends the previous part
+
+                headers = {}
+                while True:
+                    line = stream.readline()
+                    if not line:
+                        return
+                    line = line.strip()
+                    if not line:
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip()] = value.strip()
+
+                length = int(headers["Content-Length"])
+                data = stream.read(length)
+                if len(data) < length:
+                    return
+                yield data, headers
+
+    @staticmethod
+    def _accessibility_params(
+        max_depth, showing_only, skip_roles, app, max_children, max_nodes, budget_ms, text
+    ) -> Dict[str, Any]:
+        params = {
+            "max_depth": max_depth,
+            "showing_only": None if showing_only else 0,
+            "skip_roles": ",".join(skip_roles) if skip_roles else None,
+            "app": app,
+            "max_children": max_children,
+            "max_nodes": max_nodes,
+            "budget_ms": budget_ms,
+            "text": None if text else 0,
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    def get_accessibility_tree(
+        self,
+        max_depth: Optional[int] = None,
+        showing_only: bool = True,
+        skip_roles: Optional[List[str]] = None,
+        app: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        budget_ms: Optional[int] = None,
+        text: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Gets the server's accessibility (AT-SPI) tree, pruned while it is walked: max_depth, showing_only
+        (only what is on screen), skip_roles (role names whose subtrees are left out), app (one application
+        by name) and the max_children / max_nodes / budget_ms caps. text=False leaves out text contents.
+        Returns {"tree": nested {"role", "name", "states", "bbox": [x, y, w, h], "text", "value", "children"}
+        dicts, "nodes", "truncated": True when a cap cut the walk short, "elapsed"}, or None on failure.
+        """
+        params = self._accessibility_params(
+            max_depth, showing_only, skip_roles, app, max_children, max_nodes, budget_ms, text
+        )
+        if timeout is None:
+            timeout = self.screenshot_timeout + (budget_ms or 3000) / 1000.0
+        response = self._get_json("/accessibility", params, timeout)
+        if response is None:
+            return None
+        if response.status_code != 200:
+            logger.error("Failed to get accessibility tree: %s", response.text)
+            return None
+        return response.json()
+
+    def get_accessibility_changes(
+        self,
+        since: Optional[int] = None,
+        epoch: Optional[str] = None,
+        max_depth: Optional[int] = None,
+        showing_only: bool = True,
+        skip_roles: Optional[List[str]] = None,
+        app: Optional[str] = None,
+        max_children: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        text: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Gets the changes to the server's event-driven accessibility tree mirror since `version` of `epoch`,
+        or a full snapshot when since/epoch are None or no longer match (see `/accessibility/changes`).
+        The options are those of get_accessibility_tree. See env_controller.accessibility.AccessibilityTreeCache,
+        which applies the changes to a local copy. Returns None on failure.
+        """
+        params = self._accessibility_params(
+            max_depth, showing_only, skip_roles, app, max_children, max_nodes, None, text
+        )
+        if since is not None and epoch is not None:
+            params.update(since=since, epoch=epoch)
+        if timeout is None:
+            # Building the mirror walks the whole pruned tree once, without a time budget.
+            timeout = self.command_timeout
+        response = self._get_json("/accessibility/changes", params, timeout)
+        if response is None:
+            return None
+        if response.status_code != 200:
+            logger.error("Failed to get accessibility changes: %s", response.text)
+            return None
+        return response.json()
+
+    def find_elements(
+        self,
+        role: Optional[str] = None,
+        name: Optional[str] = None,
+        states: Optional[List[str]] = None,
+        path: Optional[str] = None,
+        limit: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Finds accessibility elements on the server (`/accessibility/query`) instead of downloading the tree.
+        role: role name (or several, comma-separated), name: case-insensitive substring, states: states the
+        element must all have, path: ancestor steps such as "application[gedit] > frame" (not necessarily
+        direct parents). Returns the matches in tree order, each with "id", "role", "name", "states",
+        "bbox", "center" (x, y to click) and "path", or None on failure.
+        """
+        params = {
+            "role": role,
+            "name": name,
+            "states": ",".join(states) if states else None,
+            "path": path,
+            "limit": limit,
+        }
+        params = {key: value for key, value in params.items() if value is not None}
+        if timeout is None:
+            # The first query builds the server's tree mirror.
+            timeout = self.command_timeout
+        response = self._get_json("/accessibility/query", params, timeout)
+        if response is None:
+            return None
+        if response.status_code != 200:
+            logger.error("Failed to query accessibility elements: %s", response.text)
+            return None
+        return response.json()["matches"]
+
+    def start_recording(self, name: str = "default", **options) -> Optional[Dict[str, Any]]:
+        """
+        Starts a named screen recording on the server (ffmpeg, segmented MPEG-TS). `options`: fps, codec,
+        preset, crf, width / height or scale, segment_seconds, threads, draw_mouse.
+        Returns the recording status, or None on failure.
+        """
+        response = self._post_json("/recording/start", dict(options, name=name), self.command_timeout)
+        if response is None or response.status_code != 200:
+            logger.error("Failed to start recording %s: %s", name, response.text if response is not None else "")
+            return None
+        return response.json()
+
+    def stop_recording(self, name: str = "default") -> Optional[Dict[str, Any]]:
+        """Stops a recording (its files stay on the server until downloaded and removed). Returns its status."""
+        response = self._post_json("/recording/stop", {"name": name}, self.command_timeout)
+        if response is None or response.status_code != 200:
+            logger.error("Failed to stop recording %s: %s", name, response.text if response is not None else "")
+            return None
+        return response.json()
+
+    def recording_status(self, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The status of one recording, or of all of them when `name` is None."""
+        response = self._get_json("/recording/status", {"name": name} if name else {}, self.command_timeout)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()
+
+    def download_recording(self, path: str, name: str = "default", start: int = 0, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Streams a recording from segment `start` on into the MPEG-TS file `path` (appending when start > 0),
+        without holding it in memory. Returns the number of segments written, or None on failure; while
+        the recording runs, call again with start + that number for the rest.
+        """
+        if timeout is None:
+            timeout = self.command_timeout
+        try:
+            with self.session.get(
+                self.http_server + "/recording/download",
+                params={"name": name, "start": start},
+                stream=True,
+                timeout=timeout,
+            ) as response:
+                if response.status_code != 200:
+                    logger.error("Failed to download recording %s: %s", name, response.text)
+                    return None
+                with open(path, "ab" if start else "wb") as file:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        file.write(chunk)
+                return int(response.headers.get("X-Recording-Segments", 0))
+        except Exception as e:
+            logger.error("An error occurred while downloading recording %s: %s", name, e)
+            return None
+
+    def execute_python_command(
+        self, command: str, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Executes a python command on the server.
         It can be used to execute the pyautogui commands, or... any other python command. who knows?
         """
+        if timeout is None:
+            timeout = self.command_timeout
         # command_list = ["python", "-c", self.pkgs_prefix.format(command=command)]
         command_list = ["python", "-c", self.pkgs_prefix.format(command=command)]
         payload = json.dumps({"command": command_list, "shell": False})
 
         for _ in range(self.retry_times):
             try:
-                response = requests.post(
+                response = self.session.post(
                     self.http_server + "/execute",
                     headers={"Content-Type": "application/json"},
                     data=payload,
-                    timeout=90,
+                    timeout=timeout,
                 )
                 if response.status_code == 200:
                     logger.info("Command executed successfully: %s", response.text)
@@ -125,203 +588,220 @@ class PythonController:
         logger.error("Failed to execute command.")
         return None
 
-    def execute_action(self, action):
+    def _post_json(self, endpoint: str, payload, timeout: float) -> Optional[requests.Response]:
         """
-        Executes an action on the server computer.
+        POSTs a JSON payload. Connection errors and gateway-style failures are retried; any other
+        response (including 4xx and our own 500s) is returned to the caller to interpret.
+        Returns None when the server could not be reached.
         """
-        # Handle string actions
-        if action in ["WAIT", "FAIL", "DONE"]:
-            return
-
-        # Handle dictionary actions
-        if type(action) == dict and action.get("action_type") in [
-            "WAIT",
-            "FAIL",
-            "DONE",
-        ]:
-            return
-
-        action_type = action["action_type"]
-        parameters = (
-            action["parameters"]
-            if "parameters" in action
-            else {param: action[param] for param in action if param != "action_type"}
-        )
-        move_mode = random.choice(
-            [
-                "pyautogui.easeInQuad",
-                "pyautogui.easeOutQuad",
-                "pyautogui.easeInOutQuad",
-                "pyautogui.easeInBounce",
-                "pyautogui.easeInElastic",
-            ]
-        )
-        duration = random.uniform(0.5, 1)
-
-        if action_type == "MOVE_TO":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.moveTo()")
-            elif "x" in parameters and "y" in parameters:
-                x = parameters["x"]
-                y = parameters["y"]
-                self.execute_python_command(
-                    f"pyautogui.moveTo({x}, {y}, {duration}, {move_mode})"
+        data = json.dumps(payload)
+        for _ in range(self.retry_times):
+            try:
+                response = self.session.post(
+                    self.http_server + endpoint,
+                    headers={"Content-Type": "application/json"},
+                    data=data,
+                    timeout=timeout,
                 )
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "CLICK":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.click()")
-            elif "button" in parameters and "x" in parameters and "y" in parameters:
-                button = parameters["button"]
-                x = parameters["x"]
-                y = parameters["y"]
-                if "num_clicks" in parameters:
-                    num_clicks = parameters["num_clicks"]
-                    self.execute_python_command(
-                        f"pyautogui.click(button='{button}', x={x}, y={y}, clicks={num_clicks})"
-                    )
-                else:
-                    self.execute_python_command(
-                        f"pyautogui.click(button='{button}', x={x}, y={y})"
-                    )
-            elif (
-                "button" in parameters
-                and "x" not in parameters
-                and "y" not in parameters
-            ):
-                button = parameters["button"]
-                if "num_clicks" in parameters:
-                    num_clicks = parameters["num_clicks"]
-                    self.execute_python_command(
-                        f"pyautogui.click(button='{button}', clicks={num_clicks})"
-                    )
-                else:
-                    self.execute_python_command(f"pyautogui.click(button='{button}')")
-            elif "button" not in parameters and "x" in parameters and "y" in parameters:
-                x = parameters["x"]
-                y = parameters["y"]
-                if "num_clicks" in parameters:
-                    num_clicks = parameters["num_clicks"]
-                    self.execute_python_command(
-                        f"pyautogui.click(x={x}, y={y}, clicks={num_clicks})"
-                    )
-                else:
-                    self.execute_python_command(f"pyautogui.click(x={x}, y={y})")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "MOUSE_DOWN":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.mouseDown()")
-            elif "button" in parameters:
-                button = parameters["button"]
-                self.execute_python_command(f"pyautogui.mouseDown(button='{button}')")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "MOUSE_UP":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.mouseUp()")
-            elif "button" in parameters:
-                button = parameters["button"]
-                self.execute_python_command(f"pyautogui.mouseUp(button='{button}')")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "RIGHT_CLICK":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.rightClick()")
-            elif "x" in parameters and "y" in parameters:
-                x = parameters["x"]
-                y = parameters["y"]
-                self.execute_python_command(f"pyautogui.rightClick(x={x}, y={y})")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "DOUBLE_CLICK":
-            if parameters == {} or None:
-                self.execute_python_command("pyautogui.doubleClick()")
-            elif "x" in parameters and "y" in parameters:
-                x = parameters["x"]
-                y = parameters["y"]
-                self.execute_python_command(f"pyautogui.doubleClick(x={x}, y={y})")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "DRAG_TO":
-            if "x" in parameters and "y" in parameters:
-                x = parameters["x"]
-                y = parameters["y"]
-                self.execute_python_command(
-                    f"pyautogui.dragTo({x}, {y}, duration=1.0, button='left', mouseDownUp=True)"
+                if response.status_code <= 500:
+                    return response
+                logger.error(
+                    "Failed to POST %s. Status code: %d", endpoint, response.status_code
+                )
+                logger.info("Retrying to POST %s.", endpoint)
+            except requests.exceptions.ReadTimeout:
+                logger.error("Timed out waiting for %s.", endpoint)
+                break
+            except Exception as e:
+                logger.error("An error occurred while trying to POST %s: %s", endpoint, e)
+                logger.info("Retrying to POST %s.", endpoint)
+            time.sleep(self.retry_interval)
+        return None
+
+    def _get_json(self, endpoint: str, params: Dict[str, Any], timeout: float) -> Optional[requests.Response]:
+        """GET counterpart of _post_json, for JSON endpoints. The session accepts gzip, so large bodies come compressed."""
+        for _ in range(self.retry_times):
+            try:
+                response = self.session.get(
+                    self.http_server + endpoint, params=params, timeout=timeout
+                )
+                if response.status_code <= 500:
+                    return response
+                logger.error(
+                    "Failed to GET %s. Status code: %d", endpoint, response.status_code
                 )
+                logger.info("Retrying to GET %s.", endpoint)
+            except requests.exceptions.ReadTimeout:
+                logger.error("Timed out waiting for %s.", endpoint)
+                break
+            except Exception as e:
+                logger.error("An error occurred while trying to GET %s: %s", endpoint, e)
+                logger.info("Retrying to GET %s.", endpoint)
+            time.sleep(self.retry_interval)
+        return None
+
+    def execute_action(self, action, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Executes an action on the server computer.
+        Uses the in-process `/action` endpoint, falling back to `python -c` commands on servers without it.
+        Returns the structured result from the server, or None for no-op actions / unreachable servers.
+        """
+        if is_noop_action(action):
+            return None
+
+        if not self.use_native_actions:
+            for command in action_to_commands(action):
+                result = self.execute_python_command(command, timeout=timeout)
+                if result is None:
+                    return None
+                failure = command_failure(action, result)
+                if failure is not None:
+                    return failure
+            return {"status": "success"}
 
-        elif action_type == "SCROLL":
-            # todo: check if it is related to the operating system, as https://github.com/TheDuckAI/DuckTrack/blob/main/ducktrack/playback.py pointed out
-            if "dx" in parameters and "dy" in parameters:
-                dx = parameters["dx"]
-                dy = parameters["dy"]
-                self.execute_python_command(f"pyautogui.hscroll({dx})")
-                self.execute_python_command(f"pyautogui.vscroll({dy})")
-            elif "dx" in parameters and "dy" not in parameters:
-                dx = parameters["dx"]
-                self.execute_python_command(f"pyautogui.hscroll({dx})")
-            elif "dx" not in parameters and "dy" in parameters:
-                dy = parameters["dy"]
-                self.execute_python_command(f"pyautogui.vscroll({dy})")
-            else:
-                raise Exception(f"Unknown parameters: {parameters}")
-
-        elif action_type == "TYPING":
-            if "text" not in parameters:
-                raise Exception(f"Unknown parameters: {parameters}")
-            # deal with special ' and \ characters
-            # text = parameters["text"].replace("\\", "\\\\").replace("'", "\\'")
-            # self.execute_python_command(f"pyautogui.typewrite('{text}')")
-            text = parameters["text"]
-            self.execute_python_command("pyautogui.typewrite({:})".format(repr(text)))
-
-        elif action_type == "PRESS":
-            if "key" not in parameters:
-                raise Exception(f"Unknown parameters: {parameters}")
-            key = parameters["key"]
-            if key.lower() not in KEYBOARD_KEYS:
-                raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
-            self.execute_python_command(f"pyautogui.press('{key}')")
-
-        elif action_type == "KEY_DOWN":
-            if "key" not in parameters:
-                raise Exception(f"Unknown parameters: {parameters}")
-            key = parameters["key"]
-            if key.lower() not in KEYBOARD_KEYS:
-                raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
-            self.execute_python_command(f"pyautogui.keyDown('{key}')")
-
-        elif action_type == "KEY_UP":
-            if "key" not in parameters:
-                raise Exception(f"Unknown parameters: {parameters}")
-            key = parameters["key"]
-            if key.lower() not in KEYBOARD_KEYS:
-                raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
-            self.execute_python_command(f"pyautogui.keyUp('{key}')")
-
-        elif action_type == "HOTKEY":
-            if "keys" not in parameters:
-                raise Exception(f"Unknown parameters: {parameters}")
-            keys = parameters["keys"]
-            if not isinstance(keys, list):
-                raise Exception("Keys must be a list of keys")
-            for key in keys:
-                if key.lower() not in KEYBOARD_KEYS:
-                    raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
-
-            keys_para_rep = "', '".join(keys)
-            self.execute_python_command(f"pyautogui.hotkey('{keys_para_rep}')")
-
-        elif action_type in ["WAIT", "FAIL", "DONE"]:
-            pass
+        if timeout is None:
+            timeout = self.action_timeout
+        response = self._post_json("/action", action, timeout=timeout)
+        if response is None:
+            logger.error("Failed to execute action.")
+            return None
+        result = action_response(response.status_code, response.text, f"Invalid action: {action}")
+        if result is None:
+            logger.warning(
+                "Server has no /action endpoint, falling back to executing python commands."
+            )
+            self.use_native_actions = False
+            return self.execute_action(action, timeout=timeout)
+        return result
 
+    def execute_actions(
+        self,
+        actions: List[Any],
+        delay=0.0,
+        stop_on_error: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Executes an ordered list of actions in a single round-trip through `/actions/batch`.
+        `delay` is either the pause between consecutive actions or a list with the pause before each action.
+        Returns {"status", "results": [{"index", "status", "elapsed", ...}], "elapsed"}, or None
+        when the server could not be reached.
+        """
+        if timeout is None:
+            timeout = batch_timeout(self.action_timeout, actions, delay)
+
+        if self.use_native_actions:
+            payload = {"actions": actions, "delay": delay, "stop_on_error": stop_on_error}
+            response = self._post_json("/actions/batch", payload, timeout=timeout)
+            if response is None:
+                logger.error("Failed to execute actions.")
+                return None
+            result = action_response(response.status_code, response.text, "Invalid batch of actions")
+            if result is not None:
+                return result
+            logger.warning(
+                "Server has no /actions/batch endpoint, executing the actions one by one."
+            )
+
+        return self._execute_actions_one_by_one(actions, delay, stop_on_error)
+
+    def step(
+        self,
+        action,
+        observe: Optional[Dict[str, Any]] = None,
+        delay=0.0,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        One agent step in a single round-trip (`/step`): executes `action` (or a list of actions, with `delay`
+        as in execute_actions), optionally waits, and observes the screen.
+        `observe` = {"wait": seconds or "stable", "stable": {"timeout", "threshold", "quiet_ms"},
+        "screenshot": get_screenshot options (width, height, scale, format, quality, grayscale, bbox, window)
+        or False}. By default a PNG screenshot is taken right after the action.
+        Returns {"result", "cursor": [x, y], "timing", "screenshot": bytes or None, "screenshot_info": frame info,
+        "stable" (with wait="stable")}, or None when the server could not be reached.
+        """
+        observe = observe or {}
+        if timeout is None:
+            wait = observe.get("wait") or 0
+            if wait == "stable":
+                wait = (observe.get("stable") or {}).get("timeout", 10)
+            timeout = self.action_timeout + wait + self.screenshot_timeout
+            if isinstance(action, list):
+                timeout = batch_timeout(timeout, action, delay)
+
+        if self.use_native_actions:
+            payload = {"action": action, "delay": delay, "observe": observe}
+            response = self._post_json("/step", payload, timeout=timeout)
+            if response is None:
+                logger.error("Failed to execute step.")
+                return None
+            if response.status_code == 200:
+                from . import codecs
+
+                meta, screenshot = codecs.unpack_envelope(response.content)
+                meta["screenshot_info"] = meta.pop("screenshot")
+                meta["screenshot"] = bytes(screenshot) if meta["screenshot_info"] else None
+                return meta
+            if response.status_code != 404:
+                try:
+                    message = response.json().get("message")
+                except ValueError:
+                    message = response.text
+                raise Exception(message or f"Step failed with status {response.status_code}")
+            logger.warning("Server has no /step endpoint, executing the step as separate requests.")
+        return self._step_separately(action, observe, delay)
+
+    def _step_separately(self, action, observe, delay) -> Dict[str, Any]:
+        """Client-side equivalent of `/step` for servers that do not have it."""
+        start = time.perf_counter()
+        if isinstance(action, list):
+            result = self.execute_actions(action, delay=delay)
         else:
-            raise Exception(f"Unknown action type: {action_type}")
+            result = self.execute_action(action)
+        if result is None:
+            result = missing_result(action)
+        acted = time.perf_counter()
+        step = {"result": result, "cursor": None, "screenshot": None, "screenshot_info": None}
+        screenshot_options = observe.get("screenshot", {})
+        wait = observe.get("wait") or 0
+        if wait == "stable":
+            stable_options = {k: v for k, v in (observe.get("stable") or {}).items() if k != "interval_ms"}
+            settled = self.wait_for_stable(**stable_options, **(screenshot_options or {}))
+            step["stable"] = settled["stable"] if settled else False
+            if settled and screenshot_options is not False:
+                step["screenshot"] = settled["screenshot"]
+        elif wait:
+            time.sleep(wait)
+        waited = time.perf_counter()
+        if screenshot_options is not False and step["screenshot"] is None:
+            step["screenshot"] = self.get_screenshot(**(screenshot_options or {}))
+        finished = time.perf_counter()
+        step["timing"] = {
+            "action": acted - start,
+            "wait": waited - acted,
+            "observe": finished - waited,
+            "total": finished - start,
+        }
+        return step
+
+    def _execute_actions_one_by_one(self, actions, delay, stop_on_error) -> Dict[str, Any]:
+        """Client-side equivalent of `/actions/batch` for servers that do not have it."""
+        delays = batch_delays(actions, delay)
+        results = []
+        failed = False
+        start = time.perf_counter()
+        for index, action in enumerate(actions):
+            if failed and stop_on_error:
+                results.append({"index": index, "status": "skipped"})
+                continue
+            if delays[index]:
+                time.sleep(delays[index])
+            action_start = time.perf_counter()
+            try:
+                result = self.execute_action(action) or missing_result(action)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            failed = failed or result.get("status") != "success"
+            results.append(batch_entry(result, index, action_start, start))
+        return batch_result(results, start)
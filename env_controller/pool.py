@@ -0,0 +1,218 @@
+"""
+Fan-out over many environment servers: one PythonController per target, driven by a bounded thread pool.
+
+Every call returns one result dict per target, in the order the targets were given:
+
+    {"target": "10.0.0.5:5000", "status": "success" | "error" | "evicted" | "unknown",
+     "result": ..., "error": "...", "queued": 0.001, "elapsed": 0.35}
+
+"queued" is the time spent waiting for a free worker and "elapsed" the time spent on the call itself.
+A target that fails `max_failures` calls in a row is evicted: it is skipped (status "evicted")
+until `restore()` is called for it. A target the pool was not created with gets status "unknown".
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .controller import PythonController, is_noop_action
+
+logger = logging.getLogger("desktopenv.controllerpool")
+
+Target = Union[str, Tuple[str, int]]
+
+
+def target_key(target: Target) -> str:
+    """Normalizes "ip:port" or (ip, port) to "ip:port"."""
+    if isinstance(target, str):
+        return target
+    ip, port = target
+    return f"{ip}:{port}"
+
+
+class ControllerPool:
+    def __init__(
+        self,
+        targets: Iterable[Target],
+        max_workers: int = 16,
+        max_failures: int = 3,
+        **controller_kwargs,
+    ):
+        """
+        `controller_kwargs` are passed to every PythonController; a small `retry_times` /
+        `retry_interval` keeps one dead server from holding a worker for long.
+        """
+        controller_kwargs.setdefault("pool_size", 2)
+        self.max_failures = max_failures
+        self._controllers: Dict[str, PythonController] = {}
+        self._health: Dict[str, Dict[str, Any]] = {}
+        for target in targets:
+            key = target_key(target)
+            ip, _, port = key.rpartition(":")
+            self._controllers[key] = PythonController(vm_ip=ip, server_port=int(port), **controller_kwargs)
+            self._health[key] = {
+                "healthy": True,
+                "calls": 0,
+                "failures": 0,
+                "consecutive_failures": 0,
+                "last_error": None,
+                "last_elapsed": None,
+            }
+        self._health_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="controllerpool")
+
+    @property
+    def targets(self) -> List[str]:
+        """Every target, healthy or not."""
+        return list(self._controllers)
+
+    @property
+    def healthy_targets(self) -> List[str]:
+        with self._health_lock:
+            return [key for key, health in self._health.items() if health["healthy"]]
+
+    def controller(self, target: Target) -> PythonController:
+        return self._controllers[target_key(target)]
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """A snapshot of the per-target health counters."""
+        with self._health_lock:
+            return {key: dict(health) for key, health in self._health.items()}
+
+    def restore(self, target: Target) -> None:
+        """Puts an evicted target back into rotation."""
+        with self._health_lock:
+            health = self._health[target_key(target)]
+            health["healthy"] = True
+            health["consecutive_failures"] = 0
+
+    def _record(self, key: str, error: Optional[str], elapsed: float) -> None:
+        with self._health_lock:
+            health = self._health[key]
+            health["calls"] += 1
+            health["last_elapsed"] = elapsed
+            if error is None:
+                health["consecutive_failures"] = 0
+                return
+            health["failures"] += 1
+            health["consecutive_failures"] += 1
+            health["last_error"] = error
+            if health["healthy"] and health["consecutive_failures"] >= self.max_failures:
+                health["healthy"] = False
+                logger.warning("Evicting %s after %d consecutive failures: %s",
+                               key, health["consecutive_failures"], error)
+
+    def _call(self, key: str, fn: Callable[[PythonController], Any], submitted: float) -> Dict[str, Any]:
+        start = time.perf_counter()
+        outcome = {"target": key, "queued": start - submitted}
+        try:
+            result = fn(self._controllers[key])
+            # The controller methods return None when the server could not be reached.
+            error = "No response from server" if result is None else None
+        except Exception as e:
+            result, error = None, str(e)
+        outcome["elapsed"] = time.perf_counter() - start
+        self._record(key, error, outcome["elapsed"])
+        outcome["status"] = "success" if error is None else "error"
+        outcome["result"] = result
+        if error is not None:
+            outcome["error"] = error
+        return outcome
+
+    def map(
+        self,
+        fns: Union[Callable[[PythonController], Any], Sequence[Callable[[PythonController], Any]]],
+        targets: Optional[Sequence[Target]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs `fn(controller)` for every target concurrently (`targets` defaults to the healthy ones),
+        or fns[i] for targets[i] (a list of calls needs explicit targets). Returns the result dicts in
+        target order. A None in `fns` marks a no-op for that target: it succeeds without a request.
+        """
+        if callable(fns):
+            keys = self.healthy_targets if targets is None else [target_key(t) for t in targets]
+            fns = [fns] * len(keys)
+        else:
+            if targets is None:
+                raise ValueError("A list of calls needs the targets it is meant for")
+            keys = [target_key(t) for t in targets]
+            if len(fns) != len(keys):
+                raise ValueError(f"Got {len(fns)} calls for {len(keys)} targets")
+
+        submitted = time.perf_counter()
+        slots: List[Any] = []
+        with self._health_lock:
+            healthy = {key for key, health in self._health.items() if health["healthy"]}
+        for key, fn in zip(keys, fns):
+            if key not in self._controllers:
+                slots.append({"target": key, "status": "unknown", "result": None, "queued": 0.0, "elapsed": 0.0,
+                              "error": f"{key} is not a target of this pool"})
+            elif key not in healthy:
+                slots.append({"target": key, "status": "evicted", "result": None, "queued": 0.0, "elapsed": 0.0})
+            elif fn is None:
+                slots.append({"target": key, "status": "success", "result": None, "queued": 0.0, "elapsed": 0.0})
+            else:
+                slots.append(self._executor.submit(self._call, key, fn, submitted))
+        return [slot if isinstance(slot, dict) else slot.result() for slot in slots]
+
+    def map_actions(
+        self,
+        actions=None,
+        targets: Optional[Sequence[Target]] = None,
+        *,
+        per_target: Optional[Dict[Target, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Executes the same `actions` on every target (`targets` defaults to the healthy ones), or
+        per_target[target] on each target of the dict, in its order. An action dict runs on its own,
+        a list of actions runs as one batch (execute_actions).
+        """
+        if (actions is None) == (per_target is None):
+            raise ValueError("Pass either actions (the same for every target) or per_target")
+        if per_target is not None:
+            if targets is not None:
+                raise ValueError("per_target already names the targets")
+            keys = [target_key(target) for target in per_target]
+            if len(set(keys)) != len(keys):
+                raise ValueError("per_target names a target twice")
+            planned = list(per_target.values())
+        else:
+            keys = self.healthy_targets if targets is None else [target_key(t) for t in targets]
+            planned = [actions] * len(keys)
+
+        def run(action):
+            if isinstance(action, list):
+                return lambda controller: controller.execute_actions(action, timeout=timeout)
+            if is_noop_action(action):
+                return None
+            return lambda controller: controller.execute_action(action, timeout=timeout)
+
+        return self.map([run(action) for action in planned], keys)
+
+    def gather_screenshots(
+        self,
+        targets: Optional[Sequence[Target]] = None,
+        array: bool = False,
+        **options,
+    ) -> List[Dict[str, Any]]:
+        """
+        Takes a screenshot on every target at once. `options` are the get_screenshot options
+        (width, height, scale, format, quality, grayscale, bbox, window, timeout); with array=True
+        the results are decoded NumPy arrays (get_screenshot_array).
+        """
+        if array:
+            return self.map(lambda controller: controller.get_screenshot_array(**options), targets)
+        return self.map(lambda controller: controller.get_screenshot(**options), targets)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        for controller in self._controllers.values():
+            controller.close()
+
+    def __enter__(self) -> "ControllerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
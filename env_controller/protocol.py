@@ -0,0 +1,308 @@
+"""
+The transport-independent parts of the action protocol, shared by PythonController and AsyncPythonController:
+legacy `python -c` commands for servers without `/action`, how responses of the action endpoints are
+interpreted, and the per-action results of a client-side batch.
+"""
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from .actions import KEYBOARD_KEYS
+
+logger = logging.getLogger("desktopenv.pycontroller")
+
+
+class ActionRejected(Exception):
+    """The server answered 400: the action (or batch) itself is invalid."""
+
+
+def is_noop_action(action) -> bool:
+    """WAIT / FAIL / DONE, as a string or an action dict; these never reach the server."""
+    if action in ["WAIT", "FAIL", "DONE"]:
+        return True
+    return type(action) == dict and action.get("action_type") in ["WAIT", "FAIL", "DONE"]
+
+
+def action_to_commands(action) -> List[str]:
+    """
+    Translates an action dict into the pyautogui command strings run through `/execute`.
+    This is the legacy path, used when the server has no `/action` endpoint.
+    """
+    commands = []
+    # Handle string actions
+    if action in ["WAIT", "FAIL", "DONE"]:
+        return commands
+
+    # Handle dictionary actions
+    if type(action) == dict and action.get("action_type") in [
+        "WAIT",
+        "FAIL",
+        "DONE",
+    ]:
+        return commands
+
+    action_type = action["action_type"]
+    parameters = (
+        action["parameters"]
+        if "parameters" in action
+        else {param: action[param] for param in action if param != "action_type"}
+    )
+    move_mode = random.choice(
+        [
+            "pyautogui.easeInQuad",
+            "pyautogui.easeOutQuad",
+            "pyautogui.easeInOutQuad",
+            "pyautogui.easeInBounce",
+            "pyautogui.easeInElastic",
+        ]
+    )
+    duration = random.uniform(0.5, 1)
+
+    if action_type == "MOVE_TO":
+        if parameters == {} or None:
+            commands.append("pyautogui.moveTo()")
+        elif "x" in parameters and "y" in parameters:
+            x = parameters["x"]
+            y = parameters["y"]
+            commands.append(
+                f"pyautogui.moveTo({x}, {y}, {duration}, {move_mode})"
+            )
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "CLICK":
+        if parameters == {} or None:
+            commands.append("pyautogui.click()")
+        elif "button" in parameters and "x" in parameters and "y" in parameters:
+            button = parameters["button"]
+            x = parameters["x"]
+            y = parameters["y"]
+            if "num_clicks" in parameters:
+                num_clicks = parameters["num_clicks"]
+                commands.append(
+                    f"pyautogui.click(button='{button}', x={x}, y={y}, clicks={num_clicks})"
+                )
+            else:
+                commands.append(
+                    f"pyautogui.click(button='{button}', x={x}, y={y})"
+                )
+        elif (
+            "button" in parameters
+            and "x" not in parameters
+            and "y" not in parameters
+        ):
+            button = parameters["button"]
+            if "num_clicks" in parameters:
+                num_clicks = parameters["num_clicks"]
+                commands.append(
+                    f"pyautogui.click(button='{button}', clicks={num_clicks})"
+                )
+            else:
+                commands.append(f"pyautogui.click(button='{button}')")
+        elif "button" not in parameters and "x" in parameters and "y" in parameters:
+            x = parameters["x"]
+            y = parameters["y"]
+            if "num_clicks" in parameters:
+                num_clicks = parameters["num_clicks"]
+                commands.append(
+                    f"pyautogui.click(x={x}, y={y}, clicks={num_clicks})"
+                )
+            else:
+                commands.append(f"pyautogui.click(x={x}, y={y})")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "MOUSE_DOWN":
+        if parameters == {} or None:
+            commands.append("pyautogui.mouseDown()")
+        elif "button" in parameters:
+            button = parameters["button"]
+            commands.append(f"pyautogui.mouseDown(button='{button}')")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "MOUSE_UP":
+        if parameters == {} or None:
+            commands.append("pyautogui.mouseUp()")
+        elif "button" in parameters:
+            button = parameters["button"]
+            commands.append(f"pyautogui.mouseUp(button='{button}')")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "RIGHT_CLICK":
+        if parameters == {} or None:
+            commands.append("pyautogui.rightClick()")
+        elif "x" in parameters and "y" in parameters:
+            x = parameters["x"]
+            y = parameters["y"]
+            commands.append(f"pyautogui.rightClick(x={x}, y={y})")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "DOUBLE_CLICK":
+        if parameters == {} or None:
+            commands.append("pyautogui.doubleClick()")
+        elif "x" in parameters and "y" in parameters:
+            x = parameters["x"]
+            y = parameters["y"]
+            commands.append(f"pyautogui.doubleClick(x={x}, y={y})")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "DRAG_TO":
+        if "x" in parameters and "y" in parameters:
+            x = parameters["x"]
+            y = parameters["y"]
+            commands.append(
+                f"pyautogui.dragTo({x}, {y}, duration=1.0, button='left', mouseDownUp=True)"
+            )
+
+    elif action_type == "SCROLL":
+        # todo: check if it is related to the operating system, as https://github.com/TheDuckAI/DuckTrack/blob/main/ducktrack/playback.py pointed out
+        if "dx" in parameters and "dy" in parameters:
+            dx = parameters["dx"]
+            dy = parameters["dy"]
+            commands.append(f"pyautogui.hscroll({dx})")
+            commands.append(f"pyautogui.vscroll({dy})")
+        elif "dx" in parameters and "dy" not in parameters:
+            dx = parameters["dx"]
+            commands.append(f"pyautogui.hscroll({dx})")
+        elif "dx" not in parameters and "dy" in parameters:
+            dy = parameters["dy"]
+            commands.append(f"pyautogui.vscroll({dy})")
+        else:
+            raise Exception(f"Unknown parameters: {parameters}")
+
+    elif action_type == "TYPING":
+        if "text" not in parameters:
+            raise Exception(f"Unknown parameters: {parameters}")
+        # deal with special ' and \ characters
+        # text = parameters["text"].replace("\\", "\\\\").replace("'", "\\'")
+        # commands.append(f"pyautogui.typewrite('{text}')")
+        text = parameters["text"]
+        commands.append("pyautogui.typewrite({:})".format(repr(text)))
+
+    elif action_type == "PRESS":
+        if "key" not in parameters:
+            raise Exception(f"Unknown parameters: {parameters}")
+        key = parameters["key"]
+        if key.lower() not in KEYBOARD_KEYS:
+            raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
+        commands.append(f"pyautogui.press('{key}')")
+
+    elif action_type == "KEY_DOWN":
+        if "key" not in parameters:
+            raise Exception(f"Unknown parameters: {parameters}")
+        key = parameters["key"]
+        if key.lower() not in KEYBOARD_KEYS:
+            raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
+        commands.append(f"pyautogui.keyDown('{key}')")
+
+    elif action_type == "KEY_UP":
+        if "key" not in parameters:
+            raise Exception(f"Unknown parameters: {parameters}")
+        key = parameters["key"]
+        if key.lower() not in KEYBOARD_KEYS:
+            raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
+        commands.append(f"pyautogui.keyUp('{key}')")
+
+    elif action_type == "HOTKEY":
+        if "keys" not in parameters:
+            raise Exception(f"Unknown parameters: {parameters}")
+        keys = parameters["keys"]
+        if not isinstance(keys, list):
+            raise Exception("Keys must be a list of keys")
+        for key in keys:
+            if key.lower() not in KEYBOARD_KEYS:
+                raise Exception(f"Key must be one of {KEYBOARD_KEYS}")
+
+        keys_para_rep = "', '".join(keys)
+        commands.append(f"pyautogui.hotkey('{keys_para_rep}')")
+
+    elif action_type in ["WAIT", "FAIL", "DONE"]:
+        pass
+
+    else:
+        raise Exception(f"Unknown action type: {action_type}")
+
+    return commands
+
+
+def batch_timeout(base: float, actions: Sequence[Any], delay) -> float:
+    """`base` plus the pauses a batch sleeps."""
+    total_delay = sum(delay) if isinstance(delay, list) else delay * max(len(actions) - 1, 0)
+    return base + total_delay
+
+
+def batch_delays(actions: Sequence[Any], delay) -> List[float]:
+    """The pause before each action: `delay` as given by the caller (a list already is one)."""
+    return delay if isinstance(delay, list) else [0.0] + [delay] * max(len(actions) - 1, 0)
+
+
+def parse_result(text: str) -> Dict[str, Any]:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {"status": "error", "message": text}
+
+
+def action_response(status: int, text: str, invalid: str) -> Optional[Dict[str, Any]]:
+    """
+    Interprets the answer of `/action` or `/actions/batch`: None when the server does not have the
+    endpoint (the caller falls back), ActionRejected on 400 (`invalid` is the default message),
+    otherwise the result.
+    """
+    if status == 404:
+        return None
+    result = parse_result(text)
+    if status == 400:
+        raise ActionRejected(result.get("message", invalid))
+    if status != 200:
+        logger.error("Failed to execute action: %s", result.get("message"))
+    return result
+
+
+def command_failure(action, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The error result of a legacy `python -c` command that ran but failed (non-zero exit code), with its
+    stderr, or None when it succeeded.
+    """
+    returncode = result.get("returncode", 0)
+    if result.get("status") != "error" and returncode == 0:
+        return None
+    stderr = result.get("error") or ""
+    lines = stderr.strip().splitlines()
+    return {
+        "status": "error",
+        "action_type": action.get("action_type") if isinstance(action, dict) else action,
+        "message": lines[-1] if lines else result.get("message") or f"Command exited with code {returncode}",
+        "returncode": returncode,
+        "stderr": stderr,
+    }
+
+
+def missing_result(action) -> Dict[str, Any]:
+    """The result of an action that got no response: no-ops never reach the server."""
+    if is_noop_action(action):
+        return {"status": "success"}
+    return {"status": "error", "message": "No response from server"}
+
+
+def batch_entry(result: Dict[str, Any], index: int, action_start: float, batch_start: float) -> Dict[str, Any]:
+    """Completes the result of one action of a client-side batch, as `/actions/batch` reports it."""
+    result["index"] = index
+    result["started"] = action_start - batch_start
+    result.setdefault("elapsed", time.perf_counter() - action_start)
+    return result
+
+
+def batch_result(results: List[Dict[str, Any]], batch_start: float) -> Dict[str, Any]:
+    failed = any(result.get("status") not in ("success", "skipped") for result in results)
+    return {
+        "status": "error" if failed else "success",
+        "results": results,
+        "elapsed": time.perf_counter() - batch_start,
+    }
@@ -0,0 +1,291 @@
+"""
+Replaying recorded trajectories (see trajectory.py) against a fresh environment.
+
+Consecutive actions are sent in batches through `/actions/batch` (execute_actions), so a batch costs one
+round-trip, and the pauses between actions are slept by the server instead of the client. Two modes:
+
+- "timed": the recorded pauses between actions are kept (scaled by `speed`); the time the client spends
+  between two batches is taken off the next pause, so network latency does not stretch the replay.
+- "fast": actions are sent as fast as possible, and after every batch the replay waits until the screen
+  is stable (a synchronization point) before the next one.
+
+With `verify_every`, the screenshot after every n-th recorded observation is compared with the recorded
+frame by perceptual hash (dHash); a Hamming distance above `max_distance` is reported as a divergence.
+Each verified step ends its batch. Hashing runs on a background thread while the next batch executes,
+so with stop_on_divergence the replay may run one batch past the divergence before it stops.
+
+    report = ReplayEngine(controller, mode="fast", verify_every=1).replay(TrajectoryReader("runs/episode-1"))
+    report["status"], report["first_divergence"], report["divergences"]
+"""
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .controller import PythonController
+from .trajectory import TrajectoryReader, action_start, decode_screenshot
+
+logger = logging.getLogger("desktopenv.replay")
+
+MODES = ["timed", "fast"]
+HASH_SIZE = 8  # dHash of HASH_SIZE x HASH_SIZE bits
+
+
+def perceptual_hash(pixels) -> int:
+    """
+    dHash of an image (uint8 array or PIL image): the brightness gradients of a 9x8 grayscale thumbnail.
+    Insensitive to scaling and compression, so a replay screenshot and a recorded frame of the same
+    screen hash (almost) the same.
+    """
+    from PIL import Image
+
+    image = pixels if isinstance(pixels, Image.Image) else Image.fromarray(pixels)
+    thumbnail = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    values = list(thumbnail.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = values[row * (HASH_SIZE + 1) + column]
+            right = values[row * (HASH_SIZE + 1) + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_distance(a: int, b: int) -> int:
+    """The number of differing bits of two perceptual hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _is_command(action) -> bool:
+    return isinstance(action, dict) and "command" in action and "action_type" not in action
+
+
+class ReplayEngine:
+    def __init__(
+        self,
+        controller: PythonController,
+        mode: str = "fast",
+        speed: float = 1.0,
+        batch_size: int = 16,
+        max_batch_seconds: float = 5.0,
+        settle_timeout: float = 10.0,
+        verify_every: int = 0,
+        max_distance: int = 10,
+        stop_on_error: bool = True,
+        stop_on_divergence: bool = False,
+        screenshot_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        batch_size / max_batch_seconds bound a batch by its number of actions and (timed mode) the pauses it
+        sleeps, so one batch does not hold the server's input lock for long. settle_timeout is the longest
+        wait for a stable screen in fast mode. screenshot_options are get_screenshot options (width, scale,
+        format, ...) for the verification screenshots; decodable image formats only.
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        if speed <= 0:
+            raise ValueError(f"speed must be positive, got {speed}")
+        self.controller = controller
+        self.mode = mode
+        self.speed = speed
+        self.batch_size = batch_size
+        self.max_batch_seconds = max_batch_seconds
+        self.settle_timeout = settle_timeout
+        self.verify_every = verify_every
+        self.max_distance = max_distance
+        self.stop_on_error = stop_on_error
+        self.stop_on_divergence = stop_on_divergence
+        self.screenshot_options = dict(screenshot_options or {})
+
+    def _pause_before(self, previous: Optional[Dict[str, Any]], step: Dict[str, Any]) -> float:
+        """The recorded pause between the end of the previous action and the start of this one."""
+        if self.mode != "timed" or previous is None:
+            return 0.0
+        started, previous_start = action_start(step), action_start(previous)
+        if started is None or previous_start is None:
+            return 0.0
+        previous_end = previous_start + ((previous.get("timing") or {}).get("action") or 0.0)
+        return max(0.0, started - previous_end) / self.speed
+
+    def replay(
+        self,
+        trajectory: Union[TrajectoryReader, Iterable[Dict[str, Any]]],
+        start: int = 0,
+        stop: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Replays steps [start, stop) of a TrajectoryReader, or an iterable of step dicts ({"action", "time",
+        "timing"}; those cannot be verified). Returns the report: {"status": "completed" | "diverged" |
+        "failed", "steps", "executed", "batches", "verified", "errors": [{"step", "message"}],
+        "divergences": [{"step", "distance", "expected", "actual"}], "first_divergence", "elapsed",
+        "recorded_elapsed"}.
+        """
+        reader = trajectory if isinstance(trajectory, TrajectoryReader) else None
+        if reader is not None:
+            indexes = range(start, len(reader) if stop is None else min(stop, len(reader)))
+            steps: Iterable[Tuple[int, Dict[str, Any]]] = ((index, reader.step(index)) for index in indexes)
+        else:
+            steps = ((index, step) for index, step in enumerate(trajectory) if index >= start and (stop is None or index < stop))
+
+        run = _Replay(self, reader)
+        first = last = None
+        previous = None
+        observed = 0
+        for index, step in steps:
+            first = first or step
+            last = step
+            action = step.get("action")
+            pause = self._pause_before(previous, step)
+            previous = step
+            verify = None
+            if reader is not None and self.verify_every and step.get("frame") is not None:
+                observed += 1
+                if observed % self.verify_every == 0:
+                    verify = (index, step["frame"])
+
+            if _is_command(action):
+                run.flush()
+                run.command(index, action["command"], pause, verify)
+            else:
+                if run.batch and (len(run.batch) >= self.batch_size
+                                  or run.batch_pause + pause > self.max_batch_seconds):
+                    run.flush()
+                run.add(index, action, pause)
+                if verify is not None:
+                    run.flush(verify)
+            if run.stopped:
+                break
+        if not run.stopped:
+            run.flush()
+        report = run.finish()
+        if first is not None and "time" in last and action_start(first) is not None:
+            report["recorded_elapsed"] = last["time"] - action_start(first)
+        return report
+
+
+class _Replay:
+    """The state of one ReplayEngine.replay call."""
+
+    def __init__(self, engine: ReplayEngine, reader: Optional[TrajectoryReader]):
+        self.engine = engine
+        self.controller = engine.controller
+        self.reader = reader
+        self.batch: List[Tuple[int, Any, float]] = []  # (step index, action, pause before it)
+        self.batch_pause = 0.0
+        self.started = time.perf_counter()
+        self.last_done = self.started
+        self.steps = 0
+        self.executed = 0
+        self.batches = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.checks: List[Future] = []
+        self.stopped = False
+        self._hasher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="replay-verify")
+
+    def add(self, index: int, action, pause: float) -> None:
+        self.batch.append((index, action, pause))
+        self.batch_pause += pause
+        self.steps += 1
+
+    def _first_pause(self, pause: float) -> float:
+        # The client already spent this long since the previous batch finished.
+        return max(0.0, pause - (time.perf_counter() - self.last_done))
+
+    def flush(self, verify: Optional[Tuple[int, int]] = None) -> None:
+        """Sends the pending batch, then synchronizes (fast mode) and verifies when asked."""
+        if not self.batch:
+            return
+        batch, self.batch, self.batch_pause = self.batch, [], 0.0
+        pauses = [pause for _, _, pause in batch]
+        pauses[0] = self._first_pause(pauses[0])
+        if pauses[0] > self.engine.max_batch_seconds:
+            # A long recorded pause is slept here rather than on the server, which holds its input lock meanwhile.
+            time.sleep(pauses[0])
+            pauses[0] = 0.0
+        try:
+            result = self.controller.execute_actions(
+                [action for _, action, _ in batch], delay=pauses, stop_on_error=self.engine.stop_on_error
+            )
+        except Exception as e:
+            result = {"status": "error", "results": [{"index": 0, "status": "error", "message": str(e)}]}
+        self.last_done = time.perf_counter()
+        self.batches += 1
+        if result is None:
+            self.fail(batch[0][0], "No response from server")
+            return
+        for entry in result.get("results", []):
+            if entry.get("status") == "success":
+                self.executed += 1
+            elif entry.get("status") == "error":
+                self.fail(batch[entry.get("index", 0)][0], entry.get("message", "Action failed"))
+        if not self.stopped:
+            self.observe(verify)
+
+    def command(self, index: int, command: str, pause: float, verify: Optional[Tuple[int, int]]) -> None:
+        """Recorded python commands (quick_start.py) cannot be batched; they run on their own."""
+        self.steps += 1
+        time.sleep(self._first_pause(pause))
+        result = self.controller.execute_python_command(command)
+        self.last_done = time.perf_counter()
+        if result is None or result.get("status") == "error":
+            self.fail(index, (result or {}).get("message", "No response from server"))
+            return
+        self.executed += 1
+        self.observe(verify)
+
+    def fail(self, index: int, message: str) -> None:
+        logger.error("Replay step %d failed: %s", index, message)
+        self.errors.append({"step": index, "message": message})
+        if self.engine.stop_on_error:
+            self.stopped = True
+
+    def observe(self, verify: Optional[Tuple[int, int]]) -> None:
+        engine = self.engine
+        screenshot = None
+        if engine.mode == "fast":
+            settled = self.controller.wait_for_stable(timeout=engine.settle_timeout, **engine.screenshot_options)
+            if settled is not None:
+                screenshot = settled["screenshot"]
+        elif verify is not None:
+            screenshot = self.controller.get_screenshot(**engine.screenshot_options)
+        self.last_done = time.perf_counter()
+        if verify is None:
+            return
+        if screenshot is None:
+            self.errors.append({"step": verify[0], "message": "No screenshot to verify"})
+            return
+        self.checks.append(self._hasher.submit(self.compare, verify[0], verify[1], screenshot))
+        if engine.stop_on_divergence and any(
+            check.done() and check.result() is not None for check in self.checks
+        ):
+            self.stopped = True
+
+    def compare(self, index: int, frame: int, screenshot: bytes) -> Optional[Dict[str, Any]]:
+        """Runs on the hashing thread. Returns a divergence, or None when the screens match."""
+        expected = perceptual_hash(self.reader.frame_array(frame))
+        actual = perceptual_hash(decode_screenshot(screenshot))
+        distance = hash_distance(expected, actual)
+        if distance <= self.engine.max_distance:
+            return None
+        return {"step": index, "distance": distance, "expected": f"{expected:016x}", "actual": f"{actual:016x}"}
+
+    def finish(self) -> Dict[str, Any]:
+        self._hasher.shutdown(wait=True)
+        divergences = [divergence for divergence in (check.result() for check in self.checks) if divergence]
+        if self.errors:
+            status = "failed"
+        elif divergences:
+            status = "diverged"
+        else:
+            status = "completed"
+        return {
+            "status": status,
+            "steps": self.steps,
+            "executed": self.executed,
+            "batches": self.batches,
+            "verified": len(self.checks),
+            "errors": self.errors,
+            "divergences": divergences,
+            "first_divergence": divergences[0]["step"] if divergences else None,
+            "elapsed": time.perf_counter() - self.started,
+        }
@@ -0,0 +1,367 @@
+"""
+Append-only episode logs: every action, its result and timing, and the observation that followed.
+
+A trajectory is a directory:
+
+    meta.json    encoding and settings, written once
+    steps.jsonl  one JSON object per step: {"index", "time", "started", "action", "result", "timing", "frame", ...}
+    steps.idx    8-byte offsets of the steps.jsonl lines, for random access
+    frames.bin   the frame blobs, back to back
+    frames.idx   one fixed-size FRAME_RECORD per frame: digest, offset, length, kind, base, width, height, channels
+
+Frames are content-addressed: a frame whose digest is already stored is not written again, the step
+just refers to the existing frame number (an agent waiting on an unchanged screen costs nothing).
+Two encodings:
+
+- "bytes" (default): the screenshot bytes as received (PNG, JPEG, ...). Needs nothing beyond the standard library.
+- "delta": decoded pixels, stored as the zlib-compressed XOR against the previous frame, with a full
+  keyframe every `keyframe_interval` frames. Static desktops compress to almost nothing. Needs numpy and Pillow.
+
+Files are only ever appended to and flushed step by step, so a crashed run keeps every complete step:
+reopening a trajectory for appending cuts each file back to its last complete record first.
+TrajectoryReader memory-maps the files and reads single steps and frames without loading the episode.
+For video of an episode, see the server's /recording endpoints.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Union
+
+ENCODINGS = ["bytes", "delta"]
+FORMAT_VERSION = 1
+# digest, offset, length, kind, base frame (NO_BASE for none), width, height, channels
+FRAME_RECORD = struct.Struct("<16sQIBIIIB")
+STEP_RECORD = struct.Struct("<Q")
+KIND_BYTES, KIND_KEYFRAME, KIND_DELTA = 0, 1, 2
+NO_BASE = 0xFFFFFFFF
+
+
+def _digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def decode_screenshot(data):
+    """Decodes screenshot bytes of an image format (PNG, JPEG, WebP, QOI) into a uint8 array."""
+    from . import codecs
+
+    return codecs.decode_image(bytes(data), "qoi" if data[:4] == b"qoif" else "image")
+
+
+def action_start(step: Dict[str, Any]) -> Optional[float]:
+    """
+    When the action of a step started (time.time()): its "started" field, or for steps logged without one,
+    the logging time less the step's duration ("total" of the timing, else the sum of its parts).
+    """
+    if step.get("started") is not None:
+        return step["started"]
+    if "time" not in step:
+        return None
+    timing = step.get("timing") or {}
+    if isinstance(timing.get("total"), (int, float)):
+        return step["time"] - timing["total"]
+    return step["time"] - sum(value for value in timing.values() if isinstance(value, (int, float)))
+
+
+class TrajectoryWriter:
+    def __init__(
+        self,
+        path: str,
+        encoding: str = "bytes",
+        keyframe_interval: int = 30,
+        compress_level: int = 1,
+    ):
+        """
+        Opens the trajectory at `path` for appending, creating it if needed. An existing trajectory keeps
+        the encoding it was created with; its frames still deduplicate new ones.
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {ENCODINGS}, got {encoding!r}")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {
+                "version": FORMAT_VERSION,
+                "encoding": encoding,
+                "keyframe_interval": keyframe_interval,
+                "created": time.time(),
+            }
+            with open(meta_path, "w") as f:
+                json.dump(self.meta, f)
+        self.encoding = self.meta["encoding"]
+        self.keyframe_interval = self.meta["keyframe_interval"]
+        self.compress_level = compress_level
+
+        self._frames = open(os.path.join(path, "frames.bin"), "ab")
+        self._frame_index = open(os.path.join(path, "frames.idx"), "ab")
+        self._steps = open(os.path.join(path, "steps.jsonl"), "ab")
+        self._step_index = open(os.path.join(path, "steps.idx"), "ab")
+        records, self._step_count = self._recover()
+        self._digests: Dict[bytes, int] = {}
+        self._frame_count = 0
+        self._since_keyframe = 0
+        for digest, _, _, kind, *_ in records:
+            self._digests.setdefault(digest, self._frame_count)
+            self._frame_count += 1
+            self._since_keyframe = 0 if kind == KIND_KEYFRAME else self._since_keyframe + 1
+        # Delta mode: the pixels of the last stored frame (None after reopening: the next frame is a keyframe).
+        self._previous = None
+
+    def _recover(self):
+        """
+        Cuts the files back to their last complete records, as a run that crashed mid-write leaves them:
+        the indexes to whole records, frames.bin and steps.jsonl to the end of the last indexed entry, and
+        steps whose frame did not make it into the index are dropped. Returns the frame records and step count.
+        """
+        def read(name):
+            with open(os.path.join(self.path, name), "rb") as f:
+                return f.read()
+
+        frame_index = read("frames.idx")
+        frame_index = frame_index[:len(frame_index) - len(frame_index) % FRAME_RECORD.size]
+        records = list(FRAME_RECORD.iter_unpack(frame_index))
+        frames_size = os.path.getsize(os.path.join(self.path, "frames.bin"))
+        while records and records[-1][1] + records[-1][2] > frames_size:
+            records.pop()  # the index record made it to disk, the blob did not
+        frames_end = records[-1][1] + records[-1][2] if records else 0
+
+        step_index = read("steps.idx")
+        step_index = step_index[:len(step_index) - len(step_index) % STEP_RECORD.size]
+        offsets = [offset for (offset,) in STEP_RECORD.iter_unpack(step_index)]
+        steps_end = 0
+        with open(os.path.join(self.path, "steps.jsonl"), "rb") as steps:
+            while offsets:
+                steps.seek(offsets[-1])
+                line = steps.readline()
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("partial line")
+                    frame = json.loads(line).get("frame")
+                    if frame is not None and frame >= len(records):
+                        raise ValueError("frame not stored")
+                except ValueError:
+                    offsets.pop()
+                    continue
+                steps_end = offsets[-1] + len(line)
+                break
+
+        for f, size in ((self._frames, frames_end), (self._frame_index, len(records) * FRAME_RECORD.size),
+                        (self._steps, steps_end), (self._step_index, len(offsets) * STEP_RECORD.size)):
+            if os.fstat(f.fileno()).st_size != size:
+                f.truncate(size)
+                f.seek(size)  # tell() gives the offsets of new frames and steps
+        return records, len(offsets)
+
+    @property
+    def frame_count(self) -> int:
+        return self._frame_count
+
+    @property
+    def step_count(self) -> int:
+        return self._step_count
+
+    def _append_frame(self, digest: bytes, blob: bytes, kind: int, base: int, shape=(0, 0, 0)) -> int:
+        offset = self._frames.tell()
+        self._frames.write(blob)
+        height, width, channels = shape
+        self._frame_index.write(FRAME_RECORD.pack(digest, offset, len(blob), kind, base, width, height, channels))
+        number = self._frame_count
+        self._digests[digest] = number
+        self._frame_count += 1
+        return number
+
+    def add_frame(self, frame) -> int:
+        """
+        Stores a frame (screenshot bytes, or in delta mode also an HxW(xC) uint8 array) unless an identical
+        one is already stored. Returns its frame number.
+        """
+        if self.encoding == "bytes":
+            if not isinstance(frame, (bytes, bytearray, memoryview)):
+                raise TypeError("A bytes-encoded trajectory stores screenshot bytes")
+            digest = _digest(frame)
+            if digest in self._digests:
+                return self._digests[digest]
+            return self._append_frame(digest, bytes(frame), KIND_BYTES, NO_BASE)
+
+        import numpy as np
+
+        pixels = decode_screenshot(frame) if isinstance(frame, (bytes, bytearray, memoryview)) else frame
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        shape = pixels.shape if pixels.ndim == 3 else pixels.shape + (1,)
+        digest = _digest(struct.pack("<III", *shape) + pixels.tobytes())
+        if digest in self._digests:
+            return self._digests[digest]
+        previous = self._previous
+        if previous is None or previous.shape != pixels.shape or self._since_keyframe + 1 >= self.keyframe_interval:
+            blob = zlib.compress(pixels.tobytes(), self.compress_level)
+            number = self._append_frame(digest, blob, KIND_KEYFRAME, NO_BASE, shape)
+            self._since_keyframe = 0
+        else:
+            blob = zlib.compress(np.bitwise_xor(pixels, previous).tobytes(), self.compress_level)
+            number = self._append_frame(digest, blob, KIND_DELTA, self._frame_count - 1, shape)
+            self._since_keyframe += 1
+        self._previous = pixels
+        return number
+
+    def log_step(
+        self,
+        action: Any,
+        observation=None,
+        result: Any = None,
+        timing: Optional[Dict[str, float]] = None,
+        started: Optional[float] = None,
+        **extra,
+    ) -> int:
+        """
+        Appends one step: the action dict (or command), its result, timing and the observation that
+        followed (stored with add_frame). `started` is the time.time() the action started at; without it,
+        it is worked back from the timing (see action_start). `extra` fields are saved as they are.
+        Returns the step index.
+        """
+        step = {
+            "index": self._step_count,
+            "time": time.time(),
+            "started": started,
+            "action": action,
+            "result": result,
+            "timing": timing,
+            "frame": None if observation is None else self.add_frame(observation),
+        }
+        step.update(extra)
+        step["started"] = action_start(step)
+        offset = self._steps.tell()
+        self._steps.write(json.dumps(step, separators=(",", ":"), default=str).encode("utf-8") + b"\n")
+        self._step_index.write(STEP_RECORD.pack(offset))
+        # Frames and their index before the step that refers to them, so a reader never sees a dangling frame.
+        for f in (self._frames, self._frame_index, self._steps, self._step_index):
+            f.flush()
+        self._step_count += 1
+        return step["index"]
+
+    def close(self) -> None:
+        for f in (self._frames, self._frame_index, self._steps, self._step_index):
+            f.close()
+
+    def __enter__(self) -> "TrajectoryWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class TrajectoryReader:
+    """
+    Random access to a trajectory through memory maps: only the steps and frames that are read are paged in.
+    Sees the steps written up to when it was opened (call `reload()` to pick up later ones).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.encoding = self.meta["encoding"]
+        self._maps = {}
+        self._cached = None  # (frame number, pixels) of the last delta frame decoded
+        self.reload()
+
+    def reload(self) -> None:
+        self.close()
+        self._maps = {name: _map(os.path.join(self.path, name))
+                      for name in ("frames.bin", "frames.idx", "steps.jsonl", "steps.idx")}
+        step_index = self._maps["steps.idx"]
+        self._step_count = len(step_index) // STEP_RECORD.size if step_index is not None else 0
+        frame_index = self._maps["frames.idx"]
+        self._frame_count = len(frame_index) // FRAME_RECORD.size if frame_index is not None else 0
+
+    def __len__(self) -> int:
+        return self._step_count
+
+    @property
+    def frame_count(self) -> int:
+        return self._frame_count
+
+    def step(self, index: int) -> Dict[str, Any]:
+        if not -self._step_count <= index < self._step_count:
+            raise IndexError(f"Step {index} out of range ({self._step_count} steps)")
+        index %= self._step_count
+        (offset,) = STEP_RECORD.unpack_from(self._maps["steps.idx"], index * STEP_RECORD.size)
+        steps = self._maps["steps.jsonl"]
+        end = steps.find(b"\n", offset)
+        return json.loads(steps[offset:end if end != -1 else len(steps)])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self._step_count):
+            yield self.step(index)
+
+    def _record(self, number: int):
+        if not 0 <= number < self._frame_count:
+            raise IndexError(f"Frame {number} out of range ({self._frame_count} frames)")
+        return FRAME_RECORD.unpack_from(self._maps["frames.idx"], number * FRAME_RECORD.size)
+
+    def frame_bytes(self, number: int) -> memoryview:
+        """The stored blob of a frame, without copying: the screenshot bytes in "bytes" mode."""
+        _, offset, length, *_ = self._record(number)
+        return memoryview(self._maps["frames.bin"])[offset:offset + length]
+
+    def frame_array(self, number: int):
+        """The pixels of a frame as a read-only uint8 array. Needs numpy and Pillow."""
+        import numpy as np
+
+        _, _, _, kind, base, width, height, channels = self._record(number)
+        if kind == KIND_BYTES:
+            pixels = decode_screenshot(self.frame_bytes(number))
+            pixels.flags.writeable = False
+            return pixels
+        if self._cached is not None and self._cached[0] == number:
+            return self._cached[1]
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        raw = np.frombuffer(zlib.decompress(self.frame_bytes(number)), dtype=np.uint8).reshape(shape)
+        if kind == KIND_DELTA:
+            # Reading forward is cheap: the base is usually the frame decoded just before.
+            raw = np.bitwise_xor(self.frame_array(base), raw)
+        raw.flags.writeable = False
+        self._cached = (number, raw)
+        return raw
+
+    def step_frame(self, index: int):
+        """The observation pixels of a step, or None when it has none."""
+        frame = self.step(index)["frame"]
+        return None if frame is None else self.frame_array(frame)
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            if mapped is not None:
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # a frame_bytes view is still alive; the map goes with it
+        self._maps = {}
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
+
+
+def open_trajectory(path: str, mode: str = "r", **kwargs) -> Union[TrajectoryReader, TrajectoryWriter]:
+    """TrajectoryReader for mode "r", TrajectoryWriter (appending) for mode "a"."""
+    if mode == "r":
+        return TrajectoryReader(path)
+    if mode == "a":
+        return TrajectoryWriter(path, **kwargs)
+    raise ValueError(f"mode must be 'r' or 'a', got {mode!r}")
@@ -0,0 +1,164 @@
+"""
+Client for the server's persistent WebSocket channel (`/ws`), for high-frequency interactive sessions
+where the per-request overhead of PythonController matters. See server/channel.py for the protocol.
+
+Requires the `websocket-client` package.
+"""
+import itertools
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import websocket
+
+logger = logging.getLogger("desktopenv.wscontroller")
+
+FrameCallback = Callable[[Dict[str, Any], bytes], None]
+
+
+class WebSocketController:
+    def __init__(self, vm_ip: str, server_port: int, timeout: float = 90, connect_timeout: float = 10):
+        self.vm_ip = vm_ip
+        self.url = f"ws://{vm_ip}:{server_port}/ws"
+        self.timeout = timeout  # default wait for a reply, in seconds
+
+        self.ws = websocket.create_connection(self.url, timeout=connect_timeout, enable_multithread=True)
+        self.ws.settimeout(None)  # the reader thread blocks until the next message
+
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._frame_callback: Optional[FrameCallback] = None
+        self._latest_frame: Optional[Tuple[Dict[str, Any], bytes]] = None
+        self._closed = False
+
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    # -- plumbing ------------------------------------------------------------------------------------
+
+    def _read_loop(self):
+        error: Exception = ConnectionError("WebSocket connection closed")
+        try:
+            while True:
+                message = self.ws.recv()
+                if not message:
+                    break
+                message = json.loads(message)
+                if message.get("type") == "frame":
+                    # The binary payload always follows its header directly.
+                    self._on_frame(message, self.ws.recv())
+                elif message.get("type") == "event":
+                    logger.warning("Server event: %s", message)
+                else:
+                    self._resolve(message.get("id"), message)
+        except Exception as e:
+            if not self._closed:
+                logger.error("WebSocket reader stopped: %s", e)
+                error = e
+        finally:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(error)
+
+    def _resolve(self, request_id, value):
+        with self._pending_lock:
+            future = self._pending.pop(request_id, None)
+        if future is not None:
+            future.set_result(value)
+        elif value.get("type") == "error":
+            logger.error("Server error: %s", value.get("message"))
+
+    def _on_frame(self, header, data):
+        if "id" in header:
+            self._resolve(header["id"], (header, data))
+            return
+        self._latest_frame = (header, data)
+        callback = self._frame_callback
+        if callback is not None:
+            try:
+                callback(header, data)
+            except Exception as e:
+                logger.error("Frame callback failed: %s", e)
+
+    def _request(self, message: Dict[str, Any], timeout: Optional[float] = None):
+        """Sends a request and waits for the reply with the same id. Raises on error replies."""
+        request_id = next(self._ids)
+        future = Future()
+        with self._pending_lock:
+            self._pending[request_id] = future
+        message["id"] = request_id
+        try:
+            self.ws.send(json.dumps(message))
+            reply = future.result(timeout=self.timeout if timeout is None else timeout)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+        if isinstance(reply, dict) and reply.get("type") == "error":
+            raise Exception(reply.get("message", "WebSocket request failed"))
+        return reply
+
+    # -- PythonController-like surface ---------------------------------------------------------------
+
+    def execute_action(self, action, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Executes one ACTION_SPACE dict and returns the server's structured result."""
+        return self._request({"type": "action", "action": action}, timeout)["result"]
+
+    def execute_actions(
+        self,
+        actions: List[Any],
+        delay=0.0,
+        stop_on_error: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Executes an ordered list of actions, like PythonController.execute_actions."""
+        message = {"type": "actions", "actions": actions, "delay": delay, "stop_on_error": stop_on_error}
+        return self._request(message, timeout)["result"]
+
+    def get_screenshot(self, timeout: Optional[float] = None, **options) -> bytes:
+        """
+        Gets one screenshot over the channel. Takes the /screenshot options (width, height, scale, bbox, window,
+        format, quality, png_level, grayscale) as keyword arguments.
+        """
+        _, data = self.get_frame(timeout=timeout, **options)
+        return data
+
+    def get_frame(self, timeout: Optional[float] = None, **options) -> Tuple[Dict[str, Any], bytes]:
+        """Like get_screenshot, but also returns the frame header (size, mode, screen size, timestamp)."""
+        return self._request({"type": "screenshot", "options": options}, timeout)
+
+    def subscribe(self, callback: Optional[FrameCallback] = None, fps: float = 5, **options) -> None:
+        """
+        Starts server-pushed frames at `fps`. `callback(header, data)` runs on the reader thread for
+        every frame; without a callback, poll `latest_frame`.
+        """
+        self._frame_callback = callback
+        self._request({"type": "subscribe", "fps": fps, "options": options})
+
+    def unsubscribe(self) -> None:
+        self._request({"type": "unsubscribe"})
+        self._frame_callback = None
+
+    @property
+    def latest_frame(self) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """The most recent pushed (header, data), or None."""
+        return self._latest_frame
+
+    def ping(self, timeout: Optional[float] = None) -> bool:
+        return self._request({"type": "ping"}, timeout).get("type") == "pong"
+
+    def close(self) -> None:
+        self._closed = True
+        try:
+            self.ws.close()
+        finally:
+            self._reader.join(timeout=5)
+
+    def __enter__(self) -> "WebSocketController":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb) -> None:
+        self.close()
@@ -1,17 +1,136 @@
 #!/usr/bin/env python3
 """
-Env Controller GUI界面，每秒更新截图，允许直接点击截图以在对应位置点击。
+Env Controller GUI界面，实时显示服务器画面流，允许直接点击截图以在对应位置点击。
 """
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import time
-import os
+import io
+import zlib
+from collections import OrderedDict, deque
 import requests
 from PIL import Image, ImageTk
 import json
 from env_controller.controller import PythonController
 
+STREAM_FPS = 10  # 实时画面流的帧率
+RENDER_DEBOUNCE_MS = 100  # 窗口大小或缩放停止变化这么久之后才重新渲染
+RENDER_CACHE_SIZE = 4  # 缓存的缩放结果数量，键为 (帧, 尺寸)
+DRAG_THRESHOLD = 5  # 按下后移动超过这么多像素才算拖动，否则算点击
+INPUT_BATCH_SIZE = 32  # 一次批量发送的最多动作数
+
+# Tk 按键名 -> pyautogui 按键名（可打印字符直接作为 TYPING 发送）
+TK_KEYS = {
+    "Return": "enter",
+    "KP_Enter": "enter",
+    "BackSpace": "backspace",
+    "Tab": "tab",
+    "Escape": "esc",
+    "Delete": "delete",
+    "Insert": "insert",
+    "Home": "home",
+    "End": "end",
+    "Prior": "pageup",
+    "Next": "pagedown",
+    "Up": "up",
+    "Down": "down",
+    "Left": "left",
+    "Right": "right",
+}
+TK_KEYS.update({f"F{i}": f"f{i}" for i in range(1, 13)})
+TK_MODIFIERS = [(0x4, "ctrl"), (0x8, "alt")]  # event.state 中的修饰键位
+
+
+class InputDispatcher:
+    """
+    有序的后台输入队列：所有鼠标键盘动作都在后台线程中按顺序发送，Tk 主线程从不等待服务器。
+    队列中连续的鼠标移动只保留最后一个，连续的滚动和输入文字会合并；
+    后台线程空闲时把队列中已有的动作一次性批量发送（execute_actions）。
+    callback(action, result, error) 在后台线程中调用，error 为 None 表示成功。
+    """
+
+    COALESCED = {"MOVE_TO", "SCROLL", "TYPING"}
+
+    def __init__(self, controller, max_batch=INPUT_BATCH_SIZE):
+        self.controller = controller
+        self.max_batch = max_batch
+        self.queue = deque()  # [action, [callback, ...]]
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, action, callback=None):
+        with self.condition:
+            if self.stopped:
+                return
+            if not (self.queue and self.merge(self.queue[-1], action, callback)):
+                self.queue.append([action, [callback] if callback else []])
+            self.condition.notify()
+
+    def merge(self, item, action, callback):
+        """把 action 合并进队尾尚未发送的同类动作，成功时返回 True"""
+        last = item[0]
+        action_type = action["action_type"]
+        if action_type not in self.COALESCED or last["action_type"] != action_type:
+            return False
+        if action_type == "MOVE_TO":
+            item[0] = action
+        elif action_type == "SCROLL":
+            merged = {"action_type": "SCROLL"}
+            for axis in ("dx", "dy"):
+                total = last.get(axis, 0) + action.get(axis, 0)
+                if total:
+                    merged[axis] = total
+            if len(merged) == 1:
+                merged["dy"] = 0
+            item[0] = merged
+        else:
+            item[0] = {"action_type": "TYPING", "text": last["text"] + action["text"]}
+        if callback:
+            item[1].append(callback)
+        return True
+
+    def stop(self):
+        """停止分发并丢弃尚未发送的动作（正在发送的请求会完成）"""
+        with self.condition:
+            self.stopped = True
+            self.queue.clear()
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or self.stopped)
+                if self.stopped:
+                    return
+                batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch))]
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        actions = [item[0] for item in batch]
+        try:
+            if len(actions) == 1:
+                results = [self.controller.execute_action(actions[0])]
+            else:
+                batch_result = self.controller.execute_actions(actions, stop_on_error=False)
+                results = batch_result["results"] if batch_result else [None] * len(actions)
+            errors = [
+                None if result and result.get("status") == "success"
+                else (result or {}).get("message", "服务器无响应")
+                for result in results
+            ]
+        except Exception as e:
+            results, errors = [None] * len(actions), [str(e)] * len(actions)
+
+        for (action, callbacks), result, error in zip(batch, results, errors):
+            for callback in callbacks:
+                try:
+                    callback(action, result, error)
+                except Exception as e:
+                    print(f"输入回调失败: {e}")
+
 
 class EnvControllerGUI:
     def __init__(self, root):
@@ -22,17 +141,26 @@ class EnvControllerGUI:
         # 连接状态
         self.is_connected = False
         self.controller = None
+        self.dispatcher = None  # 后台输入队列
+
+        # 正在进行的鼠标按下/拖动：(按下时的屏幕坐标, 是否已开始拖动)
+        self.press_position = None
+        self.dragging = False
 
-        # 截图数据
+        # 截图数据（当前显示的 PhotoImage）
         self.current_screenshot = None
-        self.screenshot_width = 0
-        self.screenshot_height = 0
 
         # 图片位置信息
         self.image_x_offset = 0
         self.image_y_offset = 0
         self.current_scale = 1.0
 
+        # 屏幕尺寸与画面区域：放大超过100%时只请求画布中可见的区域
+        self.screen_width = 0
+        self.screen_height = 0
+        self.viewport_bbox = None  # 请求的区域 (left, top, right, bottom)，None 表示全屏
+        self.frame_bbox = None  # 当前显示的画面对应的区域
+
         # 服务器信息
         self.server_ip = tk.StringVar(value="localhost")
         self.server_port = tk.StringVar(value="5000")
@@ -47,6 +175,19 @@ class EnvControllerGUI:
         self.screenshot_thread = None
         self.stop_screenshot_event = threading.Event()
 
+        # 渲染管线：截图线程在内存中解码，渲染线程在后台缩放，主线程只负责显示
+        self.frame_lock = threading.Lock()
+        self.current_frame = None  # (帧标识, PIL 图像, 区域, 屏幕尺寸)
+        self.render_geometry = None  # (可用宽度, 可用高度, 用户缩放比例)，只在主线程中测量
+        self.rendered = None  # 等待主线程显示的渲染结果
+        self.display_pending = False
+        self.render_event = threading.Event()
+        self.render_cache = OrderedDict()  # (帧标识, 宽, 高) -> 缩放后的图像
+        self.render_after_id = None  # 防抖定时器
+        self.canvas_image = None  # 画布上显示截图的图像项
+        self.render_thread = threading.Thread(target=self.render_loop, daemon=True)
+        self.render_thread.start()
+
     def create_widgets(self):
         # 创建顶部连接栏
         connect_frame = ttk.Frame(self.root, padding="10")
@@ -72,6 +213,10 @@ class EnvControllerGUI:
         self.status_label = ttk.Label(connect_frame, text="未连接", foreground="red")
         self.status_label.pack(side=tk.LEFT, padx=10)
 
+        # 最近一个动作的执行状态
+        self.input_status_label = ttk.Label(connect_frame, text="")
+        self.input_status_label.pack(side=tk.LEFT, padx=10)
+
         # 创建截图显示区域
         self.screenshot_frame = ttk.Frame(self.root, padding="10")
         self.screenshot_frame.pack(fill=tk.BOTH, expand=True, side=tk.TOP)
@@ -80,8 +225,15 @@ class EnvControllerGUI:
         self.canvas = tk.Canvas(self.screenshot_frame, bg="gray")
         self.canvas.pack(fill=tk.BOTH, expand=True)
 
-        # 绑定点击事件
-        self.canvas.bind("<Button-1>", self.on_screenshot_click)
+        # 绑定鼠标和键盘事件：点击、拖动、右键、滚轮、按键
+        self.canvas.bind("<ButtonPress-1>", self.on_mouse_press)
+        self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
+        self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
+        self.canvas.bind("<Button-3>", self.on_right_click)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        self.canvas.bind("<KeyPress>", self.on_key_press)
 
         # 添加缩放控制
         scale_frame = ttk.Frame(self.root, padding="10")
@@ -107,6 +259,12 @@ class EnvControllerGUI:
             ip = self.server_ip.get()
             port = int(self.server_port.get())
 
+            # 截图线程和点击操作共用同一个控制器（连接池）
+            if self.dispatcher:
+                self.dispatcher.stop()
+                self.dispatcher = None
+            if self.controller:
+                self.controller.close()
             self.controller = PythonController(vm_ip=ip, server_port=port)
 
             # 测试连接
@@ -115,6 +273,8 @@ class EnvControllerGUI:
                 self.is_connected = True
                 self.status_label.config(text="已连接", foreground="green")
                 messagebox.showinfo("成功", "连接服务器成功！")
+                self.update_render_geometry()
+                self.dispatcher = InputDispatcher(self.controller)
 
                 # 开始定时获取截图
                 self.start_screenshot_thread()
@@ -134,8 +294,18 @@ class EnvControllerGUI:
         if self.screenshot_thread:
             self.screenshot_thread.join()
 
+        if self.dispatcher:
+            self.dispatcher.stop()
+        self.dispatcher = None
+        if self.controller:
+            self.controller.close()
         self.controller = None
+        with self.frame_lock:
+            self.current_frame = None
+            self.rendered = None
         self.canvas.delete("all")
+        self.canvas_image = None
+        self.current_screenshot = None
         self.canvas.create_text(
             100, 100, text="已断开连接", fill="white", font=("Arial", 16)
         )
@@ -148,176 +318,345 @@ class EnvControllerGUI:
         self.screenshot_thread.start()
 
     def update_screenshot_loop(self):
-        """定时更新截图的循环"""
+        """接收服务器推送的实时画面流；服务器不支持画面流时退回到定时获取增量截图"""
+        use_stream = True
         while self.is_connected and not self.stop_screenshot_event.is_set():
+            bbox = self.viewport_bbox
+            if use_stream:
+                try:
+                    viewport_changed = False
+                    for frame, headers in self.controller.stream_screenshots(
+                        fps=STREAM_FPS, bbox=bbox
+                    ):
+                        if self.stop_screenshot_event.is_set():
+                            break
+                        screen_size = (
+                            int(headers["X-Screen-Width"]),
+                            int(headers["X-Screen-Height"]),
+                        )
+                        frame_bbox = None
+                        if "X-Capture-Bbox" in headers:
+                            frame_bbox = tuple(
+                                int(v) for v in headers["X-Capture-Bbox"].split(",")
+                            )
+                        self.submit_frame(frame, frame_bbox, screen_size)
+                        if self.viewport_bbox != bbox:
+                            viewport_changed = True
+                            break
+                    if viewport_changed:
+                        # 可见区域变化，立即按新区域重新连接
+                        continue
+                except requests.HTTPError as e:
+                    if e.response is not None and e.response.status_code == 404:
+                        print("服务器不支持画面流，改为定时获取截图")
+                        use_stream = False
+                        continue
+                    print(f"画面流中断: {e}")
+                except Exception as e:
+                    print(f"画面流中断: {e}")
+                # 稍等后重新连接画面流
+                self.stop_screenshot_event.wait(1)
+                continue
+
             print("正在获取截图...")
             try:
-                screenshot = self.controller.get_screenshot()
-                if screenshot:
-                    # 保存截图数据
-                    screenshot_path = os.path.join(
-                        os.path.dirname(__file__), "temp_screenshot.png"
-                    )
-                    with open(screenshot_path, "wb") as f:
-                        f.write(screenshot)
-
-                    # 更新GUI
-                    self.root.after(0, self.update_screenshot_display, screenshot_path)
+                # 增量截图：只传输变化的图块，在本地重建完整画面
+                frame = self.controller.get_screenshot_array(delta=True, bbox=bbox)
+                if frame is not None:
+                    self.submit_frame(frame, bbox)
             except Exception as e:
                 print(f"获取截图失败: {e}")
 
             # 等待1秒
-            time.sleep(5)
-
-    def update_screenshot_display(self, screenshot_path):
-        """更新截图显示"""
-        try:
-            # 打开原始图片
-            image = Image.open(screenshot_path)
-            self.screenshot_width, self.screenshot_height = image.size
-
-            # 获取窗口可用空间
-            self.screenshot_frame.update_idletasks()
-            available_width = self.screenshot_frame.winfo_width() - 20  # 减去边距
-            available_height = self.screenshot_frame.winfo_height() - 20  # 减去边距
-
-            # 计算适应窗口的最佳缩放比例，保持宽高比
-            if available_width <= 0 or available_height <= 0:
+            self.stop_screenshot_event.wait(1)
+
+    def submit_frame(self, frame, bbox=None, screen_size=None):
+        """在截图线程中解码新的一帧并通知渲染线程；与当前帧完全相同时直接跳过"""
+        if isinstance(frame, bytes) or frame.flags.c_contiguous:
+            key = (zlib.crc32(frame), bbox)
+        else:
+            key = (zlib.crc32(frame.tobytes()), bbox)
+        with self.frame_lock:
+            if self.current_frame is not None and self.current_frame[0] == key:
                 return
+        if isinstance(frame, bytes):
+            image = Image.open(io.BytesIO(frame))
+            image.load()
+        else:
+            image = Image.fromarray(frame)
+            if screen_size is None and bbox is None:
+                # 定时截图没有屏幕尺寸信息，全屏画面的尺寸即屏幕尺寸
+                screen_size = image.size
+        with self.frame_lock:
+            self.current_frame = (key, image, bbox, screen_size)
+        self.render_event.set()
+
+    def update_render_geometry(self):
+        """在主线程中测量画布可用空间和缩放比例，交给渲染线程使用"""
+        available_width, available_height = self.get_available_size()
+        with self.frame_lock:
+            self.render_geometry = (available_width, available_height, self.scale_var.get())
+        self.render_event.set()
+
+    def render_loop(self):
+        """渲染线程：把最新一帧缩放到当前画布尺寸，同一帧同一尺寸只缩放一次"""
+        screen_size = None
+        shown = None
+        while True:
+            self.render_event.wait()
+            self.render_event.clear()
+            with self.frame_lock:
+                frame, geometry = self.current_frame, self.render_geometry
+            if frame is None or geometry is None or (frame[0], geometry) == shown:
+                continue
+            key, image, bbox, frame_screen_size = frame
+            screen_size = frame_screen_size or screen_size
+            available_width, available_height, user_scale = geometry
+            if screen_size is None or available_width <= 0 or available_height <= 0:
+                continue
 
-            # 计算宽度和高度的缩放比例
-            width_scale = available_width / self.screenshot_width
-            height_scale = available_height / self.screenshot_height
-
-            # 使用较小的缩放比例，确保图片完全显示
-            scale = min(width_scale, height_scale)
-
-            # 应用用户设置的缩放比例
-            user_scale = self.scale_var.get()
-            final_scale = user_scale * scale
-
-            new_width = int(self.screenshot_width * final_scale)
-            new_height = int(self.screenshot_height * final_scale)
-
-            # 保存缩放后的图片
-            scaled_image_path = os.path.join(
-                os.path.dirname(__file__), "temp_scaled_screenshot.png"
-            )
-            image.resize((new_width, new_height), Image.LANCZOS).save(scaled_image_path)
-
-            # 使用Tkinter的PhotoImage打开缩放后的图片
-            self.current_screenshot = tk.PhotoImage(file=scaled_image_path)
-
-            # 更新画布
-            self.canvas.delete("all")
-            self.canvas.config(width=available_width, height=available_height)
-
-            # 计算图片居中显示的位置
-            x_offset = (available_width - new_width) // 2
-            y_offset = (available_height - new_height) // 2
-
-            # 保存图片位置信息，用于点击事件处理
-            self.image_x_offset = x_offset
-            self.image_y_offset = y_offset
-            self.current_scale = final_scale
+            try:
+                # 缩放比例按整个屏幕计算：画面可能只是屏幕的一部分（放大时的可见区域）
+                screen_width, screen_height = screen_size
+                scale = min(available_width / screen_width, available_height / screen_height)
+                final_scale = user_scale * scale
+                new_width = max(1, int(image.width * final_scale))
+                new_height = max(1, int(image.height * final_scale))
+
+                cache_key = (key, new_width, new_height)
+                scaled = self.render_cache.get(cache_key)
+                if scaled is None:
+                    scaled = image.resize((new_width, new_height), Image.LANCZOS, reducing_gap=2.0)
+                    self.render_cache[cache_key] = scaled
+                    while len(self.render_cache) > RENDER_CACHE_SIZE:
+                        self.render_cache.popitem(last=False)
+                else:
+                    self.render_cache.move_to_end(cache_key)
+            except Exception as e:
+                print(f"渲染截图失败: {e}")
+                continue
+
+            # 整个屏幕居中显示时左上角的位置；只截取了部分区域时，图片放在该区域在屏幕中的位置
+            x_offset = (available_width - int(screen_width * final_scale)) // 2
+            y_offset = (available_height - int(screen_height * final_scale)) // 2
+            left, top = bbox[:2] if bbox else (0, 0)
+            result = {
+                "image": scaled,
+                "x": x_offset + int(left * final_scale),
+                "y": y_offset + int(top * final_scale),
+                "x_offset": x_offset,
+                "y_offset": y_offset,
+                "scale": final_scale,
+                "screen_size": screen_size,
+                "bbox": bbox,
+            }
+            shown = (key, geometry)
+            with self.frame_lock:
+                self.rendered = result
+                if self.display_pending:
+                    continue
+                self.display_pending = True
+            self.root.after(0, self.show_rendered)
+
+    def show_rendered(self):
+        """在主线程中显示渲染结果：复用同一个画布图像项，只替换图片和位置"""
+        with self.frame_lock:
+            result, self.rendered = self.rendered, None
+            self.display_pending = False
+        if result is None or not self.is_connected:
+            return
 
-            # 显示图片
-            self.canvas.create_image(
-                x_offset, y_offset, image=self.current_screenshot, anchor=tk.NW
+        self.current_screenshot = ImageTk.PhotoImage(result["image"])
+        if self.canvas_image is None:
+            self.canvas_image = self.canvas.create_image(
+                result["x"], result["y"], image=self.current_screenshot, anchor=tk.NW
             )
+        else:
+            self.canvas.itemconfig(self.canvas_image, image=self.current_screenshot)
+            self.canvas.coords(self.canvas_image, result["x"], result["y"])
+        # 点击反馈等其他图形保持在截图上方
+        self.canvas.tag_lower(self.canvas_image)
+
+        # 保存屏幕原点位置信息，用于点击事件处理
+        self.image_x_offset = result["x_offset"]
+        self.image_y_offset = result["y_offset"]
+        self.current_scale = result["scale"]
+        self.frame_bbox = result["bbox"]
+        if result["screen_size"] != (self.screen_width, self.screen_height):
+            self.screen_width, self.screen_height = result["screen_size"]
+            self.update_viewport()
+
+    def canvas_to_screen(self, x, y):
+        """把画布坐标换算为服务器屏幕坐标，超出屏幕范围时返回 None"""
+        screen_x = int((x - self.image_x_offset) / self.current_scale)
+        screen_y = int((y - self.image_y_offset) / self.current_scale)
+        if 0 <= screen_x < self.screen_width and 0 <= screen_y < self.screen_height:
+            return screen_x, screen_y
+        return None
+
+    def send_action(self, action, feedback=None):
+        """把动作放入后台输入队列；完成后在界面上显示状态，失败时把点击反馈标为灰色"""
+        if not self.is_connected or not self.dispatcher:
+            return
+        submitted = time.perf_counter()
+
+        def on_done(action, result, error):
+            elapsed = (time.perf_counter() - submitted) * 1000
+            self.root.after(0, self.show_action_status, action, error, elapsed, feedback)
+
+        self.dispatcher.submit(action, on_done)
+
+    def show_action_status(self, action, error, elapsed, feedback):
+        action_type = action["action_type"]
+        if error is None:
+            self.input_status_label.config(text=f"{action_type} 完成 ({elapsed:.0f} ms)", foreground="green")
+        else:
+            print(f"执行 {action_type} 失败: {error}")
+            self.input_status_label.config(text=f"{action_type} 失败: {error}", foreground="red")
+            if feedback is not None:
+                self.canvas.itemconfig(feedback, fill="gray")
+
+    def show_click_feedback(self, x, y):
+        """乐观的点击反馈：立即画出圆圈，1秒后只删除这个圆圈（画面由画面流自动更新）"""
+        feedback = self.canvas.create_oval(
+            x - 10, y - 10, x + 10, y + 10, fill="red", outline="white", width=2
+        )
+        self.root.after(1000, lambda: self.canvas.delete(feedback))
+        return feedback
 
-            # 更新缩放标签
-            self.scale_label.config(text=f"{int(user_scale * 100)}%")
-
-        except Exception as e:
-            print(f"更新截图显示失败: {e}")
-            import traceback
-
-            traceback.print_exc()
-
-    def on_screenshot_click(self, event):
-        """处理截图点击事件"""
+    def on_mouse_press(self, event):
+        """按下左键：先记录位置，松开时判断是点击还是拖动"""
+        self.canvas.focus_set()
         if not self.is_connected or not self.current_screenshot:
             return
+        self.press_position = self.canvas_to_screen(event.x, event.y)
+        self.dragging = False
+        if self.press_position is None:
+            print("点击位置在图片范围外")
 
-        try:
-            # 获取点击位置
-            click_x = event.x
-            click_y = event.y
-
-            # 检查点击是否在图片范围内
-            if (
-                click_x < self.image_x_offset
-                or click_x > self.image_x_offset + self.current_screenshot.width()
-                or click_y < self.image_y_offset
-                or click_y > self.image_y_offset + self.current_screenshot.height()
-            ):
-                print("点击位置在图片范围外")
+    def on_mouse_drag(self, event):
+        if self.press_position is None:
+            return
+        position = self.canvas_to_screen(event.x, event.y)
+        if position is None:
+            return
+        if not self.dragging:
+            start_x, start_y = self.press_position
+            moved = max(abs(position[0] - start_x), abs(position[1] - start_y)) * self.current_scale
+            if moved < DRAG_THRESHOLD:
                 return
+            self.dragging = True
+            self.send_action({"action_type": "MOVE_TO", "x": start_x, "y": start_y})
+            self.send_action({"action_type": "MOUSE_DOWN", "button": "left"})
+        # 拖动中的移动在队列中会合并，只发送最新的位置
+        self.send_action({"action_type": "MOVE_TO", "x": position[0], "y": position[1]})
+
+    def on_mouse_release(self, event):
+        if self.press_position is None:
+            return
+        start, self.press_position = self.press_position, None
+        if self.dragging:
+            self.dragging = False
+            position = self.canvas_to_screen(event.x, event.y)
+            if position is not None:
+                self.send_action({"action_type": "MOVE_TO", "x": position[0], "y": position[1]})
+            self.send_action({"action_type": "MOUSE_UP", "button": "left"})
+            return
+        feedback = self.show_click_feedback(event.x, event.y)
+        self.send_action({"action_type": "CLICK", "x": start[0], "y": start[1]}, feedback)
+        print(f"执行点击操作: x={start[0]}, y={start[1]}")
 
-            # 计算图片内的相对坐标
-            relative_x = click_x - self.image_x_offset
-            relative_y = click_y - self.image_y_offset
-
-            # 应用缩放比例，转换为原始截图坐标
-            original_x = int(relative_x / self.current_scale)
-            original_y = int(relative_y / self.current_scale)
-
-            # 确保坐标在有效范围内
-            original_x = max(0, min(original_x, self.screenshot_width - 1))
-            original_y = max(0, min(original_y, self.screenshot_height - 1))
-
-            # 执行点击操作
-            action = {"action_type": "CLICK", "x": original_x, "y": original_y}
-
-            self.controller.execute_action(action)
-            print(f"执行点击操作: x={original_x}, y={original_y}")
-
-            # 显示点击反馈
-            feedback_x = relative_x + self.image_x_offset - 10
-            feedback_y = relative_y + self.image_y_offset - 10
-            self.canvas.create_oval(
-                feedback_x,
-                feedback_y,
-                feedback_x + 20,
-                feedback_y + 20,
-                fill="red",
-                outline="white",
-                width=2,
-            )
+    def on_right_click(self, event):
+        if not self.is_connected or not self.current_screenshot:
+            return
+        position = self.canvas_to_screen(event.x, event.y)
+        if position is None:
+            return
+        feedback = self.show_click_feedback(event.x, event.y)
+        self.send_action({"action_type": "RIGHT_CLICK", "x": position[0], "y": position[1]}, feedback)
 
-            # 1秒后移除反馈
-            self.root.after(
-                1000,
-                lambda: self.canvas.delete("all")
-                or self.update_screenshot_display(
-                    os.path.join(os.path.dirname(__file__), "temp_screenshot.png")
-                ),
-            )
+    def on_mouse_wheel(self, event):
+        """滚轮：Windows/macOS 使用 event.delta，Linux 使用 Button-4/5；连续滚动在队列中累加"""
+        if not self.is_connected:
+            return
+        if event.num == 4:
+            dy = 1
+        elif event.num == 5:
+            dy = -1
+        else:
+            dy = 1 if event.delta > 0 else -1
+        self.send_action({"action_type": "SCROLL", "dy": dy})
+
+    def on_key_press(self, event):
+        """按键：可打印字符作为 TYPING 发送（连续输入在队列中合并），特殊键和组合键分别作为 PRESS/HOTKEY 发送"""
+        if not self.is_connected:
+            return
+        modifiers = [name for mask, name in TK_MODIFIERS if event.state & mask]
+        key = TK_KEYS.get(event.keysym)
+        if key is None and len(event.keysym) == 1:
+            key = event.keysym.lower()
+        if modifiers and key:
+            self.send_action({"action_type": "HOTKEY", "keys": modifiers + [key]})
+        elif key and event.keysym in TK_KEYS:
+            self.send_action({"action_type": "PRESS", "key": key})
+        elif event.char and event.char.isprintable():
+            self.send_action({"action_type": "TYPING", "text": event.char})
+
+    def get_available_size(self):
+        """画布可用的显示空间"""
+        self.screenshot_frame.update_idletasks()
+        available_width = self.screenshot_frame.winfo_width() - 20  # 减去边距
+        available_height = self.screenshot_frame.winfo_height() - 20  # 减去边距
+        return available_width, available_height
+
+    def get_fit_scale(self, available_width, available_height):
+        """整个屏幕完全显示在画布中的缩放比例"""
+        width_scale = available_width / self.screen_width
+        height_scale = available_height / self.screen_height
+        return min(width_scale, height_scale)
+
+    def update_viewport(self):
+        """
+        缩放超过100%时只有屏幕中央的一部分可见，计算这部分区域并让截图线程只请求它（原始分辨率）；
+        否则请求全屏。
+        """
+        user_scale = self.scale_var.get()
+        available_width, available_height = self.get_available_size()
+        if (
+            user_scale <= 1.0
+            or not self.screen_width
+            or available_width <= 0
+            or available_height <= 0
+        ):
+            self.viewport_bbox = None
+            return
 
-        except Exception as e:
-            messagebox.showerror("错误", f"执行点击操作失败: {e}")
-            import traceback
+        final_scale = user_scale * self.get_fit_scale(available_width, available_height)
+        view_width = min(self.screen_width, int(available_width / final_scale) + 1)
+        view_height = min(self.screen_height, int(available_height / final_scale) + 1)
+        left = (self.screen_width - view_width) // 2
+        top = (self.screen_height - view_height) // 2
+        self.viewport_bbox = (left, top, left + view_width, top + view_height)
+
+    def schedule_render(self):
+        """防抖：缩放或窗口大小连续变化时，只在停止变化后重新计算可见区域并渲染一次"""
+        if self.render_after_id is not None:
+            self.root.after_cancel(self.render_after_id)
+        self.render_after_id = self.root.after(RENDER_DEBOUNCE_MS, self.apply_view_change)
 
-            traceback.print_exc()
+    def apply_view_change(self):
+        self.render_after_id = None
+        self.update_viewport()
+        self.update_render_geometry()
 
     def on_scale_change(self, event):
         """处理缩放变化"""
-        if self.current_screenshot and os.path.exists(
-            os.path.join(os.path.dirname(__file__), "temp_screenshot.png")
-        ):
-            self.update_screenshot_display(
-                os.path.join(os.path.dirname(__file__), "temp_screenshot.png")
-            )
+        self.scale_label.config(text=f"{int(self.scale_var.get() * 100)}%")
+        self.schedule_render()
 
     def on_window_resize(self, event=None):
         """处理窗口大小变化"""
-        if self.current_screenshot and os.path.exists(
-            os.path.join(os.path.dirname(__file__), "temp_screenshot.png")
-        ):
-            self.update_screenshot_display(
-                os.path.join(os.path.dirname(__file__), "temp_screenshot.png")
-            )
+        self.schedule_render()
 
 
 def main():
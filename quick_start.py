@@ -1,19 +1,22 @@
 #!/usr/bin/env python3
 """
-命令行脚本，用于初始化env_controller并循环接受命令，每个命令后2秒获取截图并展示给用户。
+命令行脚本，用于初始化env_controller并循环接受命令，每个命令后等待画面稳定再获取截图并展示给用户。
 """
 import argparse
-import time
 import os
 import subprocess
 import platform
+import time
 from env_controller.controller import PythonController
+from env_controller.trajectory import TrajectoryWriter
 
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description="Env Controller命令行工具")
     parser.add_argument("--ip", default="localhost", help="服务器IP地址")
     parser.add_argument("--port", type=int, default=5000, help="服务器端口")
+    parser.add_argument("--settle-timeout", type=float, default=10, help="等待画面稳定的最长时间（秒）")
+    parser.add_argument("--trajectory", help="把每一步的动作、结果、耗时和截图记录到该目录（相同截图只保存一次）")
     args = parser.parse_args()
     
     # 初始化PythonController
@@ -32,6 +35,11 @@ def main():
     os.makedirs(screenshots_dir, exist_ok=True)
     
     screenshot_counter = 1
+
+    # 轨迹记录：指定 --trajectory 时每一步写入追加式存储，截图不再逐个保存，只覆盖 latest.png 用于查看
+    trajectory = TrajectoryWriter(args.trajectory) if args.trajectory else None
+    if trajectory:
+        print(f"轨迹记录到: {args.trajectory}（已有 {trajectory.step_count} 步）")
     
     while True:
         try:
@@ -49,28 +57,44 @@ def main():
             # 执行命令
             print(f"正在执行命令: {command}")
             
+            started_at = time.time()
+            started = time.perf_counter()
             try:
                 # 尝试解析为JSON动作指令
                 import json
                 action = json.loads(command)
-                controller.execute_action(action)
+                result = controller.execute_action(action)
                 print("动作执行成功！")
             except json.JSONDecodeError:
                 # 如果不是JSON，则作为Python命令执行
+                action = {"command": command}
                 result = controller.execute_python_command(command)
                 print(f"命令执行结果: {result}")
+            acted = time.perf_counter()
             
-            # 等待2秒
-            print("等待2秒...")
-            time.sleep(2)
-            
-            # 获取并展示截图
-            print("正在获取截图...")
-            screenshot_data = controller.get_screenshot()
+            # 等待画面稳定并获取截图
+            print("正在等待画面稳定...")
+            settled = controller.wait_for_stable(timeout=args.settle_timeout)
+            screenshot_data = None
+            if settled:
+                state = "画面已稳定" if settled["stable"] else "等待超时，画面仍在变化"
+                print(f"{state}（{settled['elapsed']:.2f} 秒）")
+                screenshot_data = settled["screenshot"]
             
+            if trajectory:
+                trajectory.log_step(
+                    action,
+                    screenshot_data,
+                    result=result,
+                    timing={"action": acted - started, "settle": time.perf_counter() - acted},
+                    started=started_at,
+                    stable=settled["stable"] if settled else None,
+                )
+
             if screenshot_data:
                 # 保存截图
-                screenshot_path = os.path.join(screenshots_dir, f"screenshot_{screenshot_counter}.png")
+                name = "latest.png" if trajectory else f"screenshot_{screenshot_counter}.png"
+                screenshot_path = os.path.join(screenshots_dir, name)
                 with open(screenshot_path, "wb") as f:
                     f.write(screenshot_data)
                 
@@ -97,5 +121,9 @@ def main():
             import traceback
             traceback.print_exc()
 
+    if trajectory:
+        trajectory.close()
+    controller.close()
+
 if __name__ == "__main__":
     main()
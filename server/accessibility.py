@@ -0,0 +1,721 @@
+"""
+Accessibility tree dumps over AT-SPI (Linux only).
+
+Walking the whole tree of a big application (a spreadsheet, a browser) takes seconds, because every
+property is a D-Bus round-trip. The walk is therefore pruned as it goes:
+
+- max_depth: nodes deeper than this are left out;
+- showing_only: windows and widgets without STATE_SHOWING are skipped with their whole subtree;
+- skip_roles / app: subtrees with one of these role names, and applications not named `app`, are skipped;
+- max_children / max_nodes / budget_ms: hard caps on the work done. A dump cut short by them is
+  marked "truncated".
+
+Each node is a compact dict; empty fields are left out:
+
+    {"role": "push button", "name": "Save", "states": ["enabled", "focusable"],
+     "bbox": [x, y, width, height], "text": "...", "value": 1.0, "children": [...]}
+
+A node cut off by max_depth carries "more": <its child count>; text longer than TEXT_LIMIT is cut and
+carries "text_length".
+
+Clients that observe the tree after every step can instead follow a TreeMirror: a copy kept current by
+AT-SPI events, served as versioned changes (tree_changes), so a step costs what changed, not the app size.
+
+pyatspi and its GLib main loop are not thread-safe, so every AT-SPI call runs on the event loop thread:
+request threads hand their work over with _on_event_loop and wait for the result.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import pyatspi
+    from gi.repository import GLib
+except ImportError:
+    pyatspi = None
+
+DEFAULT_MAX_DEPTH = 50
+DEFAULT_MAX_CHILDREN = 500
+DEFAULT_MAX_NODES = 20000
+DEFAULT_BUDGET_MS = 3000
+MAX_BUDGET_MS = 30000
+TEXT_LIMIT = 1024  # characters of a node's text interface that are sent
+
+# Roles whose nodes never carry STATE_SHOWING themselves; the check starts below them.
+UNSTATED_ROLES = {"desktop frame", "application"}
+
+# How much longer than its time budget a request waits for the event loop: one hung D-Bus call takes 25 s.
+LOOP_GRACE = 30.0
+
+_state_names: Optional[Dict[Any, str]] = None
+
+
+class AccessibilityError(Exception):
+    """Raised when the accessibility tree cannot be read on this machine; `status_code` is the HTTP status."""
+    status_code = 501
+
+
+class AccessibilityTimeoutError(AccessibilityError):
+    """The event loop thread did not get to the request in time (an application is not answering)."""
+    status_code = 503
+
+
+class AccessibilityOptionsError(ValueError):
+    """Raised for invalid accessibility query parameters."""
+
+
+def _parse_int(args, name, default, low, high) -> int:
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise AccessibilityOptionsError(f"{name} must be an integer, got {value!r}")
+    if not low <= number <= high:
+        raise AccessibilityOptionsError(f"{name} must be in [{low}, {high}], got {number}")
+    return number
+
+
+def parse_tree_options(args) -> Dict[str, Any]:
+    """
+    Reads the walk options from query parameters: max_depth, showing_only (default on), skip_roles
+    (comma-separated role names), app (application name, case-insensitive), max_children, max_nodes,
+    budget_ms and text (default on; off leaves out the text contents).
+    """
+    skip_roles = args.get("skip_roles") or ""
+    showing_only = args.get("showing_only")
+    text = args.get("text")
+    return {
+        "max_depth": _parse_int(args, "max_depth", DEFAULT_MAX_DEPTH, 0, 1000),
+        "showing_only": True if showing_only in (None, "") else showing_only.lower() in ("1", "true", "yes", "on"),
+        "skip_roles": {role.strip().lower() for role in skip_roles.split(",") if role.strip()},
+        "app": (args.get("app") or "").lower() or None,
+        "max_children": _parse_int(args, "max_children", DEFAULT_MAX_CHILDREN, 1, 1000000),
+        "max_nodes": _parse_int(args, "max_nodes", DEFAULT_MAX_NODES, 1, 10000000),
+        "budget": _parse_int(args, "budget_ms", DEFAULT_BUDGET_MS, 10, MAX_BUDGET_MS) / 1000.0,
+        "text": True if text in (None, "") else text.lower() in ("1", "true", "yes", "on"),
+    }
+
+
+def _state_name(state) -> str:
+    global _state_names
+    if _state_names is None:
+        # StateType._enum_lookup maps values to "STATE_SHOWING"-style names.
+        _state_names = {
+            value: name.split("_", 1)[1].lower()
+            for value, name in pyatspi.StateType._enum_lookup.items()
+        }
+    return _state_names.get(state, str(state))
+
+
+class TreeWalker:
+    """One pruned walk of the desktop; see the module docstring for the options."""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        self.nodes = 0
+        self.truncated = False
+        self.deadline = time.monotonic() + options["budget"]
+
+    def exhausted(self) -> bool:
+        """The time budget or max_nodes ran out (unlike a max_children cut, this one can be resumed)."""
+        return self.nodes >= self.options["max_nodes"] or time.monotonic() >= self.deadline
+
+    def out_of_budget(self) -> bool:
+        if self.exhausted():
+            self.truncated = True
+        return self.truncated
+
+    def walk(self) -> Optional[Dict[str, Any]]:
+        return self.node(pyatspi.Registry.getDesktop(0), 0)
+
+    def describe(self, accessible, depth: int) -> Optional[Tuple[Dict[str, Any], int]]:
+        """The fields of `accessible` itself and its child count, or None when it is pruned or gone."""
+        options = self.options
+        try:
+            role = accessible.getRoleName()
+            if role in options["skip_roles"]:
+                return None
+            name = accessible.name or ""
+            if role == "application" and options["app"] is not None and name.lower() != options["app"]:
+                return None
+            state_set = accessible.getState()
+            if options["showing_only"] and role not in UNSTATED_ROLES and not state_set.contains(pyatspi.STATE_SHOWING):
+                return None
+            raw_states = state_set.getStates()
+            child_count = accessible.childCount
+        except Exception:
+            # Applications come and go while we walk; a dead object is just left out.
+            return None
+
+        node: Dict[str, Any] = {"role": role}
+        if name:
+            node["name"] = name
+        states = [_state_name(state) for state in raw_states]
+        if options["showing_only"]:
+            # Implied by being in the dump at all.
+            states = [state for state in states if state not in ("showing", "visible")]
+        if states:
+            node["states"] = states
+        node.update(self.interfaces(accessible))
+        if depth >= options["max_depth"] and child_count:
+            node["more"] = child_count
+        return node, child_count
+
+    def children(self, accessible, child_count: int) -> Iterator[Any]:
+        """The children to visit, within max_children and the budget."""
+        for index in range(min(child_count, self.options["max_children"])):
+            if self.out_of_budget():
+                return
+            try:
+                child = accessible.getChildAtIndex(index)
+            except Exception:
+                continue
+            if child is not None:
+                yield child
+        if child_count > self.options["max_children"]:
+            self.truncated = True
+
+    def node(self, accessible, depth: int) -> Optional[Dict[str, Any]]:
+        """Serializes `accessible` and what is left of its subtree, or None when it is pruned."""
+        described = self.describe(accessible, depth)
+        if described is None:
+            return None
+        node, child_count = described
+        self.nodes += 1
+        if depth >= self.options["max_depth"]:
+            return node
+        children: List[Dict[str, Any]] = []
+        for child in self.children(accessible, child_count):
+            serialized = self.node(child, depth + 1)
+            if serialized is not None:
+                children.append(serialized)
+        if children:
+            node["children"] = children
+        elif node["role"] == "application" and self.options["showing_only"]:
+            # An application without any visible window is noise in a "what is on screen" dump.
+            return None
+        return node
+
+    def interfaces(self, accessible) -> Dict[str, Any]:
+        """bbox from Component, plus text / value for nodes implementing Text / Value."""
+        fields: Dict[str, Any] = {}
+        try:
+            extents = accessible.queryComponent().getExtents(pyatspi.XY_SCREEN)
+            fields["bbox"] = [extents.x, extents.y, extents.width, extents.height]
+        except Exception:
+            pass
+        if self.options["text"]:
+            try:
+                text = accessible.queryText()
+                count = text.characterCount
+                if count:
+                    fields["text"] = text.getText(0, min(count, TEXT_LIMIT))
+                    if count > TEXT_LIMIT:
+                        fields["text_length"] = count
+            except Exception:
+                pass
+        try:
+            fields["value"] = accessible.queryValue().currentValue
+        except Exception:
+            pass
+        return fields
+
+
+def dump_tree(options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Walks the desktop with `options` (see parse_tree_options).
+    Returns {"tree": root node or None, "nodes": count, "truncated": bool, "elapsed": seconds}.
+    """
+    if pyatspi is None:
+        raise AccessibilityError("The accessibility tree needs pyatspi (AT-SPI), which is only available on Linux")
+    start = time.monotonic()
+
+    def walk():
+        walker = TreeWalker(options)
+        return walker, walker.walk()
+
+    walker, tree = _on_event_loop(walk, options["budget"])
+    return {
+        "tree": tree,
+        "nodes": walker.nodes,
+        "truncated": walker.truncated,
+        "elapsed": time.monotonic() - start,
+    }
+
+
+# AT-SPI events that can change what the mirror holds, and the kind of refresh each one needs.
+MIRROR_EVENTS = {
+    "object:children-changed": "children",
+    "object:state-changed": "state",
+    "object:text-changed": "text",
+    "object:bounds-changed": "bounds",
+    "object:property-change:accessible-name": "name",
+}
+CHANGE_LOG_SIZE = 20000  # changes kept for clients that are behind; older clients get a full snapshot
+MAX_MIRRORS = 4  # option sets with a live mirror; the least recently used one is closed first
+
+_event_loop: Optional[threading.Thread] = None
+_event_loop_lock = threading.Lock()
+# One mirror per set of walk options, least recently used first. Only touched on the event loop thread.
+_mirrors: "OrderedDict[Tuple, TreeMirror]" = OrderedDict()
+
+
+class TreeMirror:
+    """
+    A live, flat copy of the pruned tree, kept current by AT-SPI events instead of re-walking.
+
+    Every mirrored node gets an id and is stored as {"id", "parent", "children": [ids], ...node fields}.
+    Event listeners only mark their source as dirty; the dirty nodes are re-read when a client asks for
+    changes, so a burst of events costs one refresh per node. Every change bumps `version` and is logged
+    as {"op": "set", "node": record} or {"op": "remove", "id": id}, so a client at version v catches up by
+    replaying the changes after v. The walk options are fixed for the mirror's lifetime, except the time
+    budget, which applies to each request: a build cut short by it (or by max_nodes) remembers the nodes
+    whose children were not all listed, and the next requests carry on from there ("complete" is False
+    until they are done).
+    Must only be used on the event loop thread (see _on_event_loop).
+    """
+
+    def __init__(self, options: Dict[str, Any], budget: float):
+        self.options = dict(options, budget=float("inf"))
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.records: Dict[int, Dict[str, Any]] = {}
+        self.root: Optional[int] = None
+        self.log: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=CHANGE_LOG_SIZE)
+        # AT-SPI hands out one proxy object per remote accessible, so the proxies identify nodes.
+        self._ids: Dict[Any, int] = {}
+        self._objects: Dict[int, Any] = {}
+        self._depths: Dict[int, int] = {}
+        self._next_id = itertools.count(1)
+        self._dirty: Dict[Any, Set[str]] = {}
+        self._dirty_lock = threading.Lock()
+        self._index: Optional["TreeIndex"] = None
+        # Nodes whose children were not all listed because the budget ran out, in the order they were found.
+        self._incomplete: Dict[int, None] = {}
+        self._building = True
+        self.root = self.add_subtree(pyatspi.Registry.getDesktop(0), None, 0, self.walker(budget))
+        self._building = False
+        pyatspi.Registry.registerEventListener(self.on_event, *MIRROR_EVENTS)
+
+    def walker(self, budget: float) -> TreeWalker:
+        return TreeWalker(dict(self.options, budget=budget))
+
+    @property
+    def complete(self) -> bool:
+        return not self._incomplete
+
+    def close(self) -> None:
+        pyatspi.Registry.deregisterEventListener(self.on_event, *MIRROR_EVENTS)
+
+    def on_event(self, event) -> None:
+        """Runs on the AT-SPI event loop thread: only remembers what to refresh."""
+        for prefix, kind in MIRROR_EVENTS.items():
+            if event.type.startswith(prefix):
+                with self._dirty_lock:
+                    self._dirty.setdefault(event.source, set()).add(kind)
+                return
+
+    def put(self, record: Dict[str, Any]) -> None:
+        self.records[record["id"]] = record
+        if not self._building:
+            self.version += 1
+            self.log.append((self.version, {"op": "set", "node": record}))
+
+    def add_subtree(self, accessible, parent: Optional[int], depth: int, walker: TreeWalker) -> Optional[int]:
+        """Mirrors `accessible` and its subtree, returning its id (None when it is pruned)."""
+        described = walker.describe(accessible, depth)
+        if described is None:
+            return None
+        record, child_count = described
+        walker.nodes += 1
+        node_id = next(self._next_id)
+        self._ids[accessible] = node_id
+        self._objects[node_id] = accessible
+        self._depths[node_id] = depth
+        children = []
+        if depth < self.options["max_depth"]:
+            for child in walker.children(accessible, child_count):
+                child_id = self._ids.get(child)
+                if child_id is None:
+                    child_id = self.add_subtree(child, node_id, depth + 1, walker)
+                if child_id is not None:
+                    children.append(child_id)
+            if walker.exhausted():
+                self._incomplete[node_id] = None
+        # Applications are kept even without visible windows, so that their windows can show up later.
+        record.update(id=node_id, parent=parent, children=children)
+        self.put(record)
+        return node_id
+
+    def remove_subtree(self, node_id: int) -> None:
+        record = self.records.pop(node_id, None)
+        if record is None:
+            return
+        for child_id in record["children"]:
+            self.remove_subtree(child_id)
+        self._ids.pop(self._objects.pop(node_id), None)
+        del self._depths[node_id]
+        self._incomplete.pop(node_id, None)
+        self.version += 1
+        self.log.append((self.version, {"op": "remove", "id": node_id}))
+
+    def detach(self, node_id: int) -> None:
+        """Removes a node that disappeared or is no longer shown, and drops it from its parent's children."""
+        parent = self.records[node_id]["parent"]
+        self.remove_subtree(node_id)
+        if parent in self.records:
+            old = self.records[parent]
+            self.put(dict(old, children=[child for child in old["children"] if child != node_id]))
+
+    def refresh_node(self, node_id: int, subtree: bool = False) -> None:
+        """Re-reads a node's own fields; with subtree=True also its descendants' (a moved window moves them all)."""
+        old = self.records[node_id]
+        described = TreeWalker(self.options).describe(self._objects[node_id], self._depths[node_id])
+        if described is None:
+            self.detach(node_id)
+            return
+        record, _ = described
+        record.update(id=node_id, parent=old["parent"], children=old["children"])
+        if record != old:
+            self.put(record)
+        if subtree:
+            for child_id in old["children"]:
+                if child_id in self.records:
+                    self.refresh_node(child_id, subtree=True)
+
+    def refresh_children(self, node_id: int, walker: TreeWalker) -> None:
+        """
+        Re-lists a node's children: new ones are mirrored, vanished ones removed. When the budget runs out
+        before the end of the list, the children not reached are kept and the node stays incomplete.
+        """
+        old = self.records[node_id]
+        depth = self._depths[node_id]
+        accessible = self._objects[node_id]
+        try:
+            child_count = accessible.childCount
+        except Exception:
+            self.detach(node_id)
+            return
+        if depth >= self.options["max_depth"]:
+            self.refresh_node(node_id)
+            return
+        children = []
+        for child in walker.children(accessible, child_count):
+            child_id = self._ids.get(child)
+            if child_id is None:
+                child_id = self.add_subtree(child, node_id, depth + 1, walker)
+            if child_id is not None:
+                children.append(child_id)
+        if walker.exhausted():
+            children += [child_id for child_id in old["children"] if child_id not in children]
+            self._incomplete[node_id] = None
+        else:
+            for child_id in set(old["children"]) - set(children):
+                self.remove_subtree(child_id)
+            self._incomplete.pop(node_id, None)
+        if children != old["children"]:
+            self.put(dict(self.records[node_id], children=children))
+
+    def refresh(self, budget: float) -> int:
+        """
+        Applies the events received since the last call, then carries on an unfinished build, within
+        `budget` seconds. Returns the number of dirty nodes handled.
+        """
+        walker = self.walker(budget)
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+        handled = 0
+        for accessible, kinds in dirty.items():
+            if walker.exhausted():
+                # Left for the next request; events that came in meanwhile are merged in.
+                with self._dirty_lock:
+                    for pending in list(dirty)[handled:]:
+                        self._dirty.setdefault(pending, set()).update(dirty[pending])
+                break
+            handled += 1
+            node_id = self._ids.get(accessible)
+            if node_id is None:
+                # Not mirrored (new, or so far hidden or pruned): it can only show up in its parent's children.
+                try:
+                    node_id = self._ids.get(accessible.parent)
+                except Exception:
+                    node_id = None
+                if node_id is not None and node_id in self.records:
+                    self.refresh_children(node_id, walker)
+                continue
+            if "children" in kinds and node_id in self.records:
+                self.refresh_children(node_id, walker)
+            if kinds - {"children"} and node_id in self.records:
+                self.refresh_node(node_id, subtree="bounds" in kinds)
+        if self.root not in self.records:
+            self.root = self.add_subtree(pyatspi.Registry.getDesktop(0), None, 0, walker)
+        while self._incomplete and not walker.exhausted():
+            node_id = next(iter(self._incomplete))
+            del self._incomplete[node_id]
+            if node_id in self.records:
+                self.refresh_children(node_id, walker)
+        return handled
+
+    def index(self) -> "TreeIndex":
+        """The lookup index of the current version, rebuilt on first use after a change."""
+        if self._index is None or self._index.version != self.version:
+            self._index = TreeIndex(self.records, self.version)
+        return self._index
+
+    def changes(self, since: Optional[int], epoch: Optional[str]) -> Dict[str, Any]:
+        """
+        The changes after version `since` of this mirror ({"full": False, "changes": [...]}), or the whole
+        mirror ({"full": True, "root", "nodes": [...]}) when the client has no copy, a copy of another mirror
+        (`epoch` differs) or one older than the change log.
+        """
+        reply: Dict[str, Any] = {"epoch": self.epoch, "version": self.version, "complete": self.complete}
+        oldest = self.log[0][0] if self.log else self.version + 1
+        if epoch == self.epoch and since is not None and since <= self.version and since + 1 >= oldest:
+            # Only the last change of each node matters; a node removed and re-added gets a new id.
+            latest: Dict[Any, Dict[str, Any]] = {}
+            for version, change in self.log:
+                if version > since:
+                    key = change["node"]["id"] if change["op"] == "set" else change["id"]
+                    latest.pop(key, None)
+                    latest[key] = change
+            reply.update(full=False, changes=list(latest.values()))
+        else:
+            reply.update(full=True, root=self.root, nodes=list(self.records.values()))
+        return reply
+
+
+class TreeIndex:
+    """
+    Role and name maps over one version of a mirror, for element queries. Candidates come from the maps
+    (a name substring is only compared against the distinct names); states and ancestor paths are then
+    checked on the candidates alone. Matches are returned in tree (pre-)order: node ids follow creation
+    order, which stops being tree order once events add nodes.
+    """
+
+    def __init__(self, records: Dict[int, Dict[str, Any]], version: int):
+        self.records = records
+        self.version = version
+        self.by_role: Dict[str, List[int]] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        for node_id, record in records.items():
+            self.by_role.setdefault(record["role"], []).append(node_id)
+            if record.get("name"):
+                self.by_name.setdefault(record["name"].lower(), []).append(node_id)
+        # The pre-order position of every node reachable from the roots.
+        self.order: Dict[int, int] = {}
+        stack = sorted((node_id for node_id, record in records.items() if record["parent"] not in records),
+                       reverse=True)
+        while stack:
+            node_id = stack.pop()
+            if node_id in self.order or node_id not in records:
+                continue
+            self.order[node_id] = len(self.order)
+            stack.extend(reversed(records[node_id]["children"]))
+
+    def candidates(self, roles: Set[str], name: Optional[str]) -> Set[int]:
+        found: Optional[Set[int]] = None
+        if roles:
+            found = {node_id for role in roles for node_id in self.by_role.get(role, ())}
+        if name is not None:
+            named = {node_id for key, ids in self.by_name.items() if name in key for node_id in ids}
+            found = named if found is None else found & named
+        return set(self.records) if found is None else found
+
+    def ancestors(self, node_id: int) -> List[Dict[str, Any]]:
+        """The ancestors of a node, root first."""
+        chain = []
+        parent = self.records[node_id]["parent"]
+        while parent is not None and parent in self.records:
+            chain.append(self.records[parent])
+            parent = self.records[parent]["parent"]
+        chain.reverse()
+        return chain
+
+    @staticmethod
+    def step_matches(step: Tuple[Optional[str], Optional[str]], record: Dict[str, Any]) -> bool:
+        role, name = step
+        if role is not None and record["role"] != role:
+            return False
+        return name is None or name in (record.get("name") or "").lower()
+
+    def find(self, query: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """The nodes matching `query` (see parse_query) in tree order, at most query["limit"], and the total count."""
+        matches = []
+        count = 0
+        unreached = len(self.records)
+        candidates = self.candidates(query["roles"], query["name"])
+        for node_id in sorted(candidates, key=lambda node_id: (self.order.get(node_id, unreached), node_id)):
+            record = self.records[node_id]
+            if query["states"] and not query["states"] <= set(record.get("states", ())):
+                continue
+            ancestors = self.ancestors(node_id)
+            if query["path"]:
+                # Steps match ancestors in order, not necessarily direct parents (like CSS "a b c").
+                steps = iter(query["path"])
+                step = next(steps)
+                for ancestor in ancestors:
+                    if step is not None and self.step_matches(step, ancestor):
+                        step = next(steps, None)
+                if step is not None:
+                    continue
+            count += 1
+            if len(matches) < query["limit"]:
+                matches.append(self.describe_match(record, ancestors))
+        return matches, count
+
+    @staticmethod
+    def describe_match(record: Dict[str, Any], ancestors: List[Dict[str, Any]]) -> Dict[str, Any]:
+        match = {key: value for key, value in record.items() if key not in ("parent", "children")}
+        if "bbox" in match:
+            x, y, width, height = match["bbox"]
+            match["center"] = [x + width // 2, y + height // 2]
+        match["path"] = [
+            f"{ancestor['role']}[{ancestor['name']}]" if ancestor.get("name") else ancestor["role"]
+            for ancestor in ancestors
+        ]
+        return match
+
+
+def parse_query(args) -> Dict[str, Any]:
+    """
+    Reads element selectors from query parameters: role (comma-separated role names), name (case-insensitive
+    substring), states (comma-separated, all required), path (ancestor steps separated by ">", each
+    "role", "role[name substring]", "[name substring]" or "*") and limit (default 50).
+    """
+    def split(value):
+        return {item.strip().lower() for item in (value or "").split(",") if item.strip()}
+
+    path = []
+    for text in (args.get("path") or "").split(">"):
+        text = text.strip()
+        if not text:
+            continue
+        role, bracket, name = text.partition("[")
+        if bracket and not name.endswith("]"):
+            raise AccessibilityOptionsError(f"Invalid path step {text!r}, expected role[name]")
+        role = role.strip().lower()
+        path.append((None if role in ("", "*") else role, name[:-1].lower() if bracket else None))
+    name = args.get("name")
+    return {
+        "roles": split(args.get("role")),
+        "name": name.lower() if name else None,
+        "states": split(args.get("states")),
+        "path": path,
+        "limit": _parse_int(args, "limit", 50, 1, 10000),
+    }
+
+
+def query_tree(query: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolves `query` on the server against an event-driven mirror with the default walk options, so only
+    the matches travel. The mirror is the queries' own: /accessibility/changes clients with other options
+    neither narrow nor reset it. Returns {"matches": [node fields + "id", "center", "path"], "count",
+    "epoch", "version", "complete", "options" (the walk options searched), "elapsed"}.
+    """
+    if pyatspi is None:
+        raise AccessibilityError("The accessibility tree needs pyatspi (AT-SPI), which is only available on Linux")
+    start = time.monotonic()
+    options = parse_tree_options({})
+
+    def find():
+        mirror, _ = _current_mirror(options, options["budget"])
+        matches, count = mirror.index().find(query)
+        return {"matches": matches, "count": count, "epoch": mirror.epoch, "version": mirror.version,
+                "complete": mirror.complete, "options": _describe_options(mirror.options)}
+
+    reply = _on_event_loop(find, options["budget"])
+    reply["elapsed"] = time.monotonic() - start
+    return reply
+
+
+def _ensure_event_loop() -> None:
+    """AT-SPI only delivers events while its main loop runs; it gets a thread of its own."""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = threading.Thread(target=pyatspi.Registry.start, name="atspi-events", daemon=True)
+            _event_loop.start()
+
+
+def _on_event_loop(fn: Callable[[], Any], budget: float) -> Any:
+    """
+    Runs `fn()` on the event loop thread, which owns every AT-SPI object, and returns its result.
+    Waits at most `budget` + LOOP_GRACE seconds (the work ahead of it in the queue included).
+    """
+    _ensure_event_loop()
+    if threading.current_thread() is _event_loop:
+        return fn()
+    future: Future = Future()
+
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+        return False  # run once
+
+    GLib.idle_add(run)
+    try:
+        return future.result(budget + LOOP_GRACE)
+    except FutureTimeoutError:
+        # Dropped if it has not started yet; otherwise it finishes on the loop and its result is lost.
+        future.cancel()
+        raise AccessibilityTimeoutError("The accessibility event loop is busy or an application is not answering")
+
+
+def _options_key(options: Dict[str, Any]) -> Tuple:
+    """The walk options that shape a mirror (all but the per-request budget), as a dict key."""
+    return tuple(sorted((name, frozenset(value) if isinstance(value, set) else value)
+                        for name, value in options.items() if name != "budget"))
+
+
+def _describe_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """The walk options of a mirror in JSON form."""
+    return {name: sorted(value) if isinstance(value, set) else value
+            for name, value in options.items() if name != "budget"}
+
+
+def _current_mirror(options: Dict[str, Any], budget: float) -> Tuple["TreeMirror", int]:
+    """
+    The mirror of `options`, refreshed within `budget` seconds, and the number of dirty nodes that took.
+    Every option set keeps its own mirror; past MAX_MIRRORS the least recently used one is closed (its
+    clients get a full snapshot of a new one). Runs on the event loop thread.
+    """
+    key = _options_key(options)
+    mirror = _mirrors.get(key)
+    if mirror is not None:
+        _mirrors.move_to_end(key)
+        return mirror, mirror.refresh(budget)
+    while len(_mirrors) >= MAX_MIRRORS:
+        _, evicted = _mirrors.popitem(last=False)
+        evicted.close()
+    mirror = _mirrors[key] = TreeMirror(options, budget)
+    return mirror, 0
+
+
+def tree_changes(options: Dict[str, Any], since: Optional[int], epoch: Optional[str]) -> Dict[str, Any]:
+    """
+    Serves the event-driven mirror of `options` (see TreeMirror.changes), creating it on first use. Clients
+    with different walk options follow different mirrors (see _current_mirror).
+    """
+    if pyatspi is None:
+        raise AccessibilityError("The accessibility tree needs pyatspi (AT-SPI), which is only available on Linux")
+    start = time.monotonic()
+
+    def changes():
+        mirror, refreshed = _current_mirror(options, options["budget"])
+        reply = mirror.changes(since, epoch)
+        reply["size"] = len(mirror.records)
+        return reply, refreshed
+
+    reply, refreshed = _on_event_loop(changes, options["budget"])
+    reply["refreshed"] = refreshed
+    reply["elapsed"] = time.monotonic() - start
+    return reply
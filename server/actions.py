@@ -0,0 +1,260 @@
+"""
+In-process execution of the action dicts defined in env_controller/actions.py (ACTION_SPACE).
+
+The server already has pyautogui imported, so running an action here avoids paying
+interpreter startup and the pyautogui import for every single click.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict
+
+import pyautogui
+
+MOUSE_BUTTONS = ["left", "right", "middle"]
+
+MOVE_MODES = [
+    pyautogui.easeInQuad,
+    pyautogui.easeOutQuad,
+    pyautogui.easeInOutQuad,
+    pyautogui.easeInBounce,
+    pyautogui.easeInElastic,
+]
+
+
+class ActionError(Exception):
+    """Raised when an action dict is malformed, i.e. the client sent something we cannot run."""
+
+
+def get_parameters(action: Dict[str, Any]) -> Dict[str, Any]:
+    """Accepts both {"action_type": ..., "parameters": {...}} and the flat {"action_type": ..., "x": ...} form."""
+    if "parameters" in action:
+        return action["parameters"] or {}
+    return {param: action[param] for param in action if param != "action_type"}
+
+
+def _check_key(key):
+    if not isinstance(key, str) or key.lower() not in pyautogui.KEYBOARD_KEYS:
+        raise ActionError(f"Key must be one of {pyautogui.KEYBOARD_KEYS}")
+
+
+def _check_button(parameters):
+    if "button" in parameters and parameters["button"] not in MOUSE_BUTTONS:
+        raise ActionError(f"Button must be one of {MOUSE_BUTTONS}")
+
+
+def _position(parameters):
+    """Returns {"x": ..., "y": ...} when both are given, {} when neither is, and rejects half a position."""
+    if "x" in parameters and "y" in parameters:
+        return {"x": parameters["x"], "y": parameters["y"]}
+    if "x" in parameters or "y" in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    return {}
+
+
+def _move_to(parameters):
+    if not parameters:
+        pyautogui.moveTo()
+        return
+    if "x" not in parameters or "y" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    pyautogui.moveTo(
+        parameters["x"],
+        parameters["y"],
+        random.uniform(0.5, 1),
+        random.choice(MOVE_MODES),
+    )
+
+
+def _click(parameters):
+    _check_button(parameters)
+    kwargs = _position(parameters)
+    if "button" in parameters:
+        kwargs["button"] = parameters["button"]
+    if "num_clicks" in parameters:
+        kwargs["clicks"] = parameters["num_clicks"]
+    pyautogui.click(**kwargs)
+
+
+def _mouse_down(parameters):
+    _check_button(parameters)
+    pyautogui.mouseDown(button=parameters.get("button", "left"))
+
+
+def _mouse_up(parameters):
+    _check_button(parameters)
+    pyautogui.mouseUp(button=parameters.get("button", "left"))
+
+
+def _right_click(parameters):
+    pyautogui.rightClick(**_position(parameters))
+
+
+def _double_click(parameters):
+    pyautogui.doubleClick(**_position(parameters))
+
+
+def _drag_to(parameters):
+    if "x" not in parameters or "y" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    pyautogui.dragTo(
+        parameters["x"], parameters["y"], duration=1.0, button="left", mouseDownUp=True
+    )
+
+
+def _scroll(parameters):
+    if "dx" not in parameters and "dy" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    if "dx" in parameters:
+        pyautogui.hscroll(parameters["dx"])
+    if "dy" in parameters:
+        pyautogui.vscroll(parameters["dy"])
+
+
+def _typing(parameters):
+    if "text" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    pyautogui.typewrite(parameters["text"])
+
+
+def _press(parameters):
+    if "key" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    _check_key(parameters["key"])
+    pyautogui.press(parameters["key"])
+
+
+def _key_down(parameters):
+    if "key" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    _check_key(parameters["key"])
+    pyautogui.keyDown(parameters["key"])
+
+
+def _key_up(parameters):
+    if "key" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    _check_key(parameters["key"])
+    pyautogui.keyUp(parameters["key"])
+
+
+def _hotkey(parameters):
+    if "keys" not in parameters:
+        raise ActionError(f"Unknown parameters: {parameters}")
+    keys = parameters["keys"]
+    if not isinstance(keys, list):
+        raise ActionError("Keys must be a list of keys")
+    for key in keys:
+        _check_key(key)
+    pyautogui.hotkey(*keys)
+
+
+ACTION_HANDLERS = {
+    "MOVE_TO": _move_to,
+    "CLICK": _click,
+    "MOUSE_DOWN": _mouse_down,
+    "MOUSE_UP": _mouse_up,
+    "RIGHT_CLICK": _right_click,
+    "DOUBLE_CLICK": _double_click,
+    "DRAG_TO": _drag_to,
+    "SCROLL": _scroll,
+    "TYPING": _typing,
+    "PRESS": _press,
+    "KEY_DOWN": _key_down,
+    "KEY_UP": _key_up,
+    "HOTKEY": _hotkey,
+}
+
+NOOP_ACTIONS = ["WAIT", "FAIL", "DONE"]
+
+# Serializes mouse/keyboard input across request threads, so that concurrent actions (or an action
+# landing in the middle of a batch) cannot interleave their events. Reentrant for perform_actions.
+INPUT_LOCK = threading.RLock()
+
+
+def perform_action(action) -> Dict[str, Any]:
+    """
+    Runs a single action and returns a structured result.
+    Raises ActionError for malformed actions; errors raised by pyautogui itself propagate unchanged.
+    """
+    if isinstance(action, str) and action in NOOP_ACTIONS:
+        return {"status": "success", "action_type": action, "elapsed": 0.0}
+    if not isinstance(action, dict) or "action_type" not in action:
+        raise ActionError(f"Invalid action: {action!r}")
+
+    action_type = action["action_type"]
+    if not isinstance(action_type, str):
+        raise ActionError(f"action_type must be a string, got {action_type!r}")
+    start = time.perf_counter()
+    if action_type not in NOOP_ACTIONS:
+        handler = ACTION_HANDLERS.get(action_type)
+        if handler is None:
+            raise ActionError(f"Unknown action type: {action_type}")
+        with INPUT_LOCK:
+            handler(get_parameters(action))
+
+    return {
+        "status": "success",
+        "action_type": action_type,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def _inter_action_delays(delay, count):
+    """
+    A scalar delay is slept between consecutive actions; a list gives the pause before each action.
+    """
+    if isinstance(delay, list):
+        if len(delay) != count:
+            raise ActionError("The delay list must have one entry per action")
+        delays = delay
+    else:
+        delays = [0.0] + [delay or 0.0] * max(count - 1, 0)
+    for pause in delays:
+        if not isinstance(pause, (int, float)) or pause < 0:
+            raise ActionError(f"Invalid delay: {pause!r}")
+    return delays
+
+
+def perform_actions(actions, delay=0.0, stop_on_error: bool = True) -> Dict[str, Any]:
+    """
+    Runs an ordered list of actions and reports status and timing for each of them.
+    With stop_on_error, the actions after the first failure are reported as "skipped".
+    Raises ActionError only when the batch itself is malformed.
+    """
+    if not isinstance(actions, list):
+        raise ActionError("actions must be a list")
+    delays = _inter_action_delays(delay, len(actions))
+
+    results = []
+    failed = False
+    start = time.perf_counter()
+    # The whole batch holds the input lock, so other clients cannot interleave input with it.
+    with INPUT_LOCK:
+        for index, action in enumerate(actions):
+            if failed and stop_on_error:
+                results.append({"index": index, "status": "skipped"})
+                continue
+            if delays[index]:
+                time.sleep(delays[index])
+
+            action_start = time.perf_counter()
+            try:
+                result = perform_action(action)
+            except Exception as e:
+                failed = True
+                result = {
+                    "status": "error",
+                    "action_type": action.get("action_type") if isinstance(action, dict) else action,
+                    "message": str(e),
+                    "elapsed": time.perf_counter() - action_start,
+                }
+            result["index"] = index
+            result["started"] = action_start - start
+            results.append(result)
+
+    return {
+        "status": "error" if failed else "success",
+        "results": results,
+        "elapsed": time.perf_counter() - start,
+    }
@@ -0,0 +1,64 @@
+"""
+Screen capture backends for Linux, selected once at server startup.
+
+- "pyautogui": the original path, pyautogui.screenshot() (an external tool or a full XGetImage per call);
+- "xshm": a persistent MIT-SHM segment, see xshm.py;
+- "auto": xshm when the display supports it, pyautogui otherwise.
+"""
+import logging
+
+import pyautogui
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_BACKENDS = ["auto", "xshm", "pyautogui"]
+
+
+class PyAutoGUICapture:
+    name = "pyautogui"
+
+    def grab(self, bbox=None) -> Image.Image:
+        """Grabs the screen, or only bbox = (left, top, right, bottom)."""
+        if bbox is None:
+            return pyautogui.screenshot()
+        left, top, right, bottom = bbox
+        return pyautogui.screenshot(region=(left, top, right - left, bottom - top))
+
+
+class XShmCapture:
+    name = "xshm"
+
+    def __init__(self):
+        from xshm import XShmGrabber
+
+        self.grabber = XShmGrabber()
+        self.fallback = None
+
+    def grab(self, bbox=None) -> Image.Image:
+        from xshm import XShmError
+
+        if self.fallback is not None:
+            return self.fallback.grab(bbox)
+        try:
+            # Cropping the shared buffer before the RGB conversion means only the region is copied.
+            return Image.fromarray(self.grabber.grab_rgb(bbox))
+        except XShmError as e:
+            # E.g. the segment could not be attached again at a new resolution.
+            logger.warning(f"MIT-SHM capture failed, falling back to pyautogui: {e}")
+            self.grabber.close()
+            self.fallback = PyAutoGUICapture()
+            return self.fallback.grab(bbox)
+
+
+def create_capture_backend(name: str = "auto"):
+    """Creates the requested backend, falling back to pyautogui when MIT-SHM cannot be used."""
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend {name!r}, use one of {CAPTURE_BACKENDS}")
+    if name in ("auto", "xshm"):
+        try:
+            return XShmCapture()
+        except Exception as e:
+            log = logger.warning if name == "xshm" else logger.info
+            log(f"MIT-SHM capture unavailable, falling back to pyautogui: {e}")
+    return PyAutoGUICapture()
@@ -0,0 +1,174 @@
+"""
+Persistent WebSocket channel multiplexing actions, screenshots and pushed frames.
+
+Every client message is a JSON text message; requests carry an "id" that is echoed in the reply.
+
+    {"id": 1, "type": "action", "action": {...}}                    -> {"id": 1, "type": "ack", "result": {...}}
+    {"id": 2, "type": "actions", "actions": [...], "delay": 0.1,
+     "stop_on_error": true}                                          -> {"id": 2, "type": "ack", "result": {...}}
+    {"id": 3, "type": "screenshot", "options": {...}}               -> {"id": 3, "type": "frame", ...} + binary
+    {"id": 4, "type": "subscribe", "fps": 5, "options": {...}}      -> {"id": 4, "type": "ack"}, then pushed frames
+    {"id": 5, "type": "unsubscribe"}                                -> {"id": 5, "type": "ack"}
+    {"id": 6, "type": "ping"}                                       -> {"id": 6, "type": "pong"}
+
+Failures are answered with {"id": ..., "type": "error", "message": ..., "invalid": bool}, where
+"invalid" marks requests that were malformed rather than failing while running.
+A "frame" message ({"format", "mimetype", "width", "height", "mode", "screen_width", "screen_height",
+"bbox", "timestamp", "frame_id", "size"}) is always immediately followed by one binary message with the
+encoded image. Pushed frames have no "id". Server-side problems with a subscription are reported
+as {"type": "event", "event": "capture_error", "message": ...}.
+"""
+import json
+import threading
+import time
+
+from actions import ActionError, perform_action, perform_actions
+from encoding import ScreenshotOptionsError, parse_screenshot_options
+
+
+def options_from_message(options) -> dict:
+    """Screenshot options from a JSON object, in the string form parse_screenshot_options expects."""
+    if not options:
+        return parse_screenshot_options({})
+    if not isinstance(options, dict):
+        raise ScreenshotOptionsError("options must be an object")
+    args = {}
+    for key, value in options.items():
+        if isinstance(value, bool):
+            value = "1" if value else ""
+        elif isinstance(value, (list, tuple)):
+            value = ",".join(str(v) for v in value)
+        args[key] = "" if value is None else str(value)
+    return parse_screenshot_options(args)
+
+
+class WebSocketSession:
+    """
+    Serves one WebSocket connection. `get_frame(options, after)` is the server's frame source returning
+    (framebuffer.Frame or None, capture bbox), so pushed frames share the background capture and its
+    encodings with every other viewer. Sends are serialized so that a frame header and its binary payload
+    are never interleaved.
+    """
+
+    def __init__(self, ws, get_frame, logger):
+        self.ws = ws
+        self.get_frame = get_frame
+        self.logger = logger
+        self._send_lock = threading.Lock()
+        self._subscription = None  # (stop event, thread)
+
+    def send_json(self, message):
+        with self._send_lock:
+            self.ws.send(json.dumps(message))
+
+    def send_frame(self, header, options, after=None) -> int:
+        """Sends the current frame (or the first one after frame id `after`) and returns its frame id."""
+        frame, bbox = self.get_frame(options, after)
+        if frame is None:
+            raise RuntimeError("Screen capture is not supported on this platform")
+        screen_width, screen_height = frame.screen_size
+        encoded = frame.encoded(options, bbox)
+        data = encoded["data"]
+        header.update({
+            "type": "frame",
+            "frame_id": frame.frame_id,
+            "timestamp": frame.timestamp,
+            "format": options["format"],
+            "mimetype": encoded["mimetype"],
+            "width": encoded["width"],
+            "height": encoded["height"],
+            "mode": encoded["mode"],
+            "screen_width": screen_width,
+            "screen_height": screen_height,
+            "bbox": bbox,
+            "size": len(data),
+        })
+        with self._send_lock:
+            self.ws.send(json.dumps(header))
+            self.ws.send(data)
+        return frame.frame_id
+
+    def run(self):
+        try:
+            while True:
+                message = self.ws.receive()
+                if message is None:
+                    break
+                self.handle(message)
+        finally:
+            self.unsubscribe()
+
+    def handle(self, raw):
+        try:
+            message = json.loads(raw)
+            if not isinstance(message, dict):
+                raise ValueError("messages must be JSON objects")
+        except ValueError as e:
+            self.send_json({"type": "error", "message": f"Invalid message: {e}", "invalid": True})
+            return
+
+        request_id = message.get("id")
+        kind = message.get("type")
+        try:
+            if kind == "action":
+                self.send_json({"id": request_id, "type": "ack", "result": perform_action(message.get("action"))})
+            elif kind == "actions":
+                result = perform_actions(
+                    message.get("actions"),
+                    delay=message.get("delay", 0.0),
+                    stop_on_error=message.get("stop_on_error", True),
+                )
+                self.send_json({"id": request_id, "type": "ack", "result": result})
+            elif kind == "screenshot":
+                self.send_frame({"id": request_id}, options_from_message(message.get("options")))
+            elif kind == "subscribe":
+                fps = float(message.get("fps", 5))
+                if not 0 < fps <= 60:
+                    raise ScreenshotOptionsError(f"fps must be in (0, 60], got {fps}")
+                self.subscribe(fps, options_from_message(message.get("options")))
+                self.send_json({"id": request_id, "type": "ack"})
+            elif kind == "unsubscribe":
+                self.unsubscribe()
+                self.send_json({"id": request_id, "type": "ack"})
+            elif kind == "ping":
+                self.send_json({"id": request_id, "type": "pong"})
+            else:
+                raise ValueError(f"Unknown message type: {kind!r}")
+        except (ActionError, ScreenshotOptionsError, ValueError) as e:
+            self.send_json({"id": request_id, "type": "error", "message": str(e), "invalid": True})
+        except Exception as e:
+            self.logger.error(f"WebSocket request {kind} failed: {e}")
+            self.send_json({"id": request_id, "type": "error", "message": str(e), "invalid": False})
+
+    def subscribe(self, fps, options):
+        self.unsubscribe()
+        stop = threading.Event()
+        thread = threading.Thread(target=self._push_frames, args=(stop, fps, options), daemon=True)
+        self._subscription = (stop, thread)
+        thread.start()
+
+    def unsubscribe(self):
+        if self._subscription is not None:
+            stop, thread = self._subscription
+            self._subscription = None
+            stop.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _push_frames(self, stop, fps, options):
+        interval = 1.0 / fps
+        frame_id = None
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                frame_id = self.send_frame({}, options, after=frame_id)
+            except Exception as e:
+                if stop.is_set():
+                    break
+                self.logger.warning(f"Stopping frame push: {e}")
+                try:
+                    self.send_json({"type": "event", "event": "capture_error", "message": str(e)})
+                except Exception:
+                    pass
+                break
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
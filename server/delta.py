@@ -0,0 +1,113 @@
+"""
+Dirty-tile delta screenshots.
+
+The server remembers the last frame it sent to each client. When a client asks for the frame
+following `since=<frame_id>` and that is still the remembered frame, only the tiles that changed
+are encoded; otherwise a keyframe (one tile covering the whole frame) is sent. Horizontally
+adjacent dirty tiles are merged into one rectangle to keep the per-tile overhead down.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from encoding import encode_screenshot
+
+DEFAULT_TILE_SIZE = 64
+
+
+def dirty_rects(previous: np.ndarray, current: np.ndarray, tile: int) -> List[Tuple[int, int, int, int]]:
+    """Returns the changed areas as (x, y, width, height) rectangles aligned on a `tile` grid."""
+    height, width = current.shape[:2]
+    diff = previous != current
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+
+    rows, cols = -(-height // tile), -(-width // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+    padded[:height, :width] = diff
+    grid = padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+    rects = []
+    for row in range(rows):
+        col = 0
+        while col < cols:
+            if not grid[row, col]:
+                col += 1
+                continue
+            start = col
+            while col < cols and grid[row, col]:
+                col += 1
+            x, y = start * tile, row * tile
+            rects.append((x, y, min(col * tile, width) - x, min(tile, height - y)))
+    return rects
+
+
+class DeltaEncoder:
+    """Per-client last-frame store; keeps at most `max_clients` frames (least recently used first out)."""
+
+    def __init__(self, max_clients: int = 16):
+        self.max_clients = max_clients
+        self._frames = OrderedDict()  # client -> (frame_id, options key, frame)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _options_key(options) -> Tuple:
+        return tuple(sorted(options.items()))
+
+    def encode(self, client: str, since: int, image: Image.Image, options, tile: int = DEFAULT_TILE_SIZE):
+        """
+        Encodes `image` for `client` relative to the frame `since`.
+        Returns (meta, payload); the tile blobs are concatenated in the payload in the order of meta["tiles"].
+        """
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        frame = np.asarray(image)
+        key = self._options_key(options)
+        with self._lock:
+            frame_id = next(self._ids)
+            previous = self._frames.get(client)
+            self._frames[client] = (frame_id, key, frame)
+            self._frames.move_to_end(client)
+            while len(self._frames) > self.max_clients:
+                self._frames.popitem(last=False)
+
+        keyframe = (
+            previous is None
+            or previous[0] != since
+            or previous[1] != key
+            or previous[2].shape != frame.shape
+        )
+        if keyframe:
+            rects = [(0, 0, frame.shape[1], frame.shape[0])]
+        else:
+            rects = dirty_rects(previous[2], frame, tile)
+
+        tiles: List[Dict[str, Any]] = []
+        blobs = []
+        offset = 0
+        mimetype = None
+        for x, y, width, height in rects:
+            region = image if keyframe else image.crop((x, y, x + width, y + height))
+            data, mimetype, _ = encode_screenshot(region, options)
+            tiles.append({"x": x, "y": y, "width": width, "height": height, "offset": offset, "length": len(data)})
+            blobs.append(data)
+            offset += len(data)
+
+        meta = {
+            "frame_id": frame_id,
+            "base_id": None if keyframe else since,
+            "keyframe": keyframe,
+            "width": frame.shape[1],
+            "height": frame.shape[0],
+            "mode": image.mode,
+            "tile": tile,
+            "format": options["format"],
+            "mimetype": mimetype,
+            "tiles": tiles,
+        }
+        return meta, b"".join(blobs)
@@ -0,0 +1,185 @@
+"""
+Background screen capture shared by every viewer.
+
+When enabled (fps > 0), a CaptureLoop thread grabs the full screen at the target rate into a small
+ring buffer. Requests are served from the freshest frame instead of capturing themselves, so N viewers
+cost one capture. Each frame also caches its encodings per (options, capture area), so viewers asking
+for the same format and size share one encode as well.
+
+The loop only runs while somebody is watching: every consumer call marks demand, and after
+`idle_after` seconds without any the thread sleeps until the next request.
+
+The thread is started by the first consumer call, not by set_fps: gunicorn configures the app in its
+master process and forks the worker, which would inherit a thread object without the thread.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+from encoding import encode_screenshot, transform_screenshot
+
+_frame_ids = itertools.count(1)
+
+
+def next_frame_id() -> int:
+    """Frame ids are unique across the loop and synchronous captures."""
+    return next(_frame_ids)
+
+
+class Frame:
+    """One captured image: the full screen (bbox None) or the area `bbox` of a synchronous capture."""
+
+    def __init__(self, image: Image.Image, screen_size: Tuple[int, int], bbox=None, timestamp: Optional[float] = None):
+        self.frame_id = next_frame_id()
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.image = image
+        self.screen_size = screen_size
+        self.bbox = bbox
+        self._encoded: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def region(self, bbox) -> Image.Image:
+        """The part of the frame covering `bbox` (the whole frame when bbox is None)."""
+        if bbox is None or self.bbox is not None:
+            return self.image
+        return self.image.crop(bbox)
+
+    def encoded(self, options, bbox) -> Dict[str, Any]:
+        """
+        The frame area `bbox`, transformed and encoded with `options`, computed once per distinct request:
+        {"data", "mimetype", "headers", "width", "height", "mode"}.
+        """
+        key = (tuple(sorted(options.items())), bbox)
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is None:
+                image = transform_screenshot(self.region(bbox), options)
+                data, mimetype, headers = encode_screenshot(image, options)
+                encoded = {
+                    "data": data,
+                    "mimetype": mimetype,
+                    "headers": headers,
+                    "width": image.width,
+                    "height": image.height,
+                    "mode": "RGB" if image.mode not in ("RGB", "L") else image.mode,
+                }
+                self._encoded[key] = encoded
+            return encoded
+
+
+class CaptureLoop:
+    def __init__(
+        self,
+        capture: Callable[[], Tuple[Optional[Image.Image], Tuple[int, int]]],
+        fps: float = 0.0,
+        buffer_size: int = 4,
+        idle_after: float = 5.0,
+        logger=None,
+    ):
+        """`capture()` grabs the full screen and returns (image or None, screen size)."""
+        self.capture = capture
+        self.idle_after = idle_after
+        self.logger = logger
+        self.frames = deque(maxlen=buffer_size)
+        self.captured = 0
+        self._fps = 0.0
+        self._last_demand = 0.0
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.set_fps(fps)
+
+    @property
+    def enabled(self) -> bool:
+        return self._fps > 0
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    def set_fps(self, fps: float) -> None:
+        """Changes the capture rate; 0 disables the loop (requests capture synchronously again)."""
+        if not 0 <= fps <= 60:
+            raise ValueError(f"fps must be in [0, 60], got {fps}")
+        self._fps = fps
+        self._wake.set()
+
+    def _ensure_thread(self) -> None:
+        # is_alive() is False for a thread inherited through fork(), so a forked worker starts its own.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="capture-loop", daemon=True)
+                self._thread.start()
+
+    @property
+    def watched(self) -> bool:
+        return time.monotonic() - self._last_demand < self.idle_after
+
+    def touch(self) -> None:
+        """Marks that somebody wants frames, waking the loop (and starting it in this process) if needed."""
+        self._last_demand = time.monotonic()
+        if self.enabled:
+            self._ensure_thread()
+        self._wake.set()
+
+    def latest(self, timeout: float = 5.0) -> Optional[Frame]:
+        """
+        The freshest frame. When the buffer is older than two capture intervals (the loop was idle),
+        waits for the next capture instead of serving a stale screen.
+        """
+        self.touch()
+        with self._condition:
+            newest = self.frames[-1] if self.frames else None
+            if newest is not None and time.time() - newest.timestamp <= 2.0 / max(self._fps, 1e-3):
+                return newest
+        return self.next_frame(newest.frame_id if newest else 0, timeout)
+
+    def next_frame(self, after: int, timeout: float = 5.0) -> Optional[Frame]:
+        """The first frame captured after frame id `after`; the freshest one on timeout (None if there is none)."""
+        self.touch()
+        with self._condition:
+            self._condition.wait_for(lambda: self.frames and self.frames[-1].frame_id > after, timeout)
+            return self.frames[-1] if self.frames else None
+
+    def status(self) -> Dict[str, Any]:
+        newest = self.frames[-1] if self.frames else None
+        return {
+            "fps": self._fps,
+            "active": self.enabled and self.watched,
+            "captured": self.captured,
+            "buffer_size": self.frames.maxlen,
+            "idle_after": self.idle_after,
+            "latest_frame_id": newest.frame_id if newest else None,
+            "latest_timestamp": newest.timestamp if newest else None,
+        }
+
+    def _run(self):
+        while True:
+            if not self.enabled or not self.watched:
+                self._wake.clear()
+                # Re-check after clearing, so that a touch() in between is not lost.
+                if not self.enabled or not self.watched:
+                    self._wake.wait()
+                continue
+
+            started = time.monotonic()
+            try:
+                image, screen_size = self.capture()
+                if image is not None:
+                    frame = Frame(image, screen_size)
+                    with self._condition:
+                        self.frames.append(frame)
+                        self.captured += 1
+                        self._condition.notify_all()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.warning(f"Background capture failed: {e}")
+            if self.enabled:
+                time.sleep(max(0.0, 1.0 / self._fps - (time.monotonic() - started)))
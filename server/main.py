@@ -1,11 +1,18 @@
 """
 from osworld
 """
-from flask import Flask, request, jsonify, send_file, abort
+from flask import Flask, Response, request, jsonify, abort
 import platform
 import os
 import shlex
 import subprocess
+import tempfile
+import argparse
+import atexit
+import gzip
+import json
+import threading
+import time
 from typing import Any
 import pyautogui
 from PIL import Image, ImageGrab
@@ -48,17 +55,62 @@ else:
     Accessible = None
     BaseWrapper = Any
 from pyxcursor import Xcursor
+from capture import CAPTURE_BACKENDS, create_capture_backend
+from actions import ActionError, perform_action, perform_actions
+from encoding import (
+    ENVELOPE_MIMETYPE,
+    ScreenshotOptionsError,
+    pack_envelope,
+    parse_screenshot_options,
+    transform_screenshot,
+)
+from delta import DEFAULT_TILE_SIZE, DeltaEncoder
+from channel import WebSocketSession, options_from_message
+from framebuffer import CaptureLoop, Frame
+from stability import parse_stability_options, wait_for_stable
+from accessibility import (
+    AccessibilityError,
+    AccessibilityOptionsError,
+    dump_tree,
+    parse_query,
+    parse_tree_options,
+    query_tree,
+    tree_changes,
+)
+from recording import RecordingError, RecordingManager, RecordingOptionsError, parse_recording_options
+from serving import SERVERS, BoundedExecutor, QueueFullError, run as run_server
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
 
 pyautogui.PAUSE = 0
 pyautogui.DARWIN_CATCH_UP_TIME = 0
+pyautogui.FAILSAFE = False
 
 TIMEOUT = 1800  # seconds
+EXECUTE_TIMEOUT = 120  # seconds, per /execute command
+
+# Concurrency limits, set with the command line flags (or the environment when run under an external WSGI server).
+# /execute commands run in a bounded pool and are refused with 429 once it is full; at most CAPTURE_QUEUE
+# screenshot requests wait for the (serialized) screen capture before further ones get a 503.
+execute_pool = BoundedExecutor(
+    int(os.environ.get("EXECUTE_WORKERS", 8)), int(os.environ.get("EXECUTE_QUEUE", 16)), name="execute")
+capture_slots = threading.BoundedSemaphore(int(os.environ.get("CAPTURE_QUEUE", 8)))
+capture_lock = threading.Lock()
 
 logger = app.logger
-recording_process = None  # fixme: this is a temporary solution for recording, need to be changed to support multiple-process
-recording_path = "/tmp/recording.mp4"
+delta_encoder = DeltaEncoder()
+# Named ffmpeg screen recordings, see recording.py; stopped cleanly when the server exits.
+recordings = RecordingManager(
+    os.environ.get("RECORDING_DIR", os.path.join(tempfile.gettempdir(), "recordings")),
+    max_sessions=int(os.environ.get("RECORDING_MAX", 4)),
+    logger=logger,
+)
+atexit.register(recordings.stop_all)
 
 @app.route('/setup/execute', methods=['POST'])
 @app.route('/execute', methods=['POST'])
@@ -76,21 +128,27 @@ def execute_command():
         if arg.startswith("~/"):
             command[i] = os.path.expanduser(arg)
 
+    if platform_name == "Windows":
+        flags = subprocess.CREATE_NO_WINDOW
+    else:
+        flags = 0
+
     # Execute the command without any safety checks.
     try:
-        if platform_name == "Windows":
-            flags = subprocess.CREATE_NO_WINDOW
-        else:
-            flags = 0
-        result = subprocess.run(
+        future = execute_pool.submit(
+            subprocess.run,
             command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=shell,
             text=True,
-            timeout=120,
+            timeout=EXECUTE_TIMEOUT,
             creationflags=flags,
         )
+    except QueueFullError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 429, {'Retry-After': '1'}
+    try:
+        result = future.result()
         return jsonify({
             'status': 'success',
             'output': result.stdout,
@@ -103,15 +161,151 @@ def execute_command():
             'message': str(e)
         }), 500
 
-@app.route('/screenshot', methods=['GET'])
-def capture_screen_with_cursor():
-    # fixme: when running on virtual machines, the cursor is not captured, don't know why
+@app.route('/action', methods=['POST'])
+def execute_action():
+    # Runs an ACTION_SPACE dict on the already-imported pyautogui instead of spawning `python -c`.
+    action = request.get_json(silent=True)
+    if action is None:
+        return jsonify({'status': 'error', 'message': 'Request body must be a JSON action'}), 400
+    try:
+        return jsonify(perform_action(action))
+    except ActionError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Failed to execute action {action}: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/actions/batch', methods=['POST'])
+def execute_actions():
+    # Runs an ordered list of actions in one round-trip, with per-action status and timing.
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Request body must be a JSON object'}), 400
+    try:
+        return jsonify(perform_actions(
+            data.get('actions'),
+            delay=data.get('delay', 0.0),
+            stop_on_error=data.get('stop_on_error', True),
+        ))
+    except ActionError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
-    file_path = os.path.join(os.path.dirname(__file__), "screenshots", "screenshot.png")
-    user_platform = platform.system()
+# Linux capture backend, chosen with --capture-backend (or $CAPTURE_BACKEND when run under a WSGI server)
+capture_backend_name = os.environ.get("CAPTURE_BACKEND", "auto")
+_screen_capture = None
+_screen_capture_lock = threading.Lock()
+
+
+def get_screen_capture():
+    global _screen_capture
+    with _screen_capture_lock:
+        if _screen_capture is None:
+            _screen_capture = create_capture_backend(capture_backend_name)
+            logger.info(f"Using the {_screen_capture.name} capture backend")
+        return _screen_capture
 
-    # Ensure the screenshots directory exists
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+_xcursor = None
+
+
+def get_xcursor():
+    # One display connection for the whole server, so the cursor cache survives across requests.
+    global _xcursor
+    if _xcursor is None:
+        _xcursor = Xcursor()
+    return _xcursor
+
+
+def get_window_bbox(window_id):
+    """Screen rectangle (left, top, right, bottom) of a native window id (X11 window / HWND / CGWindowID)."""
+    if platform_name == "Linux":
+        from Xlib import display as xdisplay
+        from Xlib.error import XError
+
+        display = xdisplay.Display()
+        try:
+            window = display.create_resource_object('window', window_id)
+            geometry = window.get_geometry()
+            origin = display.screen().root.translate_coords(window, 0, 0)
+            return origin.x, origin.y, origin.x + geometry.width, origin.y + geometry.height
+        except XError as e:
+            raise ScreenshotOptionsError(f"Unknown window {window_id:#x}: {e}")
+        finally:
+            display.close()
+    elif platform_name == "Windows":
+        if not win32gui.IsWindow(window_id):
+            raise ScreenshotOptionsError(f"Unknown window {window_id}")
+        return win32gui.GetWindowRect(window_id)
+    elif platform_name == "Darwin":
+        windows = Quartz.CGWindowListCopyWindowInfo(Quartz.kCGWindowListOptionIncludingWindow, window_id)
+        if not windows:
+            raise ScreenshotOptionsError(f"Unknown window {window_id}")
+        bounds = windows[0]["kCGWindowBounds"]
+        left, top = int(bounds["X"]), int(bounds["Y"])
+        return left, top, left + int(bounds["Width"]), top + int(bounds["Height"])
+    raise ScreenshotOptionsError(f"Window capture is not supported on {platform_name}")
+
+
+def resolve_capture_bbox(options):
+    """The capture rectangle requested by the bbox/window options, clipped to the screen; None for full screen."""
+    bbox = options["bbox"]
+    if options["window"] is not None:
+        bbox = get_window_bbox(options["window"])
+    if bbox is None:
+        return None
+    screen_width, screen_height = pyautogui.size()
+    left, top = max(0, bbox[0]), max(0, bbox[1])
+    right, bottom = min(screen_width, bbox[2]), min(screen_height, bbox[3])
+    if right <= left or bottom <= top:
+        raise ScreenshotOptionsError(f"Capture area {bbox} is off screen")
+    return left, top, right, bottom
+
+
+def capture_screenshot(options):
+    """
+    Captures the area selected by the options (whole screen, bbox or window) with the cursor.
+    Returns (image, (screen width, screen height), bbox or None); image is None on unsupported platforms.
+    """
+    bbox = resolve_capture_bbox(options)
+    # One capture at a time: the capture backends and the cursor display connection are not thread-safe.
+    with capture_lock:
+        screenshot = grab_screen_with_cursor(bbox)
+    if screenshot is None:
+        return None, None, bbox
+    screen_size = tuple(pyautogui.size()) if bbox is not None else screenshot.size
+    return screenshot, screen_size, bbox
+
+
+def capture_full_screen():
+    screenshot, screen_size, _ = capture_screenshot({'bbox': None, 'window': None})
+    return screenshot, screen_size
+
+
+# Optional background capture, see framebuffer.py; off (0 fps) unless --capture-fps / $CAPTURE_FPS is set.
+capture_loop = CaptureLoop(capture_full_screen, fps=float(os.environ.get("CAPTURE_FPS", 0)), logger=logger)
+
+
+def get_frame(options, after=None):
+    """
+    Returns (frame, bbox): a Frame holding the area selected by the options, and that area (None for the
+    full screen). With the capture loop running this is its freshest frame, or with `after` the first one
+    captured after that frame id; otherwise the screen is captured now. The frame is None on unsupported platforms.
+    """
+    if capture_loop.enabled:
+        bbox = resolve_capture_bbox(options)
+        frame = capture_loop.latest() if after is None else capture_loop.next_frame(after)
+        return frame, bbox
+    screenshot, screen_size, bbox = capture_screenshot(options)
+    if screenshot is None:
+        return None, bbox
+    return Frame(screenshot, screen_size, bbox), bbox
+
+
+def grab_screen_with_cursor(bbox=None):
+    # fixme: when running on virtual machines, the cursor is not captured, don't know why
+    # bbox = (left, top, right, bottom) restricts the capture to that rectangle of the screen.
+    user_platform = platform.system()
+    origin_x, origin_y = (bbox[0], bbox[1]) if bbox else (0, 0)
 
     # fixme: This is a temporary fix for the cursor not being captured on Windows and Linux
     if user_platform == "Windows":
@@ -146,35 +340,445 @@ def capture_screen_with_cursor():
 
         ratio = ctypes.windll.shcore.GetScaleFactorForDevice(0) / 100
 
-        img = ImageGrab.grab(bbox=None, include_layered_windows=True)
+        img = ImageGrab.grab(bbox=bbox, include_layered_windows=True)
 
         try:
             cursor, (hotspotx, hotspoty) = get_cursor()
 
             pos_win = win32gui.GetCursorPos()
-            pos = (round(pos_win[0]*ratio - hotspotx), round(pos_win[1]*ratio - hotspoty))
+            pos = (round(pos_win[0]*ratio - hotspotx) - origin_x, round(pos_win[1]*ratio - hotspoty) - origin_y)
 
             img.paste(cursor, pos, cursor)
         except Exception as e:
             logger.warning(f"Failed to capture cursor on Windows, screenshot will not have a cursor. Error: {e}")
 
-        img.save(file_path)
+        return img
     elif user_platform == "Linux":
-        cursor_obj = Xcursor()
-        imgarray = cursor_obj.getCursorImageArrayFast()
+        imgarray, (hotspotx, hotspoty) = get_xcursor().getCursorImage()
         cursor_img = Image.fromarray(imgarray)
-        screenshot = pyautogui.screenshot()
+        screenshot = get_screen_capture().grab(bbox)
         cursor_x, cursor_y = pyautogui.position()
-        screenshot.paste(cursor_img, (cursor_x, cursor_y), cursor_img)
-        screenshot.save(file_path)
+        screenshot.paste(cursor_img, (cursor_x - hotspotx - origin_x, cursor_y - hotspoty - origin_y), cursor_img)
+        return screenshot
     elif user_platform == "Darwin":  # (Mac OS)
-        # Use the screencapture utility to capture the screen with the cursor
-        subprocess.run(["screencapture", "-C", file_path])
+        # Use the screencapture utility to capture the screen with the cursor.
+        # It can only write to a file, so give every request its own.
+        fd, file_path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            region = []
+            if bbox:
+                region = ["-R", f"{bbox[0]},{bbox[1]},{bbox[2] - bbox[0]},{bbox[3] - bbox[1]}"]
+            subprocess.run(["screencapture", "-C", *region, file_path])
+            with Image.open(file_path) as img:
+                img.load()
+                return img
+        finally:
+            os.remove(file_path)
     else:
         logger.warning(f"The platform you're using ({user_platform}) is not currently supported")
+        return None
+
+
+@app.route('/screenshot', methods=['GET'])
+def capture_screen_with_cursor():
+    # Optional query parameters: width, height, scale, format (png/jpeg/webp/qoi/raw/raw-lz4/raw-zstd,
+    # or negotiated through the Accept header), quality, png_level, grayscale, and the capture area
+    # bbox=left,top,right,bottom or window=<id>.
+    # With since=<frame_id> (0 for the first request), only the tiles changed since that frame are sent;
+    # `client` identifies the caller's frame history and `tile` sets the tile size.
+    try:
+        options = parse_screenshot_options(request.args, request.accept_mimetypes)
+        since = request.args.get('since')
+        if since is not None:
+            since = int(since or 0)
+            tile = int(request.args.get('tile', DEFAULT_TILE_SIZE))
+            if not 8 <= tile <= 1024:
+                raise ScreenshotOptionsError(f"tile must be in [8, 1024], got {tile}")
+    except (ScreenshotOptionsError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if not capture_slots.acquire(blocking=False):
+        return jsonify({'status': 'error', 'message': 'Too many screenshot requests waiting'}), 503, {'Retry-After': '1'}
+    try:
+        frame, bbox = get_frame(options)
+    except ScreenshotOptionsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    finally:
+        capture_slots.release()
+
+    if frame is None:
+        abort(500)
+    if since is not None:
+        client = request.args.get('client') or request.remote_addr
+        screenshot = transform_screenshot(frame.region(bbox), options)
+        meta, payload = delta_encoder.encode(client, since, screenshot, options, tile)
+        meta['screen_width'], meta['screen_height'] = frame.screen_size
+        meta['bbox'] = bbox
+        return frame_response(frame, bbox, pack_envelope(meta, payload), ENVELOPE_MIMETYPE, {})
+    # Encodings are cached on the frame, so concurrent viewers of a background-captured frame share one.
+    encoded = frame.encoded(options, bbox)
+    return frame_response(frame, bbox, encoded['data'], encoded['mimetype'], encoded['headers'])
+
+
+def frame_response(frame, bbox, data, mimetype, headers):
+    response = Response(data, mimetype=mimetype, headers=headers)
+    response.headers['Vary'] = 'Accept'
+    # The native screen size lets clients map coordinates of a downscaled screenshot back to the screen.
+    screen_width, screen_height = frame.screen_size
+    response.headers['X-Screen-Width'] = str(screen_width)
+    response.headers['X-Screen-Height'] = str(screen_height)
+    if bbox is not None:
+        response.headers['X-Capture-Bbox'] = ','.join(str(v) for v in bbox)
+    response.headers['X-Frame-Timestamp'] = repr(frame.timestamp)
+    return response
+
+
+@app.route('/screenshot/stable', methods=['GET'])
+def capture_stable_screen():
+    # Waits until the screen (or the bbox/window area) stops changing and returns that screenshot, see
+    # stability.py. Query parameters: timeout (s), threshold (fraction of changed pixels), quiet_ms,
+    # interval_ms, plus the /screenshot options. X-Stable is 0 when the timeout ran out first;
+    # X-Stable-Elapsed gives the time waited.
+    try:
+        options = parse_screenshot_options(request.args, request.accept_mimetypes)
+        stability = parse_stability_options(request.args)
+        result = wait_for_stable(get_frame, options, **stability)
+    except ScreenshotOptionsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    frame, bbox = result['frame'], result['bbox']
+    if frame is None:
+        abort(500)
+    encoded = frame.encoded(options, bbox)
+    response = frame_response(frame, bbox, encoded['data'], encoded['mimetype'], encoded['headers'])
+    response.headers['X-Stable'] = '1' if result['stable'] else '0'
+    response.headers['X-Stable-Elapsed'] = f"{result['elapsed']:.3f}"
+    response.headers['X-Stable-Frames'] = str(result['frames'])
+    return response
+
+
+@app.route('/step', methods=['POST'])
+def step():
+    # One agent step in one round-trip: run an action (or a list of actions), optionally wait, then observe.
+    # Body: {"action": {...} | [...], "delay": <between listed actions>, "observe": {
+    #            "wait": seconds | "stable",
+    #            "stable": {"timeout", "threshold", "quiet_ms", "interval_ms"},
+    #            "screenshot": {/screenshot options} | false}}
+    # The reply is an envelope (see encoding.pack_envelope) whose metadata holds "result", "cursor",
+    # "timing", "stable" (with wait="stable") and "screenshot" (frame info, or null), followed by the
+    # encoded screenshot. An action that fails while running is reported in "result"; the screen is still observed.
+    data = request.get_json(silent=True)
+    try:
+        if not isinstance(data, dict) or 'action' not in data:
+            raise ValueError("Request body must be a JSON object with an action")
+        observe = data.get('observe') or {}
+        if not isinstance(observe, dict):
+            raise ValueError("observe must be an object")
+        wait = observe.get('wait')
+        if wait is None:
+            wait = 0
+        if wait != 'stable' and (isinstance(wait, bool) or not isinstance(wait, (int, float))
+                                 or not 0 <= wait <= TIMEOUT):
+            raise ValueError(f"wait must be a number of seconds or \"stable\", got {wait!r}")
+        stability = None
+        if wait == 'stable':
+            stable_args = observe.get('stable') or {}
+            if not isinstance(stable_args, dict):
+                raise ValueError("stable must be an object")
+            stability = parse_stability_options({key: str(value) for key, value in stable_args.items()})
+        screenshot_args = observe.get('screenshot', {})
+        options = None if screenshot_args is False else options_from_message(screenshot_args)
+        if options is not None:
+            resolve_capture_bbox(options)  # reject unknown windows before acting
+    except (ScreenshotOptionsError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    started = time.perf_counter()
+    action = data['action']
+    try:
+        if isinstance(action, list):
+            result = perform_actions(action, delay=data.get('delay', 0.0), stop_on_error=data.get('stop_on_error', True))
+        else:
+            result = perform_action(action)
+    except ActionError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Failed to execute action {action}: {e}")
+        result = {'status': 'error', 'message': str(e)}
+    acted = time.perf_counter()
+
+    meta = {'result': result, 'screenshot': None}
+    frame = bbox = None
+    if stability is not None:
+        # The settle check watches the observed area, or the whole screen when no screenshot is wanted.
+        settled = wait_for_stable(get_frame, options or {'bbox': None, 'window': None}, **stability)
+        meta['stable'] = settled['stable']
+        if options is not None:
+            frame, bbox = settled['frame'], settled['bbox']
+    elif wait:
+        time.sleep(wait)
+    waited = time.perf_counter()
+
+    payload = b''
+    if options is not None:
+        try:
+            if frame is None:
+                frame, bbox = get_frame(options)
+        except ScreenshotOptionsError as e:
+            frame, meta['screenshot_error'] = None, str(e)  # e.g. the window closed because of the action
+        if frame is not None:
+            encoded = frame.encoded(options, bbox)
+            payload = encoded['data']
+            screen_width, screen_height = frame.screen_size
+            meta['screenshot'] = {
+                'format': options['format'],
+                'mimetype': encoded['mimetype'],
+                'width': encoded['width'],
+                'height': encoded['height'],
+                'mode': encoded['mode'],
+                'screen_width': screen_width,
+                'screen_height': screen_height,
+                'bbox': bbox,
+                'timestamp': frame.timestamp,
+            }
+    cursor_x, cursor_y = pyautogui.position()
+    meta['cursor'] = [cursor_x, cursor_y]
+    finished = time.perf_counter()
+    meta['timing'] = {
+        'action': acted - started,
+        'wait': waited - acted,
+        'observe': finished - waited,
+        'total': finished - started,
+    }
+    return Response(pack_envelope(meta, payload), mimetype=ENVELOPE_MIMETYPE)
+
+
+@app.route('/stream', methods=['GET'])
+def stream_screen():
+    # Live MJPEG (multipart/x-mixed-replace) stream. Query parameters: fps (default 5), and the
+    # /screenshot options width, height, scale, quality, grayscale, bbox, window. Every part carries the
+    # native screen size, the capture area and the capture time in X-Screen-Width / X-Screen-Height /
+    # X-Capture-Bbox / X-Frame-Timestamp.
+    args = request.args.to_dict()
+    args['format'] = 'jpeg'
+    try:
+        options = parse_screenshot_options(args)
+        fps = float(args.get('fps', 5))
+        if not 0 < fps <= 60:
+            raise ScreenshotOptionsError(f"fps must be in (0, 60], got {fps}")
+        resolve_capture_bbox(options)  # reject unknown windows before starting the stream
+    except (ScreenshotOptionsError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    def generate():
+        interval = 1.0 / fps
+        frame_id = None
+        while True:
+            started = time.monotonic()
+            try:
+                frame, bbox = get_frame(options, after=frame_id)
+            except ScreenshotOptionsError:
+                return  # the captured window went away
+            if frame is None:
+                return
+            frame_id = frame.frame_id
+            screen_width, screen_height = frame.screen_size
+            encoded = frame.encoded(options, bbox)
+            data, mimetype = encoded['data'], encoded['mimetype']
+            bbox_header = b""
+            if bbox is not None:
+                bbox_header = b"X-Capture-Bbox: " + ",".join(str(v) for v in bbox).encode() + b"\r\n"
+            yield (
+                b"--frame\r\n"
+                b"Content-Type: " + mimetype.encode() + b"\r\n"
+                b"Content-Length: " + str(len(data)).encode() + b"\r\n"
+                b"X-Screen-Width: " + str(screen_width).encode() + b"\r\n"
+                b"X-Screen-Height: " + str(screen_height).encode() + b"\r\n"
+                b"X-Frame-Timestamp: " + repr(frame.timestamp).encode() + b"\r\n"
+                + bbox_header +
+                b"\r\n" + data + b"\r\n"
+            )
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    response = Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws')
+    def websocket_channel(ws):
+        # One persistent connection for actions, acknowledgements and pushed frames, see channel.py
+        WebSocketSession(ws, get_frame, logger).run()
+
+
+def compact_json_response(payload):
+    # Compact JSON, gzipped when the client accepts it and the body is worth compressing.
+    data = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    headers = {'Vary': 'Accept-Encoding'}
+    if len(data) > 1024 and request.accept_encodings['gzip']:
+        data = gzip.compress(data, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(data, mimetype='application/json', headers=headers)
+
+
+@app.route('/accessibility', methods=['GET'])
+def get_accessibility_tree():
+    # Pruned AT-SPI tree dump, see accessibility.py. Query parameters: max_depth, showing_only (default 1),
+    # skip_roles, app, max_children, max_nodes, budget_ms, text. Returns {"tree", "nodes", "truncated",
+    # "elapsed"}; "truncated" means a cap or the time budget cut the walk short.
+    try:
+        options = parse_tree_options(request.args)
+        return compact_json_response(dump_tree(options))
+    except AccessibilityOptionsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except AccessibilityError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/accessibility/changes', methods=['GET'])
+def get_accessibility_changes():
+    # The event-driven mirror of the tree (accessibility.TreeMirror). Without since/epoch, or when they do not
+    # match the server's mirror, returns {"full": true, "root", "nodes": [flat records]}; otherwise
+    # {"full": false, "changes": [{"op": "set", "node"} | {"op": "remove", "id"}]} since that version.
+    # Both carry "epoch" and "version" for the next request. Takes the /accessibility walk options.
+    try:
+        options = parse_tree_options(request.args)
+        since = request.args.get('since')
+        since = int(since) if since not in (None, '') else None
+        return compact_json_response(tree_changes(options, since, request.args.get('epoch') or None))
+    except (AccessibilityOptionsError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except AccessibilityError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/accessibility/query', methods=['GET'])
+def query_accessibility_tree():
+    # Finds elements on the server instead of shipping the tree, see accessibility.TreeIndex. Selectors:
+    # role, name (substring), states, path (ancestor steps like "frame[Untitled] > panel"), limit.
+    # Returns {"matches": [{"id", "role", "name", "states", "bbox", "center", "path"}], "count", "options", ...},
+    # searched in a mirror with the default walk options, whatever /accessibility/changes clients ask for.
+    try:
+        return compact_json_response(query_tree(parse_query(request.args)))
+    except AccessibilityOptionsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except AccessibilityError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/recording/start', methods=['POST'])
+def start_recording():
+    # Body: {"name": "episode-1", and the recording.py options: fps, codec, preset, crf, width/height or scale,
+    # segment_seconds, threads, draw_mouse}. Starting a name again replaces its previous recording.
+    data = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(data, dict):
+            raise RecordingOptionsError("Request body must be a JSON object")
+        options = parse_recording_options(data)
+        return jsonify(recordings.start(data.get('name') or 'default', options, tuple(pyautogui.size())))
+    except RecordingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
 
-    return send_file(file_path, mimetype='image/png')
+
+@app.route('/recording/stop', methods=['POST'])
+def stop_recording():
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(recordings.stop(data.get('name') or 'default'))
+    except RecordingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/recording/status', methods=['GET'])
+def recording_status():
+    # One recording with ?name=, otherwise all of them.
+    try:
+        return jsonify(recordings.status(request.args.get('name')))
+    except RecordingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/recording/download', methods=['GET'])
+def download_recording():
+    # The recording as one MPEG-TS stream (chunked), from segment ?start= on. While recording, only the complete
+    # segments are sent; X-Recording-Segments tells how many, so the next request can continue from there.
+    try:
+        start = int(request.args.get('start') or 0)
+        chunks, count = recordings.download(request.args.get('name') or 'default', max(start, 0))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except RecordingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    name = request.args.get('name') or 'default'
+    return Response(chunks, mimetype='video/mp2t', headers={
+        'Content-Disposition': f'attachment; filename="{name}.ts"',
+        'X-Recording-Segments': str(count),
+    })
+
+
+@app.route('/recording/remove', methods=['POST'])
+def remove_recording():
+    data = request.get_json(silent=True) or {}
+    try:
+        recordings.remove(data.get('name') or 'default')
+        return jsonify({'status': 'success'})
+    except RecordingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+
+@app.route('/capture', methods=['GET', 'POST'])
+def capture_settings():
+    # Status of the background capture loop; POST {"fps": n} changes its rate (0 turns it off).
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        try:
+            if not isinstance(data, dict) or 'fps' not in data:
+                raise ValueError("Request body must be a JSON object with an fps")
+            capture_loop.set_fps(float(data['fps']))
+        except (TypeError, ValueError) as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(capture_loop.status())
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host="0.0.0.0")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Env controller server")
+    parser.add_argument("--capture-backend", choices=CAPTURE_BACKENDS, default=capture_backend_name,
+                        help="Linux screen capture backend (default: auto, i.e. MIT-SHM when available)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--server", choices=SERVERS, default="auto",
+                        help="WSGI server (default: gunicorn, or waitress on Windows)")
+    parser.add_argument("--threads", type=int, default=32,
+                        help="request threads; streams and WebSocket connections each hold one")
+    parser.add_argument("--execute-workers", type=int, default=execute_pool.max_workers,
+                        help="/execute commands running at once")
+    parser.add_argument("--execute-queue", type=int, default=execute_pool.max_queue,
+                        help="/execute commands waiting for a worker before new ones get a 429")
+    parser.add_argument("--capture-queue", type=int, default=int(os.environ.get("CAPTURE_QUEUE", 8)),
+                        help="screenshot requests waiting for the capture before new ones get a 503")
+    parser.add_argument("--capture-fps", type=float, default=capture_loop.fps,
+                        help="run a background capture loop at this rate and serve screenshots from it (0: off)")
+    parser.add_argument("--recording-dir", default=recordings.root,
+                        help="where /recording sessions write their segments (default: $RECORDING_DIR or <tmp>/recordings)")
+    parser.add_argument("--max-recordings", type=int, default=recordings.max_sessions,
+                        help="screen recordings running at once")
+    parser.add_argument("--dev", action="store_true",
+                        help="run the Flask development server with the debugger and reloader instead")
+    args = parser.parse_args()
+    capture_backend_name = args.capture_backend
+    execute_pool = BoundedExecutor(args.execute_workers, args.execute_queue, name="execute")
+    capture_slots = threading.BoundedSemaphore(args.capture_queue)
+    capture_loop.set_fps(args.capture_fps)
+    recordings.root = args.recording_dir
+    recordings.max_sessions = args.max_recordings
+    if platform_name == "Linux":
+        get_screen_capture()
+
+    if args.dev:
+        app.run(debug=True, host=args.host, port=args.port)
+    else:
+        run_server(app, args.server, args.host, args.port, args.threads, timeout=EXECUTE_TIMEOUT + 30)
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Screen recordings with ffmpeg, several named sessions at a time.
+
+Every recording is its own ffmpeg process grabbing the display (x11grab on Linux, gdigrab on Windows)
+straight from the X server, so it never competes with the screenshot endpoints for the capture lock, and
+runs at a lower CPU priority than the server. Output is written as a series of MPEG-TS segments of
+`segment_seconds` each: nothing is held in memory however long the episode, a crash loses at most one
+segment, and since MPEG-TS segments concatenate into a valid stream, a recording can be downloaded in
+chunks (segment by segment, also while it is still running).
+
+Options (all optional): fps, codec (libx264 / libx265 / mpeg4), preset (x264/x265 speed preset),
+crf (quality, lower is better), width / height or scale (output resolution), segment_seconds,
+threads (encoder threads) and draw_mouse.
+"""
+import os
+import platform
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+CODECS = ["libx264", "libx265", "mpeg4"]
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+DEFAULT_OPTIONS = {
+    "fps": 10,
+    "codec": "libx264",
+    "preset": "ultrafast",
+    "crf": 28,
+    "width": None,
+    "height": None,
+    "scale": None,
+    "segment_seconds": 30,
+    "threads": 2,
+    "draw_mouse": True,
+}
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+SEGMENT_PATTERN = "segment_%05d.ts"
+CHUNK_SIZE = 1 << 20
+STOP_TIMEOUT = 10  # seconds ffmpeg gets to finish the current segment after "q"
+
+
+class RecordingError(Exception):
+    """Base of the recording errors; `status_code` is the HTTP status to answer with."""
+    status_code = 500
+
+
+class RecordingOptionsError(RecordingError):
+    status_code = 400
+
+
+class RecordingNotFoundError(RecordingError):
+    status_code = 404
+
+
+class RecordingConflictError(RecordingError):
+    status_code = 409
+
+
+class TooManyRecordingsError(RecordingError):
+    status_code = 429
+
+
+class RecordingUnavailableError(RecordingError):
+    """ffmpeg is missing or cannot be started."""
+    status_code = 503
+
+
+def _number(options, name, cast, low, high):
+    value = options.get(name)
+    if value is None:
+        return DEFAULT_OPTIONS[name]
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise RecordingOptionsError(f"{name} must be a number, got {value!r}")
+    if not low <= number <= high:
+        raise RecordingOptionsError(f"{name} must be in [{low}, {high}], got {number}")
+    return number
+
+
+def _flag(options, name):
+    value = options.get(name)
+    if value is None:
+        return DEFAULT_OPTIONS[name]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes", "on")
+    if isinstance(value, int):
+        return value != 0
+    raise RecordingOptionsError(f"{name} must be a boolean, got {value!r}")
+
+
+def parse_recording_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Validates the recording options of a JSON request body, filling in the defaults."""
+    codec = options.get("codec") or DEFAULT_OPTIONS["codec"]
+    if codec not in CODECS:
+        raise RecordingOptionsError(f"codec must be one of {CODECS}, got {codec!r}")
+    preset = options.get("preset") or DEFAULT_OPTIONS["preset"]
+    if preset not in PRESETS:
+        raise RecordingOptionsError(f"preset must be one of {PRESETS}, got {preset!r}")
+    parsed = {
+        "fps": _number(options, "fps", float, 1, 60),
+        "codec": codec,
+        "preset": preset,
+        "crf": _number(options, "crf", int, 0, 51),
+        "width": _number(options, "width", int, 16, 7680),
+        "height": _number(options, "height", int, 16, 4320),
+        "scale": _number(options, "scale", float, 0.05, 1),
+        "segment_seconds": _number(options, "segment_seconds", float, 1, 3600),
+        "threads": _number(options, "threads", int, 1, 16),
+        "draw_mouse": _flag(options, "draw_mouse"),
+    }
+    if parsed["scale"] is not None and (parsed["width"] or parsed["height"]):
+        raise RecordingOptionsError("Use either scale or width/height")
+    return parsed
+
+
+def _input_args(options: Dict[str, Any], screen_size: Tuple[int, int]) -> List[str]:
+    fps = f"{options['fps']:g}"
+    draw_mouse = "1" if options["draw_mouse"] else "0"
+    system = platform.system()
+    if system == "Linux":
+        width, height = screen_size
+        return ["-f", "x11grab", "-framerate", fps, "-draw_mouse", draw_mouse,
+                "-video_size", f"{width}x{height}", "-i", os.environ.get("DISPLAY", ":0")]
+    if system == "Windows":
+        return ["-f", "gdigrab", "-framerate", fps, "-draw_mouse", draw_mouse, "-i", "desktop"]
+    raise RecordingError(f"Screen recording is not supported on {system}")
+
+
+def _scale_filter(options: Dict[str, Any]) -> str:
+    # Sizes are kept even for yuv420p; -2 keeps the aspect ratio.
+    if options["scale"] is not None:
+        return f"scale=trunc(iw*{options['scale']}/2)*2:-2"
+    if options["width"] or options["height"]:
+        return f"scale={options['width'] or -2}:{options['height'] or -2}"
+    return "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+
+
+def ffmpeg_command(options: Dict[str, Any], screen_size: Tuple[int, int], directory: str) -> List[str]:
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    command += _input_args(options, screen_size)
+    command += ["-vf", _scale_filter(options)]
+    command += ["-c:v", options["codec"], "-pix_fmt", "yuv420p", "-threads", str(options["threads"])]
+    if options["codec"] in ("libx264", "libx265"):
+        command += ["-preset", options["preset"], "-crf", str(options["crf"]), "-tune", "zerolatency"]
+    else:
+        command += ["-q:v", str(max(1, min(31, options["crf"] // 2)))]
+    # A keyframe at every segment boundary, so that each segment plays on its own.
+    command += ["-force_key_frames", f"expr:gte(t,n_forced*{options['segment_seconds']:g})"]
+    command += ["-f", "segment", "-segment_time", f"{options['segment_seconds']:g}",
+                "-segment_format", "mpegts", os.path.join(directory, SEGMENT_PATTERN)]
+    return command
+
+
+class Recording:
+    def __init__(self, name: str, directory: str, options: Dict[str, Any]):
+        self.name = name
+        self.directory = directory
+        self.options = options
+        self.process: Optional[subprocess.Popen] = None
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self.stop_requested = False
+        self.log_path = os.path.join(directory, "ffmpeg.log")
+
+    def start(self, screen_size: Tuple[int, int]) -> None:
+        command = ffmpeg_command(self.options, screen_size, self.directory)
+        with open(self.log_path, "wb") as log:
+            kwargs = {}
+            if platform.system() == "Windows":
+                kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW | subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            try:
+                self.process = subprocess.Popen(
+                    command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log, **kwargs)
+            except OSError as e:
+                raise RecordingUnavailableError(f"Could not start ffmpeg: {e}")
+        if platform.system() != "Windows":
+            # Lowered from here rather than with preexec_fn, which is unsafe in a threaded server.
+            try:
+                niceness = min(19, os.getpriority(os.PRIO_PROCESS, 0) + 10)
+                os.setpriority(os.PRIO_PROCESS, self.process.pid, niceness)
+            except OSError:
+                pass
+        self.started = time.time()
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self) -> None:
+        """Asks ffmpeg to finish (closing the current segment cleanly), killing it if it does not."""
+        self.stop_requested = True
+        if not self.running:
+            return
+        try:
+            self.process.stdin.write(b"q")
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.stopped = time.time()
+
+    def segments(self, complete_only: bool = False) -> List[str]:
+        """The segment files in order; complete_only leaves out the one still being written."""
+        names = sorted(name for name in os.listdir(self.directory) if name.startswith("segment_"))
+        if complete_only and self.running and names:
+            names = names[:-1]
+        return [os.path.join(self.directory, name) for name in names]
+
+    def error(self) -> Optional[str]:
+        try:
+            with open(self.log_path, "rb") as log:
+                return log.read()[-2000:].decode("utf-8", "replace").strip() or None
+        except OSError:
+            return None
+
+    def status(self) -> Dict[str, Any]:
+        if self.running:
+            state = "recording"
+        elif self.stop_requested:
+            state = "stopped"
+        else:
+            # ffmpeg exited without being asked to: a bad option, the display went away, the disk is full.
+            state = "failed"
+        segments = self.segments()
+        status = {
+            "name": self.name,
+            "state": state,
+            "options": self.options,
+            "started": self.started,
+            "stopped": self.stopped,
+            "duration": (self.stopped or time.time()) - self.started if self.started else 0.0,
+            "segments": len(segments),
+            "size": sum(os.path.getsize(path) for path in segments),
+        }
+        if state == "failed":
+            status["error"] = self.error()
+        return status
+
+
+class RecordingManager:
+    """
+    The named recordings of the server. At most `max_sessions` run at once; stopped ones keep their files
+    (under `root/<name>/`) until removed.
+    """
+
+    def __init__(self, root: str, max_sessions: int = 4, logger=None):
+        self.root = root
+        self.max_sessions = max_sessions
+        self.logger = logger
+        self._recordings: Dict[str, Recording] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Recording:
+        recording = self._recordings.get(name)
+        if recording is None:
+            raise RecordingNotFoundError(f"No recording named {name!r}")
+        return recording
+
+    def start(self, name: str, options: Dict[str, Any], screen_size: Tuple[int, int]) -> Dict[str, Any]:
+        if not NAME_PATTERN.match(name or ""):
+            raise RecordingOptionsError("name must be 1-64 letters, digits, '.', '_' or '-'")
+        if shutil.which("ffmpeg") is None:
+            raise RecordingUnavailableError("ffmpeg was not found on the PATH")
+        with self._lock:
+            existing = self._recordings.get(name)
+            if existing is not None and existing.running:
+                raise RecordingConflictError(f"Recording {name!r} is already running")
+            if sum(recording.running for recording in self._recordings.values()) >= self.max_sessions:
+                raise TooManyRecordingsError(f"{self.max_sessions} recordings are already running")
+            directory = os.path.join(self.root, name)
+            # Starting a name again replaces its previous recording.
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            recording = Recording(name, directory, options)
+            try:
+                recording.start(screen_size)
+            except RecordingError:
+                shutil.rmtree(directory, ignore_errors=True)
+                raise
+            self._recordings[name] = recording
+        if self.logger is not None:
+            self.logger.info(f"Started recording {name!r} in {directory}")
+        return recording.status()
+
+    def stop(self, name: str) -> Dict[str, Any]:
+        recording = self.get(name)
+        recording.stop()
+        return recording.status()
+
+    def stop_all(self) -> None:
+        for recording in list(self._recordings.values()):
+            recording.stop()
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            recording = self.get(name)
+            if recording.running:
+                raise RecordingConflictError(f"Recording {name!r} is still running, stop it first")
+            del self._recordings[name]
+        shutil.rmtree(recording.directory, ignore_errors=True)
+
+    def status(self, name: Optional[str] = None) -> Dict[str, Any]:
+        if name is not None:
+            return self.get(name).status()
+        return {
+            "max_sessions": self.max_sessions,
+            "recordings": [recording.status() for recording in list(self._recordings.values())],
+        }
+
+    def download(self, name: str, start: int = 0) -> Tuple[Iterator[bytes], int]:
+        """
+        The recording as one MPEG-TS stream, from segment `start` on, in CHUNK_SIZE chunks, and the number
+        of segments it covers. While recording, only complete segments are included, so a client can
+        fetch a long episode piece by piece and continue from start + count.
+        """
+        segments = self.get(name).segments(complete_only=True)[start:]
+
+        def chunks():
+            for path in segments:
+                with open(path, "rb") as segment:
+                    while True:
+                        chunk = segment.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+
+        return chunks(), len(segments)
@@ -0,0 +1,89 @@
+"""
+Production serving for main.py: WSGI server runners and bounded job execution.
+
+The server drives one display, one pointer and one keyboard, and keeps its locks, delta frames and
+capture handles in process memory. It must therefore run as ONE process with many threads; never
+start it with several workers.
+
+- gunicorn (Linux/macOS): gthread worker, supports /stream and the /ws WebSocket channel;
+- waitress (Windows): /stream works, /ws does not (flask-sock cannot hook into waitress).
+"""
+import platform
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+SERVERS = ["auto", "gunicorn", "waitress"]
+
+
+class QueueFullError(Exception):
+    """Raised by BoundedExecutor.submit when every worker is busy and the queue is full."""
+
+
+class BoundedExecutor:
+    """A thread pool that rejects new jobs once `max_workers + max_queue` are running or waiting."""
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "jobs"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"{self.max_workers} jobs running and {self.max_queue} queued, try again later")
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+def default_server() -> str:
+    if platform.system() != "Windows":
+        try:
+            import gunicorn  # noqa: F401
+            return "gunicorn"
+        except ImportError:
+            pass
+    try:
+        import waitress  # noqa: F401
+        return "waitress"
+    except ImportError:
+        raise RuntimeError("No production WSGI server found: pip install gunicorn (or waitress on Windows), "
+                           "or run with --dev for the Flask development server")
+
+
+def run_gunicorn(app, host: str, port: int, threads: int, timeout: int):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", threads)
+            self.cfg.set("timeout", timeout)
+
+        def load(self):
+            return app
+
+    Application().run()
+
+
+def run_waitress(app, host: str, port: int, threads: int, timeout: int):
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads, channel_timeout=timeout)
+
+
+def run(app, server: str, host: str, port: int, threads: int, timeout: int):
+    if server == "auto":
+        server = default_server()
+    if server == "gunicorn":
+        run_gunicorn(app, host, port, threads, timeout)
+    elif server == "waitress":
+        run_waitress(app, host, port, threads, timeout)
+    else:
+        raise ValueError(f"Unknown server {server!r}, use one of {SERVERS}")
@@ -0,0 +1,106 @@
+"""
+Waiting until the screen stops changing, instead of sleeping a fixed time after an action.
+
+Consecutive frames are compared on a grayscale copy reduced by STABILITY_REDUCE; a pixel counts as
+changed when it moved by more than STABILITY_PIXEL_DELTA levels. The screen is stable once the fraction
+of changed pixels has stayed at or below `threshold` for `quiet` seconds (a blinking caret or a clock
+stays under the default threshold).
+"""
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from encoding import ScreenshotOptionsError
+
+STABILITY_REDUCE = 4
+STABILITY_PIXEL_DELTA = 16
+
+DEFAULT_STABLE_TIMEOUT = 10.0
+MAX_STABLE_TIMEOUT = 120.0
+DEFAULT_STABLE_THRESHOLD = 0.001
+DEFAULT_QUIET_MS = 500
+DEFAULT_INTERVAL_MS = 100
+
+
+def parse_stability_options(args) -> Dict[str, float]:
+    """timeout (s), threshold (changed fraction), quiet_ms and interval_ms from query parameters, validated."""
+    try:
+        timeout = float(args.get("timeout") or DEFAULT_STABLE_TIMEOUT)
+        threshold = float(args.get("threshold") or DEFAULT_STABLE_THRESHOLD)
+        quiet_ms = float(args.get("quiet_ms") or DEFAULT_QUIET_MS)
+        interval_ms = float(args.get("interval_ms") or DEFAULT_INTERVAL_MS)
+    except ValueError as e:
+        raise ScreenshotOptionsError(f"Invalid stability option: {e}")
+    if not 0 < timeout <= MAX_STABLE_TIMEOUT:
+        raise ScreenshotOptionsError(f"timeout must be in (0, {MAX_STABLE_TIMEOUT}], got {timeout}")
+    if not 0 <= threshold < 1:
+        raise ScreenshotOptionsError(f"threshold must be in [0, 1), got {threshold}")
+    if quiet_ms < 0 or not 10 <= interval_ms <= 5000:
+        raise ScreenshotOptionsError("quiet_ms must be >= 0 and interval_ms in [10, 5000]")
+    return {"timeout": timeout, "threshold": threshold, "quiet": quiet_ms / 1000.0, "interval": interval_ms / 1000.0}
+
+
+def _signature(image: Image.Image) -> np.ndarray:
+    gray = image.convert("L")
+    if min(gray.size) >= STABILITY_REDUCE * 8:
+        gray = gray.reduce(STABILITY_REDUCE)
+    return np.asarray(gray, dtype=np.int16)
+
+
+def changed_fraction(previous: np.ndarray, current: np.ndarray) -> float:
+    if previous.shape != current.shape:
+        return 1.0
+    return float(np.count_nonzero(np.abs(current - previous) > STABILITY_PIXEL_DELTA)) / current.size
+
+
+def wait_for_stable(
+    get_frame: Callable[..., Any],
+    options,
+    timeout: float = DEFAULT_STABLE_TIMEOUT,
+    threshold: float = DEFAULT_STABLE_THRESHOLD,
+    quiet: float = DEFAULT_QUIET_MS / 1000.0,
+    interval: float = DEFAULT_INTERVAL_MS / 1000.0,
+) -> Dict[str, Any]:
+    """
+    Watches the area selected by `options` through `get_frame(options, after)` (see main.get_frame)
+    until it is stable or `timeout` runs out. Returns {"stable", "elapsed", "frames", "change",
+    "frame", "bbox"}, where "frame" is the last frame seen and "change" its changed fraction.
+    """
+    start = time.monotonic()
+    frame, bbox = get_frame(options)
+    if frame is None:
+        return {"stable": False, "elapsed": 0.0, "frames": 0, "change": None, "frame": None, "bbox": bbox}
+    signature = _signature(frame.region(bbox))
+    quiet_since = start
+    frames = 1
+    change: Optional[float] = None
+    while True:
+        now = time.monotonic()
+        if now - quiet_since >= quiet:
+            stable = True
+            break
+        if now - start >= timeout:
+            stable = False
+            break
+        time.sleep(max(0.0, min(interval, start + timeout - now)))
+        next_frame, bbox = get_frame(options, frame.frame_id)
+        if next_frame is None:
+            stable = False
+            break
+        frame = next_frame
+        frames += 1
+        current = _signature(frame.region(bbox))
+        change = changed_fraction(signature, current)
+        signature = current
+        if change > threshold:
+            quiet_since = time.monotonic()
+    return {
+        "stable": stable,
+        "elapsed": time.monotonic() - start,
+        "frames": frames,
+        "change": change,
+        "frame": frame,
+        "bbox": bbox,
+    }
@@ -0,0 +1,318 @@
+"""
+MIT-SHM (XShm) screen grabber for Linux, built with ctypes like pyxcursor.py.
+
+A shared-memory XImage is attached to the display once; every grab is a single XShmGetImage
+straight into that segment, which is exposed as a reusable NumPy buffer (no XGetImage copy
+through the socket, no external screenshot tool).
+
+X errors are trapped around every request that can fail (Xlib's default handler would exit the whole
+server), and each grab checks the root window size first: after a resolution change the segment is
+detached and attached again at the new size.
+"""
+import os
+import threading
+import ctypes
+import ctypes.util
+from contextlib import contextmanager
+
+import numpy as np
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+ZPixmap = 2
+LSBFirst = 0
+AllPlanes = ctypes.c_ulong(-1).value
+
+
+class Display(ctypes.Structure):
+    pass
+
+
+class Visual(ctypes.Structure):
+    pass
+
+
+class XImage(ctypes.Structure):
+    """
+    See /usr/include/X11/Xlib.h. The trailing `f` struct of function pointers is only
+    declared so that the structure has the right size.
+    """
+    _fields_ = [('width', ctypes.c_int),
+                ('height', ctypes.c_int),
+                ('xoffset', ctypes.c_int),
+                ('format', ctypes.c_int),
+                ('data', ctypes.c_void_p),
+                ('byte_order', ctypes.c_int),
+                ('bitmap_unit', ctypes.c_int),
+                ('bitmap_bit_order', ctypes.c_int),
+                ('bitmap_pad', ctypes.c_int),
+                ('depth', ctypes.c_int),
+                ('bytes_per_line', ctypes.c_int),
+                ('bits_per_pixel', ctypes.c_int),
+                ('red_mask', ctypes.c_ulong),
+                ('green_mask', ctypes.c_ulong),
+                ('blue_mask', ctypes.c_ulong),
+                ('obdata', ctypes.c_void_p),
+                ('f', ctypes.c_void_p * 6)]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    """
+    See /usr/include/X11/extensions/XShm.h
+
+    typedef struct {
+        ShmSeg shmseg;	/* resource id */
+        int shmid;		/* kernel id */
+        char *shmaddr;	/* address in client */
+        Bool readOnly;	/* how the server should attach it */
+    } XShmSegmentInfo;
+    """
+    _fields_ = [('shmseg', ctypes.c_ulong),
+                ('shmid', ctypes.c_int),
+                ('shmaddr', ctypes.c_void_p),
+                ('readOnly', ctypes.c_int)]
+
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [('type', ctypes.c_int),
+                ('display', ctypes.POINTER(Display)),
+                ('resourceid', ctypes.c_ulong),
+                ('serial', ctypes.c_ulong),
+                ('error_code', ctypes.c_ubyte),
+                ('request_code', ctypes.c_ubyte),
+                ('minor_code', ctypes.c_ubyte)]
+
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(Display), ctypes.POINTER(XErrorEvent))
+
+
+class XShmError(Exception):
+    """MIT-SHM capture failed; the caller should fall back to another capture path."""
+
+
+class XShmGrabber:
+    display = None
+
+    def __init__(self, display=None):
+        if not display:
+            try:
+                display = os.environ["DISPLAY"].encode("utf-8")
+            except KeyError:
+                raise XShmError("$DISPLAY not set.")
+
+        x11 = ctypes.util.find_library("X11")
+        if not x11:
+            raise XShmError("No X11 library found.")
+        self.xlib = ctypes.cdll.LoadLibrary(x11)
+
+        xext = ctypes.util.find_library("Xext")
+        if not xext:
+            raise XShmError("No Xext library found.")
+        self.xext = ctypes.cdll.LoadLibrary(xext)
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self._declare_functions()
+
+        self.display = self.xlib.XOpenDisplay(display)
+        if not self.display:
+            raise XShmError(f"Cannot open display {display!r}.")
+        if not self.xext.XShmQueryExtension(self.display):
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+            raise XShmError("MIT-SHM extension not available.")
+
+        screen = self.xlib.XDefaultScreen(self.display)
+        self.root = self.xlib.XRootWindow(self.display, screen)
+        self.width = self.xlib.XDisplayWidth(self.display, screen)
+        self.height = self.xlib.XDisplayHeight(self.display, screen)
+        self.visual = self.xlib.XDefaultVisual(self.display, screen)
+        self.depth = self.xlib.XDefaultDepth(self.display, screen)
+
+        self.ximage = None
+        self.shminfo = None
+        self.buffer = None
+        self._lock = threading.Lock()
+        try:
+            self._attach()
+        except Exception:
+            self.close()
+            raise
+
+    def _declare_functions(self):
+        xlib, xext, libc = self.xlib, self.xext, self.libc
+
+        xlib.XOpenDisplay.restype = ctypes.POINTER(Display)
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.POINTER(Display)]
+        xlib.XDefaultScreen.argtypes = [ctypes.POINTER(Display)]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XRootWindow.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XDisplayWidth.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XDefaultVisual.restype = ctypes.POINTER(Visual)
+        xlib.XDefaultVisual.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XDefaultDepth.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XSync.argtypes = [ctypes.POINTER(Display), ctypes.c_int]
+        xlib.XFree.argtypes = [ctypes.c_void_p]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XSetErrorHandler.argtypes = [ctypes.c_void_p]
+        xlib.XGetGeometry.argtypes = [ctypes.POINTER(Display), ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+                                      ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                      ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+                                      ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint)]
+
+        xext.XShmQueryExtension.argtypes = [ctypes.POINTER(Display)]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.POINTER(Display), ctypes.POINTER(Visual), ctypes.c_uint,
+                                         ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.POINTER(Display), ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.POINTER(Display), ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.POINTER(Display), ctypes.c_ulong, ctypes.POINTER(XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+
+        libc.shmget.restype = ctypes.c_int
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    @contextmanager
+    def _trap_errors(self):
+        """Collects the X error codes raised inside the block instead of letting Xlib exit the process."""
+        errors = []
+
+        def on_error(display, event):
+            errors.append(event.contents.error_code)
+            return 0
+
+        handler = XErrorHandler(on_error)
+        previous = self.xlib.XSetErrorHandler(ctypes.cast(handler, ctypes.c_void_p))
+        try:
+            yield errors
+        finally:
+            self.xlib.XSync(self.display, 0)
+            self.xlib.XSetErrorHandler(previous)
+
+    def root_size(self):
+        """The current size of the root window (XDisplayWidth/Height keep the size at connection time)."""
+        root, x, y = ctypes.c_ulong(), ctypes.c_int(), ctypes.c_int()
+        width, height, border, depth = ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint()
+        with self._trap_errors() as errors:
+            ok = self.xlib.XGetGeometry(self.display, self.root, ctypes.byref(root), ctypes.byref(x),
+                                        ctypes.byref(y), ctypes.byref(width), ctypes.byref(height),
+                                        ctypes.byref(border), ctypes.byref(depth))
+        if not ok or errors:
+            raise XShmError("XGetGeometry() failed on the root window.")
+        return width.value, height.value
+
+    def _attach(self):
+        self.shminfo = XShmSegmentInfo()
+        self.ximage = self.xext.XShmCreateImage(
+            self.display, self.visual, self.depth, ZPixmap, None,
+            ctypes.byref(self.shminfo), self.width, self.height)
+        if not self.ximage:
+            raise XShmError("XShmCreateImage() failed.")
+
+        image = self.ximage.contents
+        if image.bits_per_pixel != 32 or image.red_mask != 0xff0000 or image.blue_mask != 0xff:
+            raise XShmError(f"Unsupported pixel layout ({image.bits_per_pixel} bpp).")
+
+        size = image.bytes_per_line * image.height
+        shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise XShmError(f"shmget() failed: {os.strerror(ctypes.get_errno())}")
+        addr = self.libc.shmat(shmid, None, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(shmid, IPC_RMID, None)
+            raise XShmError(f"shmat() failed: {os.strerror(ctypes.get_errno())}")
+        self.shminfo.shmid = shmid
+        self.shminfo.shmaddr = addr
+        self.shminfo.readOnly = 0
+        image.data = addr
+
+        # A remote X server accepts the extension query but fails the attach with BadAccess.
+        with self._trap_errors() as errors:
+            attached = self.xext.XShmAttach(self.display, ctypes.byref(self.shminfo))
+        # Mark the segment for removal now; it disappears once both we and the X server detach.
+        self.libc.shmctl(shmid, IPC_RMID, None)
+        if not attached or errors:
+            self.libc.shmdt(addr)
+            self.shminfo.shmaddr = None
+            image.data = None
+            raise XShmError("XShmAttach() failed, MIT-SHM is not usable on this display.")
+
+        rows = np.ctypeslib.as_array(
+            ctypes.cast(addr, ctypes.POINTER(ctypes.c_uint8)), shape=(image.height, image.bytes_per_line))
+        self.buffer = rows[:, :image.width * 4].reshape(image.height, image.width, 4)
+        # Channel indices of R, G, B in one 32-bit pixel as stored in memory.
+        self.rgb_index = [2, 1, 0] if image.byte_order == LSBFirst else [1, 2, 3]
+
+    def _detach(self):
+        if self.shminfo is not None and self.shminfo.shmaddr:
+            with self._trap_errors():
+                self.xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+            self.libc.shmdt(self.shminfo.shmaddr)
+        if self.ximage:
+            # The pixel data lives in the segment, so only the XImage struct itself is freed.
+            self.ximage.contents.data = None
+            self.xlib.XFree(self.ximage)
+        self.ximage = None
+        self.shminfo = None
+        self.buffer = None
+
+    def _resize(self, size):
+        self._detach()
+        self.width, self.height = size
+        self._attach()
+
+    def grab(self):
+        """
+        Grabs the screen into the shared buffer and returns it (height x width x 4, native byte order).
+        The buffer is overwritten by the next grab; use grab_rgb() for an independent copy.
+        Raises XShmError when the screen cannot be grabbed through MIT-SHM any more.
+        """
+        size = self.root_size()
+        if size != (self.width, self.height) or self.ximage is None:
+            self._resize(size)
+        with self._trap_errors() as errors:
+            ok = self.xext.XShmGetImage(self.display, self.root, self.ximage, 0, 0, AllPlanes)
+        if not ok or errors:
+            # BadMatch: the screen shrank between the size check and the grab.
+            raise XShmError(f"XShmGetImage() failed (X error {errors[0] if errors else 'none'}).")
+        return self.buffer
+
+    def grab_rgb(self, bbox=None):
+        """
+        Returns an RGB copy of the screen, or of bbox = (left, top, right, bottom) only.
+        Safe to call from several threads.
+        """
+        with self._lock:
+            frame = self.grab()
+            if bbox is not None:
+                left, top, right, bottom = bbox
+                frame = frame[top:bottom, left:right]
+            return frame[:, :, self.rgb_index]
+
+    def close(self):
+        if self.display is None:
+            return
+        self._detach()
+        self.xlib.XCloseDisplay(self.display)
+        self.display = None
+
+
+if __name__ == "__main__":
+    import time
+    from PIL import Image
+
+    grabber = XShmGrabber()
+    start = time.perf_counter()
+    for _ in range(100):
+        grabber.grab()
+    print(f"XShmGetImage: {(time.perf_counter() - start) * 10:.2f} ms per frame")
+    Image.fromarray(grabber.grab_rgb()).save("xshm_screenshot.png")
+    grabber.close()
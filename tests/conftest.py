@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The server modules import each other by their bare names (they run from server/).
+for path in (ROOT, os.path.join(ROOT, "server")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
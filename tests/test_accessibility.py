@@ -0,0 +1,189 @@
+import queue
+import threading
+import time
+import types
+from collections import OrderedDict
+
+import pytest
+
+import accessibility
+from accessibility import parse_tree_options
+from env_controller.accessibility import AccessibilityTreeCache
+
+SHOWING = 1
+
+
+class FakeNode:
+    """An accessible of the fake AT-SPI tree; records the threads it is called from."""
+
+    threads = set()
+    delay = 0.0
+
+    def __init__(self, role, name="", children=()):
+        self.role, self.name, self.children = role, name, list(children)
+        self.parent = None
+        for child in self.children:
+            child.parent = self
+
+    def getRoleName(self):
+        FakeNode.threads.add(threading.current_thread().name)
+        time.sleep(FakeNode.delay)
+        return self.role
+
+    def getState(self):
+        return types.SimpleNamespace(contains=lambda state: True, getStates=lambda: [SHOWING])
+
+    @property
+    def childCount(self):
+        return len(self.children)
+
+    def getChildAtIndex(self, index):
+        return self.children[index]
+
+    def queryComponent(self):
+        return types.SimpleNamespace(getExtents=lambda kind: types.SimpleNamespace(x=0, y=0, width=10, height=10))
+
+    def queryText(self):
+        raise NotImplementedError
+
+    def queryValue(self):
+        raise NotImplementedError
+
+
+class FakeRegistry:
+    def __init__(self, desktop):
+        self.desktop = desktop
+        self.calls = queue.Queue()
+
+    def getDesktop(self, index):
+        return self.desktop
+
+    def registerEventListener(self, callback, *events):
+        pass
+
+    def deregisterEventListener(self, callback, *events):
+        pass
+
+    def start(self):
+        while True:
+            callback = self.calls.get()
+            while callback():
+                pass
+
+
+def desktop(apps=3, buttons=40):
+    return FakeNode("desktop frame", children=[
+        FakeNode("application", f"app{a}", [FakeNode("frame", f"window{a}", [
+            FakeNode("push button", f"button{a}.{b}") for b in range(buttons)])])
+        for a in range(apps)])
+
+
+@pytest.fixture
+def atspi(monkeypatch):
+    registry = FakeRegistry(desktop())
+    fake = types.SimpleNamespace(
+        Registry=registry, STATE_SHOWING=SHOWING, XY_SCREEN=0,
+        StateType=types.SimpleNamespace(_enum_lookup={SHOWING: "STATE_SHOWING"}))
+    monkeypatch.setattr(accessibility, "pyatspi", fake)
+    monkeypatch.setattr(accessibility, "GLib", types.SimpleNamespace(idle_add=registry.calls.put), raising=False)
+    monkeypatch.setattr(accessibility, "_event_loop", None)
+    monkeypatch.setattr(accessibility, "_mirrors", OrderedDict())
+    monkeypatch.setattr(accessibility, "_state_names", None)
+    monkeypatch.setattr(FakeNode, "threads", set())
+    monkeypatch.setattr(FakeNode, "delay", 0.0)
+    return registry
+
+
+def test_atspi_calls_run_on_the_event_loop(atspi):
+    options = parse_tree_options({})
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(accessibility.dump_tree(options))) for _ in range(4)]
+    workers += [threading.Thread(target=lambda: results.append(accessibility.tree_changes(options, None, None)))
+                for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert len(results) == 8
+    assert FakeNode.threads == {"atspi-events"}
+    assert results[0]["nodes"] == 1 + 3 * 42
+
+
+def test_mirror_build_is_budgeted_and_resumed(atspi):
+    FakeNode.delay = 0.002
+    options = parse_tree_options({"budget_ms": "50"})
+    cache = AccessibilityTreeCache(None)
+    start = time.monotonic()
+    reply = accessibility.tree_changes(options, None, None)
+    assert time.monotonic() - start < 1.0
+    assert reply["full"] and not reply["complete"]
+    cache.apply(reply)
+    for _ in range(100):
+        if reply["complete"]:
+            break
+        reply = accessibility.tree_changes(options, cache.version, cache.epoch)
+        assert not reply["full"]
+        cache.apply(reply)
+    assert reply["complete"]
+    assert len(cache.records) == 1 + 3 * 42
+
+    def names(node):
+        return [node.get("name", "")] + [name for child in node.get("children", []) for name in names(child)]
+
+    assert names(cache.tree()) == names(accessibility.dump_tree(parse_tree_options({}))["tree"])
+
+
+def test_busy_event_loop_times_out(atspi, monkeypatch):
+    monkeypatch.setattr(accessibility, "LOOP_GRACE", 0.0)
+    release = threading.Event()
+    accessibility._ensure_event_loop()
+    atspi.calls.put(lambda: release.wait(5) and False)
+    with pytest.raises(accessibility.AccessibilityTimeoutError):
+        accessibility.dump_tree(parse_tree_options({"budget_ms": "10"}))
+    release.set()
+
+
+def test_query_matches_come_in_tree_order():
+    def record(node_id, parent, children, role="push button", name=""):
+        return {"id": node_id, "parent": parent, "children": children, "role": role, "name": name}
+
+    # Button 5 was added by an event before button 2, in a window mirrored earlier.
+    records = {
+        1: record(1, None, [3, 4], role="desktop frame"),
+        3: record(3, 1, [5, 2], role="frame", name="first"),
+        5: record(5, 3, [], name="new"),
+        2: record(2, 3, [], name="old"),
+        4: record(4, 1, [6], role="frame", name="second"),
+        6: record(6, 4, []),
+    }
+    index = accessibility.TreeIndex(records, 1)
+    query = accessibility.parse_query({"role": "push button"})
+    matches, count = index.find(query)
+    assert [match["id"] for match in matches] == [5, 2, 6]
+    matches, count = index.find(dict(query, limit=2))
+    assert ([match["id"] for match in matches], count) == ([5, 2], 3)
+
+
+def test_queries_are_not_narrowed_by_changes_clients(atspi):
+    query = accessibility.parse_query({"role": "push button", "name": "button0.39"})
+    accessibility.tree_changes(parse_tree_options({"app": "app1"}), None, None)
+    reply = accessibility.query_tree(query)
+    assert [match["name"] for match in reply["matches"]] == ["button0.39"]
+    assert reply["options"]["app"] is None and reply["options"]["skip_roles"] == []
+
+    # A changes client with yet other options does not reset the queries' mirror.
+    accessibility.tree_changes(parse_tree_options({"max_depth": "1"}), None, None)
+    assert accessibility.query_tree(query)["epoch"] == reply["epoch"]
+
+
+def test_least_recently_used_mirror_is_closed(atspi, monkeypatch):
+    monkeypatch.setattr(accessibility, "MAX_MIRRORS", 2)
+    first = accessibility.tree_changes(parse_tree_options({"app": "app0"}), None, None)
+    accessibility.tree_changes(parse_tree_options({"app": "app1"}), None, None)
+    again = accessibility.tree_changes(parse_tree_options({"app": "app0"}), first["version"], first["epoch"])
+    assert not again["full"]
+    accessibility.tree_changes(parse_tree_options({"app": "app2"}), None, None)
+    assert len(accessibility._mirrors) == 2
+    again = accessibility.tree_changes(parse_tree_options({"app": "app0"}), first["version"], first["epoch"])
+    assert not again["full"]
+    assert accessibility.tree_changes(parse_tree_options({"app": "app1"}), None, None)["epoch"] != first["epoch"]
@@ -0,0 +1,23 @@
+import pytest
+
+try:
+    from actions import ActionError, perform_action, perform_actions
+except Exception as e:  # pyautogui needs a display on Linux
+    pytest.skip(f"server actions unavailable: {e}", allow_module_level=True)
+
+
+@pytest.mark.parametrize("action", [
+    {"action_type": ["CLICK"]},
+    {"action_type": {"type": "CLICK"}},
+    {"action_type": None},
+    "CLICK",
+    {"x": 1},
+])
+def test_malformed_actions_are_rejected(action):
+    with pytest.raises(ActionError):
+        perform_action(action)
+
+
+def test_malformed_action_in_batch_is_an_error_entry():
+    result = perform_actions([{"action_type": ["CLICK"]}, "WAIT"], stop_on_error=True)
+    assert [entry["status"] for entry in result["results"]] == ["error", "skipped"]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from delta import DeltaEncoder, dirty_rects
+from encoding import _format_available, parse_screenshot_options, transform_screenshot
+from env_controller.codecs import apply_delta
+
+FORMATS = ["png", "qoi", "raw", "raw-lz4", "raw-zstd", "jpeg", "webp"]
+LOSSY = {"jpeg", "webp"}
+
+
+def screen(seed):
+    rng = np.random.default_rng(seed)
+    # Smooth blocks, so that lossy formats stay close to the source.
+    blocks = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(np.kron(blocks, np.ones((32, 32, 1), dtype=np.uint8)))
+
+
+def assert_close(actual, expected, fmt):
+    assert actual.shape == expected.shape
+    if fmt in LOSSY:
+        assert np.abs(actual.astype(int) - expected.astype(int)).mean() < 8
+    else:
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("grayscale", [False, True], ids=["RGB", "L"])
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_delta_round_trip(fmt, grayscale):
+    if not _format_available(fmt):
+        pytest.skip(f"{fmt} is not available")
+    options = parse_screenshot_options({"format": fmt, "grayscale": "1" if grayscale else ""})
+    encoder = DeltaEncoder()
+
+    first = transform_screenshot(screen(1), options)
+    meta, payload = encoder.encode("client", 0, first, options)
+    assert meta["keyframe"] and meta["mode"] == ("L" if grayscale else "RGB")
+    frame = apply_delta(None, meta, payload)
+    assert_close(frame, np.asarray(first), fmt)
+
+    changed = screen(1)
+    changed.paste(screen(2).crop((0, 0, 40, 40)), (70, 100))
+    second = transform_screenshot(changed, options)
+    meta, payload = encoder.encode("client", meta["frame_id"], second, options)
+    assert not meta["keyframe"]
+    assert len(meta["tiles"]) >= 1
+    updated = apply_delta(frame, meta, payload)
+    assert_close(updated, np.asarray(second), fmt)
+
+
+def test_dirty_rects_merge_adjacent_tiles():
+    previous = np.zeros((128, 256), dtype=np.uint8)
+    current = previous.copy()
+    current[10, 10] = current[10, 70] = current[100, 200] = 1
+    assert dirty_rects(previous, current, 64) == [(0, 0, 128, 64), (192, 64, 64, 64)]
@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+
+import pytest
+from PIL import Image
+
+from framebuffer import CaptureLoop
+
+
+def _capture():
+    return Image.new("RGB", (32, 24), (os.getpid() % 256, 0, 0)), (32, 24)
+
+
+def _latest_in_child(loop, queue):
+    frame = loop.latest(timeout=2.0)
+    if frame is not None:
+        # latest() may serve a fresh frame inherited from the parent; the next one is captured here.
+        frame = loop.next_frame(frame.frame_id, timeout=2.0)
+    queue.put(None if frame is None else frame.image.getpixel((0, 0))[0])
+
+
+def test_set_fps_does_not_start_thread():
+    loop = CaptureLoop(_capture, fps=20)
+    assert loop.enabled
+    assert loop._thread is None
+
+
+def test_latest_starts_loop():
+    loop = CaptureLoop(_capture, fps=20)
+    frame = loop.latest(timeout=2.0)
+    assert frame is not None
+    assert frame.image.size == (32, 24)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+@pytest.mark.parametrize("used_before_fork", [False, True])
+def test_latest_after_fork(used_before_fork):
+    # gunicorn configures the app in its master and forks the worker that serves requests.
+    loop = CaptureLoop(_capture, fps=20)
+    if used_before_fork:
+        assert loop.latest(timeout=2.0) is not None
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    child = context.Process(target=_latest_in_child, args=(loop, queue))
+    child.start()
+    red = queue.get(timeout=10)
+    child.join(10)
+    assert red == child.pid % 256
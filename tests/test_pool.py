@@ -0,0 +1,82 @@
+import pytest
+
+from env_controller.pool import ControllerPool
+
+TARGETS = ["10.0.0.1:5000", "10.0.0.2:5000", "10.0.0.3:5000"]
+
+
+class FakeController:
+    def __init__(self, key, fail=False):
+        self.key = key
+        self.fail = fail
+        self.calls = []
+
+    def execute_action(self, action, timeout=None):
+        self.calls.append(("action", action))
+        return None if self.fail else {"status": "success"}
+
+    def execute_actions(self, actions, timeout=None):
+        self.calls.append(("batch", actions))
+        return None if self.fail else {"status": "success", "results": []}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pool():
+    pool = ControllerPool(TARGETS, max_failures=1)
+    for key in TARGETS:
+        pool._controllers[key].close()
+        pool._controllers[key] = FakeController(key)
+    yield pool
+    pool.close()
+
+
+def calls(pool, key):
+    return pool._controllers[key].calls
+
+
+def test_broadcast_batch_as_long_as_targets(pool):
+    batch = [{"action_type": "CLICK", "x": i, "y": i} for i in range(len(TARGETS))]
+    results = pool.map_actions(batch)
+    assert [r["status"] for r in results] == ["success"] * 3
+    for key in TARGETS:
+        assert calls(pool, key) == [("batch", batch)]
+
+
+def test_broadcast_single_action(pool):
+    action = {"action_type": "CLICK", "x": 1, "y": 2}
+    pool.map_actions(action, targets=TARGETS[:2])
+    assert calls(pool, TARGETS[0]) == calls(pool, TARGETS[1]) == [("action", action)]
+    assert calls(pool, TARGETS[2]) == []
+
+
+def test_per_target_is_keyed_after_eviction(pool):
+    pool._controllers[TARGETS[0]].fail = True
+    pool.map_actions({"action_type": "CLICK", "x": 0, "y": 0})
+    assert TARGETS[0] not in pool.healthy_targets
+
+    second, third = {"action_type": "PRESS", "key": "a"}, [{"action_type": "PRESS", "key": "b"}]
+    results = pool.map_actions(per_target={TARGETS[2]: third, TARGETS[1]: second, TARGETS[0]: second})
+    assert [(r["target"], r["status"]) for r in results] == [
+        (TARGETS[2], "success"), (TARGETS[1], "success"), (TARGETS[0], "evicted")]
+    assert calls(pool, TARGETS[1])[-1] == ("action", second)
+    assert calls(pool, TARGETS[2])[-1] == ("batch", third)
+
+
+def test_unknown_target(pool):
+    results = pool.map_actions({"action_type": "CLICK", "x": 0, "y": 0}, targets=["10.9.9.9:5000", TARGETS[0]])
+    assert results[0]["status"] == "unknown"
+    assert results[1]["status"] == "success"
+    results = pool.map_actions(per_target={("10.9.9.9", 5000): "WAIT"})
+    assert results[0]["status"] == "unknown"
+
+
+def test_actions_or_per_target(pool):
+    with pytest.raises(ValueError):
+        pool.map_actions()
+    with pytest.raises(ValueError):
+        pool.map_actions({"action_type": "WAIT"}, per_target={TARGETS[0]: "WAIT"})
+    with pytest.raises(ValueError):
+        pool.map([lambda controller: None])
@@ -0,0 +1,85 @@
+import pytest
+
+from env_controller.controller import PythonController
+from env_controller.protocol import (ActionRejected, action_response, action_to_commands, batch_delays,
+                                     batch_timeout, is_noop_action)
+
+
+def test_action_to_commands():
+    assert action_to_commands({"action_type": "CLICK", "x": 1, "y": 2}) == ["pyautogui.click(x=1, y=2)"]
+    assert action_to_commands({"action_type": "HOTKEY", "keys": ["ctrl", "c"]}) == ["pyautogui.hotkey('ctrl', 'c')"]
+    assert action_to_commands("WAIT") == []
+    assert is_noop_action({"action_type": "DONE"})
+
+
+def test_action_response():
+    assert action_response(404, "", "invalid") is None
+    assert action_response(200, '{"status": "success"}', "invalid") == {"status": "success"}
+    assert action_response(500, "boom", "invalid") == {"status": "error", "message": "boom"}
+    with pytest.raises(ActionRejected, match="bad key"):
+        action_response(400, '{"status": "error", "message": "bad key"}', "invalid")
+
+
+def test_batch_delays_and_timeout():
+    actions = [{}, {}, {}]
+    assert batch_delays(actions, 0.5) == [0.0, 0.5, 0.5]
+    assert batch_delays(actions, [0.1, 0.2, 0.3]) == [0.1, 0.2, 0.3]
+    assert batch_timeout(10, actions, 0.5) == 11
+    assert batch_timeout(10, actions, [1, 2, 3]) == 16
+
+
+class ScriptedController(PythonController):
+    """execute_action answers from a script instead of a server."""
+
+    def __init__(self, answers):
+        super().__init__("127.0.0.1", 1, retry_times=1)
+        self.answers = list(answers)
+
+    def execute_action(self, action, timeout=None):
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.mark.parametrize("stop_on_error, statuses", [
+    (True, ["success", "success", "error", "skipped"]),
+    (False, ["success", "success", "error", "error"]),
+])
+def test_one_by_one_fallback(stop_on_error, statuses):
+    controller = ScriptedController([{"status": "success"}, None, ValueError("bad"), None])
+    actions = [{"action_type": "CLICK"}, "WAIT", {"action_type": "CLICK"}, {"action_type": "CLICK"}]
+    result = controller._execute_actions_one_by_one(actions, 0.0, stop_on_error)
+    assert [entry["status"] for entry in result["results"]] == statuses
+    assert [entry["index"] for entry in result["results"]] == [0, 1, 2, 3]
+    assert result["status"] == "error"
+    controller.close()
+
+
+class LegacyController(PythonController):
+    """Without /action: execute_python_command answers like /execute from a script."""
+
+    def __init__(self, answers):
+        super().__init__("127.0.0.1", 1, use_native_actions=False, retry_times=1)
+        self.answers = list(answers)
+
+    def execute_python_command(self, command, timeout=None):
+        return self.answers.pop(0)
+
+
+def test_legacy_fallback_reports_failed_commands():
+    stderr = "Traceback (most recent call last):\n  ...\npyautogui.FailSafeException: fail-safe triggered\n"
+    controller = LegacyController([{"status": "success", "output": "", "error": stderr, "returncode": 1}])
+    result = controller.execute_action({"action_type": "CLICK", "x": 1, "y": 2})
+    assert result["status"] == "error"
+    assert result["returncode"] == 1
+    assert result["stderr"] == stderr
+    assert result["message"] == "pyautogui.FailSafeException: fail-safe triggered"
+    controller.close()
+
+
+def test_legacy_fallback_success():
+    controller = LegacyController([{"status": "success", "output": "", "error": "", "returncode": 0}] * 2)
+    assert controller.execute_action({"action_type": "SCROLL", "dx": 1, "dy": 2}) == {"status": "success"}
+    assert controller.answers == []
+    controller.close()
@@ -0,0 +1,61 @@
+import os
+import platform
+import stat
+
+import pytest
+
+from recording import (RecordingManager, RecordingOptionsError, RecordingUnavailableError,
+                       parse_recording_options)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, True), (True, True), (False, False), ("false", False), ("0", False), ("true", True), (1, True), (0, False),
+])
+def test_draw_mouse(value, expected):
+    options = {} if value is None else {"draw_mouse": value}
+    assert parse_recording_options(options)["draw_mouse"] is expected
+
+
+def test_draw_mouse_rejects_other_types():
+    with pytest.raises(RecordingOptionsError):
+        parse_recording_options({"draw_mouse": [1]})
+
+
+def test_missing_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+    manager = RecordingManager(str(tmp_path / "recordings"))
+    with pytest.raises(RecordingUnavailableError) as error:
+        manager.start("episode", parse_recording_options({}), (640, 480))
+    assert error.value.status_code == 503
+
+
+def test_ffmpeg_fails_to_start(tmp_path, monkeypatch):
+    # Found on the PATH, but not executable as a program.
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ffmpeg = bin_dir / "ffmpeg"
+    ffmpeg.write_bytes(b"\x00not a program")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir))
+    manager = RecordingManager(str(tmp_path / "recordings"))
+    with pytest.raises(RecordingUnavailableError):
+        manager.start("episode", parse_recording_options({}), (640, 480))
+    assert not (tmp_path / "recordings" / "episode").exists()
+
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="x11grab recordings are Linux only")
+def test_ffmpeg_runs_at_lower_priority(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ffmpeg = bin_dir / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nread line\n")
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    manager = RecordingManager(str(tmp_path / "recordings"))
+    manager.start("episode", parse_recording_options({}), (640, 480))
+    try:
+        pid = manager.get("episode").process.pid
+        assert os.getpriority(os.PRIO_PROCESS, pid) == min(19, os.getpriority(os.PRIO_PROCESS, 0) + 10)
+    finally:
+        manager.stop_all()
+    assert manager.status("episode")["state"] == "stopped"
@@ -0,0 +1,47 @@
+import pytest
+
+from env_controller.replay import ReplayEngine
+from env_controller.trajectory import TrajectoryReader, TrajectoryWriter, action_start
+
+
+class RecordingController:
+    def __init__(self):
+        self.delays = []
+
+    def execute_actions(self, actions, delay=0.0, stop_on_error=True):
+        self.delays.append(list(delay))
+        return {"status": "success", "results": [{"index": i, "status": "success"} for i in range(len(actions))]}
+
+
+def step_timing(action, wait, observe):
+    # the timing dict of PythonController.step and the server's /step
+    return {"action": action, "wait": wait, "observe": observe, "total": action + wait + observe}
+
+
+# Each step: its action starts 2 s after the previous step's action ended.
+STEPS = [
+    {"index": 0, "time": 100.0 + 0.5, "action": {"action_type": "CLICK"}, "timing": step_timing(0.1, 0.3, 0.1)},
+    {"index": 1, "time": 102.1 + 0.5, "action": {"action_type": "CLICK"}, "timing": step_timing(0.1, 0.3, 0.1)},
+    {"index": 2, "time": 104.2 + 1.0, "action": {"action_type": "CLICK"}, "timing": step_timing(0.2, 0.6, 0.2)},
+]
+
+
+def test_timed_replay_keeps_pauses_of_step_timings():
+    controller = RecordingController()
+    report = ReplayEngine(controller, mode="timed", max_batch_seconds=10).replay(STEPS)
+    assert report["status"] == "completed"
+    assert len(controller.delays) == 1
+    assert controller.delays[0][1:] == pytest.approx([2.0, 2.0])
+    assert report["recorded_elapsed"] == pytest.approx(5.2)
+
+
+def test_log_step_stores_the_action_start(tmp_path):
+    path = str(tmp_path / "episode")
+    with TrajectoryWriter(path) as writer:
+        writer.log_step({"action_type": "CLICK"}, started=50.0, timing={"action": 0.1})
+        writer.log_step({"action_type": "CLICK"}, timing=step_timing(0.1, 0.3, 0.1))
+    with TrajectoryReader(path) as reader:
+        first, second = reader.step(0), reader.step(1)
+    assert first["started"] == 50.0
+    assert second["started"] == pytest.approx(second["time"] - 0.5)
+    assert action_start(second) == second["started"]
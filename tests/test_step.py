@@ -0,0 +1,14 @@
+import pytest
+
+try:
+    import main
+except Exception as e:  # pyautogui needs a display on Linux
+    pytest.skip(f"server unavailable: {e}", allow_module_level=True)
+
+
+@pytest.mark.parametrize("wait", [True, False, "1", -1, [1]])
+def test_invalid_wait_is_rejected(wait):
+    client = main.app.test_client()
+    response = client.post("/step", json={"action": {"action_type": "WAIT"}, "observe": {"wait": wait}})
+    assert response.status_code == 400
+    assert "wait" in response.get_json()["message"]
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from env_controller.trajectory import FRAME_RECORD, STEP_RECORD, TrajectoryReader, TrajectoryWriter
+
+
+def write_steps(path, count, start=0):
+    with TrajectoryWriter(path) as writer:
+        for i in range(start, start + count):
+            writer.log_step({"action_type": "CLICK", "n": i}, f"frame-{i}".encode(), result={"status": "success"})
+
+
+def append(path, name, data):
+    with open(os.path.join(path, name), "ab") as f:
+        f.write(data)
+
+
+def read_back(path):
+    with TrajectoryReader(path) as reader:
+        return [(step["action"]["n"], bytes(reader.frame_bytes(step["frame"]))) for step in reader]
+
+
+@pytest.mark.parametrize("torn", [
+    [("frames.idx", b"\x01" * (FRAME_RECORD.size // 2))],
+    [("steps.jsonl", b'{"index":2,"act')],
+    [("steps.idx", b"\x05\x00\x00")],
+    [("frames.bin", b"fra"), ("frames.idx", b"\x02" * (FRAME_RECORD.size - 1)),
+     ("steps.jsonl", b'{"ind'), ("steps.idx", b"\x01")],
+])
+def test_reopen_after_partial_write(tmp_path, torn):
+    path = str(tmp_path / "episode")
+    write_steps(path, 2)
+    for name, data in torn:
+        append(path, name, data)
+
+    write_steps(path, 2, start=2)
+
+    assert read_back(path) == [(i, f"frame-{i}".encode()) for i in range(4)]
+    with TrajectoryWriter(path) as writer:
+        assert (writer.step_count, writer.frame_count) == (4, 4)
+        assert writer.add_frame(b"frame-1") == 1
+
+
+def test_frame_index_without_its_blob_is_dropped(tmp_path):
+    path = str(tmp_path / "episode")
+    write_steps(path, 2)
+    with open(os.path.join(path, "frames.bin"), "r+b") as f:
+        f.truncate(os.path.getsize(os.path.join(path, "frames.bin")) - 2)
+    # the step referring to the cut frame goes with it
+    write_steps(path, 1, start=1)
+    assert read_back(path) == [(0, b"frame-0"), (1, b"frame-1")]
+
+
+def test_step_without_its_frame_is_dropped(tmp_path):
+    path = str(tmp_path / "episode")
+    write_steps(path, 2)
+    # the step and its index made it to disk, the frame record did not
+    append(path, "frames.bin", b"frame-2")
+    append(path, "steps.idx", STEP_RECORD.pack(os.path.getsize(os.path.join(path, "steps.jsonl"))))
+    append(path, "steps.jsonl", b'{"index":2,"action":{"n":2},"frame":2}\n')
+    with TrajectoryReader(path) as reader:
+        assert len(reader) == 3
+
+    write_steps(path, 2, start=2)
+    assert read_back(path) == [(i, f"frame-{i}".encode()) for i in range(4)]
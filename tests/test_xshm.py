@@ -0,0 +1,77 @@
+import ctypes.util
+import os
+import shutil
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("Xvfb") is None or not ctypes.util.find_library("X11") or not ctypes.util.find_library("Xext"),
+    reason="needs Xvfb, libX11 and libXext",
+)
+
+
+@pytest.fixture(scope="module")
+def display():
+    read_fd, write_fd = os.pipe()
+    server = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write_fd), "-screen", "0", "640x480x24", "-nolisten", "tcp"],
+        pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as numbers:
+        number = numbers.readline().strip()
+    if not number:
+        server.kill()
+        pytest.skip("Xvfb did not start")
+    yield f":{number}".encode()
+    server.terminate()
+    server.wait(10)
+
+
+@pytest.fixture
+def grabber(display):
+    from xshm import XShmGrabber
+
+    grabber = XShmGrabber(display)
+    yield grabber
+    grabber.close()
+
+
+def test_grab(grabber):
+    assert grabber.root_size() == (640, 480)
+    assert grabber.grab_rgb().shape == (480, 640, 3)
+    assert grabber.grab_rgb((10, 20, 110, 70)).shape == (50, 100, 3)
+
+
+def test_reattaches_when_the_size_changes(grabber, monkeypatch):
+    monkeypatch.setattr(grabber, "root_size", lambda: (320, 240))
+    assert grabber.grab_rgb().shape == (240, 320, 3)
+    monkeypatch.undo()
+    assert grabber.grab_rgb().shape == (480, 640, 3)
+
+
+def test_x_errors_raise_instead_of_exiting(grabber, monkeypatch):
+    from xshm import XShmError
+
+    # An image larger than the root window fails XShmGetImage with BadMatch.
+    monkeypatch.setattr(grabber, "root_size", lambda: (800, 600))
+    with pytest.raises(XShmError):
+        grabber.grab()
+    monkeypatch.undo()
+    assert grabber.grab_rgb().shape == (480, 640, 3)
+
+
+def test_capture_falls_back_to_pyautogui(display, monkeypatch):
+    monkeypatch.setenv("DISPLAY", display.decode())
+    pytest.importorskip("pyautogui")
+    from capture import PyAutoGUICapture, XShmCapture
+    from xshm import XShmError
+
+    capture = XShmCapture()
+
+    def fail(bbox=None):
+        raise XShmError("gone")
+
+    monkeypatch.setattr(capture.grabber, "grab_rgb", fail)
+    assert capture.grab().size == (640, 480)
+    assert isinstance(capture.fallback, PyAutoGUICapture)